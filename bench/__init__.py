@@ -0,0 +1,3 @@
+"""
+Benchmark and test helpers for the CrowdStrike Correlation Rules Backup Tool
+"""
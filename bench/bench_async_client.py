@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Compare request throughput of the falconpy path and the asyncio client
+
+Starts the local stub Falcon server with artificial latency and fetches the
+same set of pages with:
+
+- falconpy, one page at a time (the original backup loop)
+- falconpy through the thread pool used by --concurrency
+- AsyncCorrelationRules with one pooled keep-alive session
+
+Usage:
+    python -m bench.bench_async_client --pages 200 --latency 0.02 --concurrency 16
+"""
+import argparse
+import asyncio
+import time
+
+from bench.fake_api import FakeCorrelationRules
+from bench.fake_server import FakeFalconServer
+
+def fetch_offsets(pages, limit):
+    return [page * limit for page in range(pages)]
+
+def run_falconpy_sequential(base_url, offsets, limit, concurrency):
+    from falconpy import CorrelationRules
+    client = CorrelationRules(client_id="bench", client_secret="secret", base_url=base_url)
+    for offset in offsets:
+        assert client.get_rules_combined(limit=limit, offset=offset)["status_code"] == 200
+
+def run_falconpy_threads(base_url, offsets, limit, concurrency):
+    from concurrent.futures import ThreadPoolExecutor
+    from falconpy import CorrelationRules
+    client = CorrelationRules(client_id="bench", client_secret="secret", base_url=base_url)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for response in executor.map(lambda o: client.get_rules_combined(limit=limit, offset=o), offsets):
+            assert response["status_code"] == 200
+
+def run_async(base_url, offsets, limit, concurrency):
+    from utils.async_client import AsyncCorrelationRules
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        async with AsyncCorrelationRules("bench", "secret", base_url=base_url,
+                                         max_connections=concurrency) as client:
+            async def fetch(offset):
+                async with semaphore:
+                    return await client.get_rules_combined(limit=limit, offset=offset)
+            for response in await asyncio.gather(*(fetch(offset) for offset in offsets)):
+                assert response["status_code"] == 200
+
+    asyncio.run(main())
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark falconpy vs the asyncio client")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10, help="Rules per page")
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub server latency per request (s)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    offsets = fetch_offsets(args.pages, args.limit)
+    api = FakeCorrelationRules(count=args.pages * args.limit)
+    runs = [
+        ("falconpy sequential", run_falconpy_sequential),
+        (f"falconpy threads x{args.concurrency}", run_falconpy_threads),
+        (f"asyncio x{args.concurrency}", run_async),
+    ]
+    print(f"{'client':<24} {'seconds':>8} {'req/s':>8} {'token requests':>15}")
+    for label, func in runs:
+        with FakeFalconServer(api, latency=args.latency) as server:
+            start = time.perf_counter()
+            func(server.base_url, offsets, args.limit, args.concurrency)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<24} {elapsed:>8.2f} {len(offsets) / elapsed:>8.1f} {server.token_requests:>15}")
+
+if __name__ == "__main__":
+    main()
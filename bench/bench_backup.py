@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark for backup_all_correlation_rules
+
+Runs a full backup against the in-process fake API at several tenant sizes,
+each in a fresh interpreter so peak RSS and counters start from zero, and
+records per run:
+
+    seconds         wall time of the backup call
+    peak_rss_mb     peak resident set size of the process
+    syscalls        read/write system calls (from /proc/self/io, Linux only),
+                    plus counted open/stat/mkdir/replace/fsync calls and
+                    voluntary/involuntary context switches
+    files           files written under the output directory and their bytes
+    timings         the phase breakdown the backup stores in its summary
+
+Results are printed as a table and written to a JSON file together with the
+environment (Python, platform, JSON backend, commit), so runs can be
+compared across changes without a live tenant.
+
+Usage:
+    python -m bench.bench_backup --counts 1000 10000 100000
+    python -m bench.bench_backup --counts 10000 --latency 0.05 --error-rate 0.01 --format jsonl
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def read_proc_io() -> dict:
+    """Read/write syscall and byte counters of this process, empty where /proc is unavailable"""
+    try:
+        with open("/proc/self/io", "r", encoding="ascii") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f if ":" in line)}
+    except OSError:
+        return {}
+
+def walk_output(path: str) -> dict:
+    """Count files and bytes written under path"""
+    files = size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+            files += 1
+    return {"count": files, "bytes": size}
+
+def run_once(count: int, args) -> dict:
+    """Run a single backup in this process and return its measurements"""
+    from bench.bench_writer import count_fs_calls
+    from bench.fake_api import FakeCorrelationRules
+    from tools.correlation_rules_backup import backup_all_correlation_rules
+
+    client = FakeCorrelationRules(count=count, lazy=True, latency=args.latency,
+                                  payload_size=args.payload_size, error_rate=args.error_rate, seed=args.seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        baseline = peak_rss_mb()
+        # Per-file console output would dominate the run time
+        logging.disable(logging.INFO)
+        io_before, usage_before = read_proc_io(), resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        with count_fs_calls() as fs_calls, contextlib.redirect_stdout(io.StringIO()):
+            summary = backup_all_correlation_rules(None, None, "us-2", "*", output_dir="backups",
+                                                   concurrency=args.concurrency, client=client,
+                                                   output_format=args.format)
+        elapsed = time.perf_counter() - start
+        io_after, usage_after = read_proc_io(), resource.getrusage(resource.RUSAGE_SELF)
+        files = walk_output(os.path.join(workdir, "backups"))
+
+    syscalls = {f"fs_{name}": calls for name, calls in sorted(fs_calls.items())}
+    for key in ("syscr", "syscw"):
+        if key in io_after:
+            syscalls[key] = io_after[key] - io_before[key]
+    syscalls["voluntary_context_switches"] = usage_after.ru_nvcsw - usage_before.ru_nvcsw
+    syscalls["involuntary_context_switches"] = usage_after.ru_nivcsw - usage_before.ru_nivcsw
+    return {
+        "rules": count,
+        "saved": len(summary["saved_rules"]) if summary else 0,
+        "seconds": round(elapsed, 3),
+        "rules_per_second": round(count / elapsed, 1) if elapsed else 0.0,
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "syscalls": syscalls,
+        "files": files,
+        "api": {"calls": len(client.calls), "injected_errors": client.injected_errors},
+        "timings": summary.get("timings") if summary else None,
+    }
+
+def environment() -> dict:
+    """Describe the machine and code a benchmark ran on"""
+    from utils.serializers import get_serializer
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "json_backend": get_serializer().name,
+        "commit": commit,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backup pipeline end to end against a fake API")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--format", default="files", choices=["files", "objects", "jsonl", "tar"])
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of simulated latency per API page")
+    parser.add_argument("--payload-size", type=int, default=0, help="Approximate JSON bytes per rule")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of page requests failing with 503")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default: bench/results/backup_<timestamp>.json)")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run_once(args.single, args)))
+        return
+
+    passthrough = ["--concurrency", str(args.concurrency), "--format", args.format, "--latency", str(args.latency),
+                   "--payload-size", str(args.payload_size), "--error-rate", str(args.error_rate),
+                   "--seed", str(args.seed)]
+    results = []
+    print(f"{'rules':>8} {'saved':>8} {'seconds':>8} {'rules/s':>9} {'peak MiB':>9} {'syscalls':>9} {'files':>8} {'MiB':>8}")
+    for count in args.counts:
+        output = subprocess.run(
+            [sys.executable, "-m", "bench.bench_backup", "--single", str(count)] + passthrough,
+            cwd=PROJECT_ROOT, check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        syscalls = result["syscalls"].get("syscr", 0) + result["syscalls"].get("syscw", 0)
+        print(f"{result['rules']:>8} {result['saved']:>8} {result['seconds']:>8} {result['rules_per_second']:>9} "
+              f"{result['peak_rss_mb']:>9} {syscalls:>9} {result['files']['count']:>8} "
+              f"{result['files']['bytes'] / (1024 * 1024):>8.1f}")
+
+    path = args.output or os.path.join(PROJECT_ROOT, "bench", "results",
+                                       f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    report = {
+        "benchmark": "backup",
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "parameters": {"concurrency": args.concurrency, "format": args.format, "latency": args.latency,
+                       "payload_size": args.payload_size, "error_rate": args.error_rate, "seed": args.seed},
+        "runs": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Peak memory benchmark for backup_all_correlation_rules
+
+Runs the backup against a lazily generated fake API at several tenant sizes,
+each in a fresh interpreter, and reports peak RSS. With the streaming
+pipeline the rule payloads never accumulate, so peak RSS should stay roughly
+flat as the rule count grows.
+
+Usage:
+    python -m bench.bench_memory --counts 1000 10000 100000
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_once(count: int, concurrency: int) -> dict:
+    """Run a single backup in this process and return its measurements"""
+    from bench.fake_api import FakeCorrelationRules
+    from tools.correlation_rules_backup import backup_all_correlation_rules
+
+    client = FakeCorrelationRules(count=count, lazy=True)
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        baseline = peak_rss_mb()
+        start = time.perf_counter()
+        # Per-file console output would dominate the run time
+        logging.disable(logging.INFO)
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = backup_all_correlation_rules(None, None, "us-2", "*", output_dir="backups",
+                                                   concurrency=concurrency, client=client)
+        elapsed = time.perf_counter() - start
+    return {
+        "rules": count,
+        "saved": len(summary["saved_rules"]) if summary else 0,
+        "seconds": round(elapsed, 2),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak RSS of the backup pipeline")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run_once(args.single, args.concurrency)))
+        return
+
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print(f"{'rules':>8} {'saved':>8} {'seconds':>8} {'baseline MiB':>13} {'peak MiB':>9}")
+    for count in args.counts:
+        output = subprocess.run(
+            [sys.executable, "-m", "bench.bench_memory", "--single", str(count),
+             "--concurrency", str(args.concurrency)],
+            cwd=project_root, check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{result['rules']:>8} {result['saved']:>8} {result['seconds']:>8} "
+              f"{result['baseline_rss_mb']:>13} {result['peak_rss_mb']:>9}")
+
+if __name__ == "__main__":
+    main()
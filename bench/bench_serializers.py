@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark the JSON serializer backends on correlation rule payloads
+
+Encodes single rules (the per-file layout) and full API pages of
+BACKUP_LIMIT rules (the page dumps) with every installed backend in compact
+and pretty mode.
+
+Usage:
+    python -m bench.bench_serializers --iterations 2000
+"""
+import argparse
+import time
+
+from bench.fake_api import FakeCorrelationRules
+from config import Config
+from utils.serializers import available_backends, get_serializer
+
+def time_encode(serializer, payload, iterations):
+    """Return (seconds per call, encoded size) for one payload"""
+    size = len(serializer.dumps(payload))
+    start = time.perf_counter()
+    for _ in range(iterations):
+        serializer.dumps(payload)
+    return (time.perf_counter() - start) / iterations, size
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON serializer backends")
+    parser.add_argument("--iterations", type=int, default=2000, help="Encodes per single-rule measurement")
+    args = parser.parse_args()
+
+    page = FakeCorrelationRules(count=Config.BACKUP_LIMIT).get_rules_combined(limit=Config.BACKUP_LIMIT)
+    payloads = {
+        "rule": (page["body"]["resources"][0], args.iterations),
+        f"page ({Config.BACKUP_LIMIT} rules)": (page, max(1, args.iterations // Config.BACKUP_LIMIT)),
+    }
+
+    print(f"{'payload':<18} {'backend':<8} {'mode':<8} {'us/op':>10} {'bytes':>9} {'MB/s':>8} {'vs json':>8}")
+    for label, (payload, iterations) in payloads.items():
+        for indent in (None, 2):
+            baseline = None
+            for backend in reversed(available_backends()):
+                serializer = get_serializer(backend, indent)
+                seconds, size = time_encode(serializer, payload, iterations)
+                baseline = baseline or seconds
+                mode = "pretty" if indent else "compact"
+                print(f"{label:<18} {serializer.name:<8} {mode:<8} {seconds * 1e6:>10.1f} {size:>9} "
+                      f"{size / seconds / 1e6:>8.1f} {baseline / seconds:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the per-file writer
+
+Compares the original save path (save_json with a makedirs per file, then
+os.path.exists and os.path.getsize to report the size) with FileWriter
+(directory created once, atomic temp file + rename, size taken from the
+write) for every fsync policy. File system calls are counted by wrapping
+the lowest level os functions (os.path.exists, os.path.getsize and
+os.makedirs all end up in os.stat / os.mkdir), so each count corresponds
+to one system call.
+
+Usage:
+    python -m bench.bench_writer --rules 10000
+"""
+import argparse
+import builtins
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from bench.fake_api import make_rule
+from utils.writers import FileWriter
+
+COUNTED = ["stat", "mkdir", "replace", "fsync", "sync"]
+
+@contextmanager
+def count_fs_calls():
+    """Count open() and selected os calls made while the block runs"""
+    counts = Counter()
+    originals = {name: getattr(os, name) for name in COUNTED if hasattr(os, name)}
+    original_open = builtins.open
+
+    def wrap(name, func):
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return func(*args, **kwargs)
+        return counted
+
+    for name, func in originals.items():
+        setattr(os, name, wrap(name, func))
+    builtins.open = wrap("open", original_open)
+    try:
+        yield counts
+    finally:
+        for name, func in originals.items():
+            setattr(os, name, func)
+        builtins.open = original_open
+
+def legacy_save(export_dir, rules):
+    """The original save path: makedirs + open/dump, then exists + getsize per file"""
+    for rule in rules:
+        path = os.path.join(export_dir, f"rule_{rule['id']}.json")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rule, f, indent=2)
+        if os.path.exists(path):
+            os.path.getsize(path)
+
+def writer_save(export_dir, rules, policy):
+    """The reworked FileWriter path"""
+    writer = FileWriter(export_dir, export_dir, logging.getLogger("bench"), fsync_policy=policy)
+    for rule in rules:
+        writer.write_rule(rule, f"rule_{rule['id']}.json", "")
+    writer.close("000000")
+
+def measure(label, func, rules):
+    with tempfile.TemporaryDirectory() as workdir:
+        export_dir = os.path.join(workdir, "snapshot")
+        os.makedirs(export_dir)
+        with count_fs_calls() as counts:
+            start = time.perf_counter()
+            func(export_dir, rules)
+            elapsed = time.perf_counter() - start
+        shutil.rmtree(export_dir)
+    total_calls = sum(counts.values())
+    print(f"{label:<22} {elapsed:>9.3f} {elapsed / len(rules) * 1e6:>10.1f} "
+          f"{total_calls / len(rules):>11.2f}  {dict(sorted(counts.items()))}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-file backup writer")
+    parser.add_argument("--rules", type=int, default=10000)
+    parser.add_argument("--policies", nargs="+", default=["none", "batch", "always"])
+    args = parser.parse_args()
+
+    logging.getLogger("bench").addHandler(logging.NullHandler())
+    logging.getLogger("bench").propagate = False
+    rules = [make_rule(i) for i in range(args.rules)]
+    print(f"{'path':<22} {'seconds':>9} {'us/file':>10} {'calls/file':>11}  calls")
+    measure("legacy save_json", legacy_save, rules)
+    for policy in args.policies:
+        measure(f"FileWriter ({policy})", lambda d, r, p=policy: writer_save(d, r, p), rules)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+In-process fake of the FalconPy CorrelationRules service class
+
+Returns canned pages shaped like the real combined rules endpoint so the
+backup engine can be exercised without a live tenant. Rules can also be
+created and updated, so restores can be tested the same way.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+_EPOCH = datetime(2025, 1, 1)
+
+def make_rule(index: int, payload_size: int = 0) -> Dict[str, Any]:
+    """
+    Build a realistic correlation rule payload
+
+    Args:
+        index: Rule number, which determines its ID
+        payload_size: Pad the rule's comment so its compact JSON is about
+            this many bytes (0 for no padding)
+    """
+    rule_id = f"{index:032x}"
+    rule = {
+        "id": rule_id,
+        "customer_id": "0123456789abcdef0123456789abcdef",
+        "user_id": "analyst@example.com",
+        "user_uuid": "00000000-0000-0000-0000-000000000001",
+        "name": f"Suspicious Activity Rule {index}",
+        "description": f"Detects suspicious activity pattern number {index}",
+        "status": "active" if index % 3 else "inactive",
+        "severity": 50,
+        # One rule created per minute, in ID order
+        "created_on": (_EPOCH + timedelta(minutes=index)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "last_updated_on": "2025-06-01T00:00:00Z",
+        "search": {
+            "filter": f"#event_simpleName=ProcessRollup2 | CommandLine=*pattern_{index}*",
+            "lookback": "1h",
+            "outcome": "detection",
+            "trigger_mode": "summary",
+            "use_ingest_time": True,
+        },
+        "operation": {
+            "schedule": {"definition": "@every 1h0m"},
+            "start_on": "2025-01-01T00:00:00Z",
+        },
+        "mitre_attack": [{"tactic_id": "TA0002", "technique_id": "T1059"}],
+        "notifications": [],
+        "state": "enabled",
+    }
+    if payload_size:
+        padding = payload_size - len(json.dumps(rule, separators=(",", ":"))) - len(',"comment":""')
+        if padding > 0:
+            rule["comment"] = "x" * padding
+    return rule
+
+_CLAUSE = re.compile(r"^(\w+):(>=|<=|>|<|!)?'([^']*)'$")
+
+def matches_filter(rule: Dict[str, Any], filter: Optional[str]) -> bool:
+    """
+    Evaluate a small subset of FQL against a rule
+
+    Supports "*" and clauses of the form field:'value', field:!'value' and
+    field:>='value' (also >, <, <=) joined with "+".
+    """
+    if not filter or filter.strip() == "*":
+        return True
+    for clause in filter.split("+"):
+        match = _CLAUSE.match(clause.strip())
+        if not match:
+            continue
+        field, operator, value = match.groups()
+        actual = str(rule.get(field, ""))
+        if operator is None and actual != value:
+            return False
+        if operator == "!" and actual == value:
+            return False
+        if operator == ">=" and not actual >= value:
+            return False
+        if operator == ">" and not actual > value:
+            return False
+        if operator == "<=" and not actual <= value:
+            return False
+        if operator == "<" and not actual < value:
+            return False
+    return True
+
+class FakeCorrelationRules:
+    """
+    Drop-in stand-in for falconpy.CorrelationRules
+
+    Args:
+        rules: Rules to serve (default: generated with make_rule)
+        count: Number of rules to generate when rules is not given
+        latency: Seconds to sleep on every call, simulating network latency
+        lazy: Generate rules per page instead of holding them all in memory
+        rate_limit: Requests allowed per rate_window; further requests get a
+            429 with Falcon's X-Ratelimit-* headers until the window resets
+        rate_window: Length of the rate limit window in seconds
+        failures: Status codes to return for an offset before it succeeds,
+            e.g. {20: [503, 429]}; the key "write" applies to create and
+            update calls
+        payload_size: Approximate JSON size of generated rules in bytes
+        error_rate: Fraction of requests answered with a transient 503
+        seed: Seed for error_rate, so runs are repeatable
+    """
+
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None, count: int = 0,
+                 latency: float = 0.0, lazy: bool = False, rate_limit: Optional[int] = None,
+                 rate_window: float = 1.0, failures: Optional[Dict[int, List[int]]] = None,
+                 payload_size: int = 0, error_rate: float = 0.0, seed: int = 0):
+        self.payload_size = payload_size
+        if rules is None and not lazy:
+            rules = [make_rule(i, payload_size) for i in range(count)]
+        self.rules = rules
+        self.total = len(rules) if rules is not None else count
+        self.latency = latency
+        self.calls: List[Dict[str, Any]] = []
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.failures = {offset: list(codes) for offset, codes in (failures or {}).items()}
+        self.throttled = 0
+        self.error_rate = error_rate
+        self.injected_errors = 0
+        self._random = random.Random(seed)
+        self.created = 0
+        self.updated = 0
+        self._window_start = time.time()
+        self._window_requests = 0
+        self._lock = threading.Lock()
+
+    def _matching(self, filter: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        """All rules matching filter, or None when every rule matches"""
+        if not filter or filter.strip() == "*":
+            return self.rules
+        rules = self.rules if self.rules is not None else [make_rule(i, self.payload_size) for i in range(self.total)]
+        return [rule for rule in rules if matches_filter(rule, filter)]
+
+    def _page(self, offset: int, limit: int, filter: Optional[str], sort: Optional[str] = None):
+        rules = self._matching(filter)
+        if sort:
+            # Falcon's "field|direction" sort syntax
+            field, _, direction = sort.partition("|")
+            rules = sorted(rules if rules is not None else [make_rule(i, self.payload_size) for i in range(self.total)],
+                           key=lambda rule: str(rule.get(field, "")), reverse=direction == "desc")
+        if rules is not None:
+            return rules[offset:offset + limit], len(rules)
+        return [make_rule(i, self.payload_size) for i in range(offset, min(offset + limit, self.total))], self.total
+
+    def _admit(self, offset: int):
+        """Apply injected failures and the rate limit; return (error response or None, headers)"""
+        with self._lock:
+            codes = self.failures.get(offset)
+            if not codes and self.error_rate and self._random.random() < self.error_rate:
+                self.injected_errors += 1
+                codes = [503]
+            if codes:
+                status = codes.pop(0)
+                return {"status_code": status, "headers": {},
+                        "body": {"meta": {}, "resources": [], "errors": [{"code": status, "message": "injected"}]}}, {}
+            if self.rate_limit is None:
+                return None, {}
+            now = time.time()
+            if now - self._window_start >= self.rate_window:
+                self._window_start, self._window_requests = now, 0
+            reset = self._window_start + self.rate_window
+            self._window_requests += 1
+            remaining = self.rate_limit - self._window_requests
+            headers = {"X-Ratelimit-Limit": str(self.rate_limit),
+                       "X-Ratelimit-Remaining": str(max(0, remaining))}
+            if remaining < 0:
+                self.throttled += 1
+                return {"status_code": 429,
+                        "headers": {**headers, "X-Ratelimit-Retryafter": str(reset)},
+                        "body": {"meta": {}, "resources": [],
+                                 "errors": [{"code": 429, "message": "API rate limit exceeded."}]}}, headers
+            return None, headers
+
+    def _response(self, resources: List[Any], offset: int, limit: int, total: int,
+                  headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        return {
+            "status_code": 200,
+            "headers": headers or {},
+            "body": {
+                "meta": {
+                    "query_time": self.latency,
+                    "pagination": {"offset": offset, "limit": limit, "total": total},
+                },
+                "resources": resources,
+                "errors": [],
+            },
+        }
+
+    def get_rules_combined(self, limit: int = 100, offset: int = 0, filter: Optional[str] = None,
+                           sort: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        """Return one page of rules in the falconpy response format"""
+        with self._lock:
+            self.calls.append({"method": "get_rules_combined", "limit": limit, "offset": offset,
+                               "filter": filter, "sort": sort})
+        if self.latency:
+            time.sleep(self.latency)
+        error, headers = self._admit(offset)
+        if error:
+            return error
+        resources, total = self._page(offset, limit, filter, sort)
+        return self._response(resources, offset, limit, total, headers)
+
+    def query_rules(self, limit: int = 100, offset: int = 0, filter: Optional[str] = None,
+                    **kwargs) -> Dict[str, Any]:
+        """Return one page of rule IDs in the falconpy response format"""
+        with self._lock:
+            self.calls.append({"method": "query_rules", "limit": limit, "offset": offset,
+                               "filter": filter})
+        if self.latency:
+            time.sleep(self.latency)
+        resources, total = self._page(offset, limit, filter)
+        return self._response([rule["id"] for rule in resources], offset, limit, total)
+
+    def _write_response(self, status: int, resources: List[Any], headers: Dict[str, str],
+                        errors: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        return {"status_code": status, "headers": headers,
+                "body": {"meta": {}, "resources": resources, "errors": errors or []}}
+
+    def create_rule(self, body: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        """Create one rule; the server assigns a new ID"""
+        with self._lock:
+            self.calls.append({"method": "create_rule", "name": (body or {}).get("name")})
+        if self.latency:
+            time.sleep(self.latency)
+        error, headers = self._admit("write")
+        if error:
+            return error
+        if not body or not body.get("name"):
+            return self._write_response(400, [], headers, [{"code": 400, "message": "name is required"}])
+        rule = {**body, "id": uuid.uuid4().hex, "last_updated_on": time.strftime("%Y-%m-%dT%H:%M:%SZ")}
+        with self._lock:
+            self.rules.append(rule)
+            self.total = len(self.rules)
+            self.created += 1
+        return self._write_response(200, [rule], headers)
+
+    def update_rule(self, body: Optional[List[Dict[str, Any]]] = None, **kwargs) -> Dict[str, Any]:
+        """Update a batch of rules by ID; unknown IDs fail the whole batch"""
+        body = body if isinstance(body, list) else [body or {}]
+        with self._lock:
+            self.calls.append({"method": "update_rule", "ids": [rule.get("id") for rule in body]})
+        if self.latency:
+            time.sleep(self.latency)
+        error, headers = self._admit("write")
+        if error:
+            return error
+        with self._lock:
+            positions = {rule["id"]: position for position, rule in enumerate(self.rules)}
+            missing = [rule.get("id") for rule in body if rule.get("id") not in positions]
+            if missing:
+                return self._write_response(404, [], headers,
+                                            [{"code": 404, "message": f"rule {rule_id} not found"} for rule_id in missing])
+            updated = []
+            for rule in body:
+                position = positions[rule["id"]]
+                self.rules[position] = {**self.rules[position], **rule,
+                                        "last_updated_on": time.strftime("%Y-%m-%dT%H:%M:%SZ")}
+                updated.append(self.rules[position])
+            self.updated += len(updated)
+        return self._write_response(200, updated, headers)
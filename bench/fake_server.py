@@ -0,0 +1,140 @@
+"""
+Local stub of the Falcon OAuth2 and correlation rules HTTP endpoints
+
+Serves the same canned pages as FakeCorrelationRules over real HTTP so
+both the falconpy client and the asyncio client can be exercised and
+benchmarked without a live tenant. HTTP/1.1 keep-alive is supported.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Union
+from urllib.parse import parse_qs, urlparse
+
+from bench.fake_api import FakeCorrelationRules
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Union[dict, str], headers: Optional[dict] = None):
+        # A string body is sent as an HTML page, like a gateway error from a proxy
+        html = isinstance(body, str)
+        payload = (body if html else json.dumps(body)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html" if html else "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write(self, method: str):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"null")
+        if self.headers.get("Authorization") != "Bearer stub-token":
+            self._send(401, {"errors": [{"code": 401, "message": "access denied"}]})
+            return
+        if stub.latency:
+            time.sleep(stub.latency)
+        with stub.lock:
+            stub.requests += 1
+        response = getattr(stub.api, method)(body=body)
+        self._send(response["status_code"], response["body"], response.get("headers"))
+
+    def do_PATCH(self):
+        if urlparse(self.path).path != "/correlation-rules/entities/rules/v1":
+            self._send(404, {"errors": [{"message": "not found"}]})
+            return
+        self._write("update_rule")
+
+    def do_POST(self):
+        if urlparse(self.path).path == "/correlation-rules/entities/rules/v1":
+            self._write("create_rule")
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        if urlparse(self.path).path != "/oauth2/token":
+            self._send(404, {"errors": [{"message": "not found"}]})
+            return
+        stub = self.server.stub
+        with stub.lock:
+            stub.token_requests += 1
+        if form.get("client_secret", [""])[0] != stub.client_secret:
+            self._send(401, {"errors": [{"code": 401, "message": "access denied"}]})
+            return
+        self._send(201, {"access_token": "stub-token", "expires_in": 1799, "token_type": "bearer"})
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if self.headers.get("Authorization") != "Bearer stub-token":
+            self._send(401, {"errors": [{"code": 401, "message": "access denied"}]})
+            return
+        if stub.latency:
+            time.sleep(stub.latency)
+        with stub.lock:
+            stub.requests += 1
+        limit = int(params.get("limit", 100))
+        offset = int(params.get("offset", 0))
+        if url.path == "/correlation-rules/combined/rules/v1":
+            response = stub.api.get_rules_combined(limit=limit, offset=offset, filter=params.get("filter"))
+        elif url.path == "/correlation-rules/queries/rules/v1":
+            response = stub.api.query_rules(limit=limit, offset=offset, filter=params.get("filter"))
+        else:
+            self._send(404, {"errors": [{"message": "not found"}]})
+            return
+        self._send(response["status_code"], response["body"], response.get("headers"))
+
+class FakeFalconServer:
+    """
+    Threaded HTTP server speaking the subset of the Falcon API used by the tool
+
+    Use as a context manager; base_url points at the running server.
+
+    Args:
+        api: FakeCorrelationRules instance providing the data (default: 0 rules)
+        latency: Seconds to sleep before answering each API request
+        client_secret: Secret the token endpoint accepts
+    """
+
+    def __init__(self, api: Optional[FakeCorrelationRules] = None, latency: float = 0.0,
+                 client_secret: str = "secret"):
+        self.api = api or FakeCorrelationRules()
+        self.latency = latency
+        self.client_secret = client_secret
+        self.requests = 0
+        self.token_requests = 0
+        self.lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
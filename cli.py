@@ -2,28 +2,30 @@
 """
 Command-line interface for the CrowdStrike Correlation Rules Backup Tool
 """
+import contextlib
+import json
 import os
 import sys
+from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
 import click
 from dotenv import load_dotenv
 from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn
-from rich.panel import Panel
-from rich.table import Table
 
 # Add the project root to the Python path
 sys.path.insert(0, str(Path(__file__).parent))
 
+# Load environment variables from .env file if it exists; Config reads them
+# when it is imported, so this has to come first
+load_dotenv()
+
 from config import Config
 from utils.logger import setup_logger, get_log_filename
-from utils.validators import validate_api_credentials, validate_directory_path, ValidationError
-from tools.correlation_rules_backup import backup_all_correlation_rules
 
-# Load environment variables from .env file if it exists
-load_dotenv()
+# Commands import falconpy, the backup engine and rich's widgets themselves,
+# so --help, status and setup start without them
 
 console = Console()
 
@@ -39,12 +41,43 @@ def cli():
 @click.option('--cloud-region', envvar='FALCON_CLOUDREGION', default='us-2', help='CrowdStrike Cloud Region')
 @click.option('--backup-filter', envvar='BACKUP_FILTER', default='*', help='Filter for correlation rules (default: *)')
 @click.option('--output-dir', default='correlation_rules_backups', help='Output directory for backups')
+@click.option('--concurrency', envvar='BACKUP_CONCURRENCY', default=Config.BACKUP_CONCURRENCY, type=click.IntRange(min=1),
+              help='Number of API pages fetched in parallel (default: 1)')
+@click.option('--shards', envvar='BACKUP_SHARDS', default=Config.BACKUP_SHARDS, type=click.IntRange(min=0),
+              help='Split the listing into this many created_on ranges paginated in parallel (0 for none)')
+@click.option('--format', 'output_format', envvar='BACKUP_FORMAT', default=Config.OUTPUT_FORMAT,
+              type=click.Choice(['files', 'objects', 'jsonl', 'tar']),
+              help='Output layout: one JSON file per rule, a deduplicated object store, '
+                   'a compressed JSON Lines archive or a tar archive')
+@click.option('--compression', envvar='ARCHIVE_COMPRESSION', default=Config.ARCHIVE_COMPRESSION,
+              type=click.Choice(['gzip', 'zstd']), help='Compression for the jsonl format (default: gzip)')
+@click.option('--fsync', 'fsync_policy', envvar='FSYNC_POLICY', default=Config.FSYNC_POLICY,
+              type=click.Choice(['none', 'batch', 'always']),
+              help='Durability of per-file writes: leave to the OS, sync in batches, or fsync every file')
+@click.option('--async-http', 'use_async', is_flag=True,
+              help='Fetch pages with the pooled asyncio HTTP client (requires aiohttp)')
+@click.option('--incremental', is_flag=True,
+              help='Only write new or changed rules; hard-link unchanged ones from the previous backup')
+@click.option('--resume', is_flag=True,
+              help="Continue today's interrupted backup from its last checkpoint instead of starting over")
+@click.option('--metrics-file', envvar='METRICS_FILE', type=click.Path(dir_okay=False),
+              help='Write run timings to this Prometheus textfile (e.g. for node_exporter)')
+@click.option('--profile', 'profile_mode', type=click.Choice(['cprofile', 'tracemalloc']),
+              help='Profile the backup and write the report next to the log file')
 @click.option('--log-file', help='Log file path (optional)')
 @click.option('--verbose', '-v', is_flag=True, help='Enable verbose logging')
 @click.option('--dry-run', is_flag=True, help='Validate credentials without performing backup')
-def backup(client_id: str, client_secret: str, cloud_region: str, backup_filter: str, output_dir: str, 
-           log_file: Optional[str], verbose: bool, dry_run: bool):
+def backup(client_id: str, client_secret: str, cloud_region: str, backup_filter: str, output_dir: str,
+           concurrency: int, shards: int, output_format: str, compression: str, fsync_policy: str,
+           use_async: bool, incremental: bool, resume: bool, metrics_file: Optional[str],
+           profile_mode: Optional[str], log_file: Optional[str], verbose: bool, dry_run: bool):
     """Backup all correlation rules from CrowdStrike Falcon"""
+    from rich.panel import Panel
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+    from rich.table import Table
+    from utils.validators import validate_api_credentials, validate_directory_path, ValidationError
+    from utils.checkpoint import checkpoint_path
+    from tools.correlation_rules_backup import backup_all_correlation_rules
     
     # Setup logging
     log_level = "DEBUG" if verbose else "INFO"
@@ -84,7 +117,10 @@ def backup(client_id: str, client_secret: str, cloud_region: str, backup_filter:
             task = progress.add_task("Validating API credentials...", total=None)
             
             try:
-                validate_api_credentials(client_id, client_secret)
+                # The backup reuses this client, its token and the probed first page
+                validate_api_credentials(client_id, client_secret, cloud_region, backup_filter,
+                                         use_async=use_async,
+                                         max_connections=max(concurrency, Config.ASYNC_MAX_CONNECTIONS))
                 progress.update(task, description="API credentials validated")
             except ValidationError as e:
                 progress.update(task, description="API credentials invalid")
@@ -100,6 +136,7 @@ def backup(client_id: str, client_secret: str, cloud_region: str, backup_filter:
         # Perform backup
         console.print(f"\n[bold]Starting backup to: {output_dir}[/bold]")
         console.print(f"[bold]Using filter: {backup_filter}[/bold]")
+        console.print(f"[bold]Concurrency: {concurrency}[/bold]")
         
         with Progress(
             SpinnerColumn(),
@@ -109,8 +146,28 @@ def backup(client_id: str, client_secret: str, cloud_region: str, backup_filter:
             task = progress.add_task("Backing up correlation rules...", total=None)
             
             # Call the backup function
-            backup_all_correlation_rules(client_id, client_secret, cloud_region, backup_filter)
+            today = datetime.now().strftime("%Y-%m-%d")
+            if profile_mode:
+                from utils.profiling import profile_run
+                profiler = profile_run(profile_mode, log_file)
+            else:
+                profiler = contextlib.nullcontext({})
+            with profiler as profile_files:
+                summary = backup_all_correlation_rules(client_id, client_secret, cloud_region, backup_filter,
+                                                       concurrency=concurrency, output_dir=output_dir,
+                                                       incremental=incremental, output_format=output_format,
+                                                       use_async=use_async, resume=resume,
+                                                       metrics_file=metrics_file or "", shards=shards,
+                                                       compression=compression, fsync_policy=fsync_policy)
+            for kind, path in profile_files.items():
+                logger.info(f"Profile {kind} written to {path}")
             
+            if summary is None:
+                progress.update(task, description="Backup failed")
+                console.print("[red]Error: Backup did not complete, see the log for details[/red]")
+                if os.path.exists(checkpoint_path(os.path.join(output_dir, today))):
+                    console.print("Run the same command with --resume to continue where it stopped")
+                sys.exit(1)
             progress.update(task, description="Backup completed successfully!")
         
         # Display summary
@@ -123,9 +180,21 @@ def backup(client_id: str, client_secret: str, cloud_region: str, backup_filter:
         summary_table.add_row("Log File", log_file)
         summary_table.add_row("Cloud Region", cloud_region)
         summary_table.add_row("Backup Filter", backup_filter)
-        summary_table.add_row("Status", "Completed")
+        summary_table.add_row("Concurrency", str(concurrency))
+        if shards > 1:
+            summary_table.add_row("Shards", str(shards))
+        summary_table.add_row("Mode", "Incremental" if incremental else "Full")
+        summary_table.add_row("Output Format", output_format)
+        incomplete = summary.get("sharding") and not summary["sharding"]["complete"]
+        summary_table.add_row("Status", "[yellow]Completed, listing incomplete[/yellow]" if incomplete else "Completed")
         
         console.print(summary_table)
+        if summary.get("timings"):
+            print_timings(summary["timings"])
+        if profile_files:
+            console.print(f"\n[bold]Profile ({profile_mode}):[/bold]")
+            for kind, path in profile_files.items():
+                console.print(f"  {kind}: {path}")
         
     except KeyboardInterrupt:
         console.print("\n[yellow]Backup interrupted by user[/yellow]")
@@ -135,9 +204,449 @@ def backup(client_id: str, client_secret: str, cloud_region: str, backup_filter:
         logger.error(f"Unexpected error: {str(e)}", exc_info=True)
         sys.exit(1)
 
+def print_timings(timings: dict):
+    """Print the per-phase timing breakdown of a backup run"""
+    from rich.table import Table
+    total = timings["total_seconds"] or 1.0
+    table = Table(show_header=True, header_style="bold magenta", title="Timing Breakdown")
+    table.add_column("Phase", style="cyan")
+    table.add_column("Seconds", justify="right")
+    table.add_column("Share", justify="right")
+    for name, phase in sorted(timings["phases"].items(), key=lambda item: -item[1]["seconds"]):
+        table.add_row(name, f"{phase['seconds']:.3f}", f"{phase['seconds'] / total:.0%}")
+    other = max(0.0, timings["total_seconds"] - sum(phase["seconds"] for phase in timings["phases"].values()))
+    table.add_row("other", f"{other:.3f}", f"{other / total:.0%}")
+    table.add_row("[bold]total[/bold]", f"{timings['total_seconds']:.3f}", "100%")
+    console.print(table)
+
+    latency = timings["page_latency"]
+    line = (f"{timings['rules_per_second']:.1f} rules/s, "
+            f"{timings['bytes_per_second'] / 1e6:.2f} MB/s ({timings['bytes_written']} bytes)")
+    if latency["count"]:
+        line += (f", page latency p50 {latency['p50'] * 1000:.0f} ms / "
+                 f"p95 {latency['p95'] * 1000:.0f} ms over {latency['count']} requests")
+    console.print(line)
+
+@cli.command('backup-all')
+@click.argument('tenants_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--concurrency', envvar='BACKUP_CONCURRENCY', default=8, type=click.IntRange(min=1),
+              help='API requests in flight across all tenants (default: 8)')
+@click.option('--parallel', type=click.IntRange(min=1),
+              help='Tenants backed up at the same time (default: as many as the concurrency allows)')
+@click.option('--format', 'output_format', envvar='BACKUP_FORMAT', default=Config.OUTPUT_FORMAT,
+              type=click.Choice(['files', 'objects', 'jsonl', 'tar']),
+              help='Output layout for tenants that do not set their own')
+@click.option('--incremental', is_flag=True, help='Incremental backups for tenants that do not set their own')
+@click.option('--summary-file', type=click.Path(dir_okay=False),
+              help='Where to write the consolidated summary (default: logs/backup_all_summary_<timestamp>.json)')
+def backup_all(tenants_file: str, concurrency: int, parallel: Optional[int], output_format: str,
+               incremental: bool, summary_file: Optional[str]):
+    """Back up every tenant listed in TENANTS_FILE in one process
+
+    Each tenant logs to its own file under logs/; one failing tenant does not
+    stop the others.
+    """
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+    from rich.table import Table
+    from tools.multi_tenant_backup import backup_tenants, load_tenants
+
+    try:
+        tenants = load_tenants(tenants_file)
+    except ValueError as e:
+        console.print(f"[red]Error: {str(e)}[/red]")
+        sys.exit(1)
+
+    console.print(f"[bold]Backing up {len(tenants)} tenants with concurrency {concurrency}[/bold]")
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        console=console
+    ) as progress:
+        task = progress.add_task("Backing up tenants...", total=None)
+        summary = backup_tenants(tenants, global_concurrency=concurrency, max_parallel=parallel,
+                                 output_format=output_format, incremental=incremental,
+                                 summary_file=summary_file)
+        progress.update(task, description="All tenants processed")
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Tenant", style="cyan")
+    table.add_column("Region")
+    table.add_column("Status")
+    table.add_column("Rules", justify="right")
+    table.add_column("Seconds", justify="right")
+    table.add_column("Rules/s", justify="right")
+    table.add_column("Details")
+    for result in summary["tenants"]:
+        ok = result["status"] == "ok"
+        table.add_row(
+            result["name"],
+            result["cloud_region"],
+            "[green]ok[/green]" if ok else "[red]failed[/red]",
+            str(result["rules"]),
+            f"{result['seconds']:.1f}",
+            f"{result['rules_per_second']:.1f}",
+            result["export_directory"] if ok else result["error"]
+        )
+    console.print(table)
+    console.print(f"{summary['tenants_succeeded']}/{summary['tenants_total']} tenants backed up, "
+                  f"{summary['total_rules']} rules in {summary['seconds']:.1f}s "
+                  f"({summary['rules_per_second']:.1f} rules/s)")
+    console.print(f"Summary: {summary['summary_file']}")
+    if summary["tenants_failed"]:
+        sys.exit(1)
+
+@cli.command()
+@click.argument('old')
+@click.argument('new')
+@click.option('--output-dir', default='correlation_rules_backups', help='Backup directory containing the date folders')
+@click.option('--format', 'output_format', default='text', type=click.Choice(['text', 'json']), help='Report format')
+def diff(old: str, new: str, output_dir: str, output_format: str):
+    """Show which rules changed between two backups
+
+    OLD and NEW are backup dates (YYYY-MM-DD) under --output-dir, or paths to
+    date folders. Rules are matched by ID, so renamed rules are reported as
+    renames rather than as an add and a delete.
+    """
+    from utils.snapshot_diff import diff_snapshots, format_diff_text
+
+    snapshot_dirs = [name if os.path.isdir(name) else os.path.join(output_dir, name) for name in (old, new)]
+    try:
+        result = diff_snapshots(*snapshot_dirs)
+    except (OSError, ValueError, KeyError) as e:
+        console.print(f"[red]Error: {str(e)}[/red]")
+        sys.exit(1)
+
+    if output_format == 'json':
+        click.echo(json.dumps(result, indent=2, ensure_ascii=False))
+    else:
+        click.echo(format_diff_text(result))
+
+@cli.command()
+@click.argument('text', required=False)
+@click.option('--output-dir', default='correlation_rules_backups', help='Backup directory containing the date folders')
+@click.option('--field', default='filter', type=click.Choice(['filter', 'name', 'description', 'any']),
+              help='Rule field TEXT is searched in (default: filter)')
+@click.option('--rule-id', help='Only versions of this rule')
+@click.option('--status', help='Only versions with this status, e.g. active')
+@click.option('--limit', default=50, type=click.IntRange(min=1), help='Maximum number of results (default: 50)')
+@click.option('--format', 'output_format', default='table', type=click.Choice(['table', 'json']), help='Output format')
+def search(text: Optional[str], output_dir: str, field: str, rule_id: Optional[str], status: Optional[str],
+           limit: int, output_format: str):
+    """Search every backup for rule versions matching TEXT
+
+    Each result is one version of a rule with the first and last backup date
+    it appeared in. Backups not indexed yet are added to the index first.
+    """
+    import sqlite3
+    from rich.table import Table
+    from utils.search_index import connect, search as search_index, update_index
+
+    if not os.path.isdir(output_dir):
+        console.print(f"[red]Error: Backup directory not found: {output_dir}[/red]")
+        sys.exit(1)
+    if not (text or rule_id or status):
+        console.print("[red]Error: Give TEXT, --rule-id or --status[/red]")
+        sys.exit(1)
+
+    try:
+        db = connect(output_dir)
+        try:
+            update_index(output_dir, db)
+            results = search_index(db, text, field=field, rule_id=rule_id, status=status, limit=limit)
+        finally:
+            db.close()
+    except sqlite3.Error as e:
+        console.print(f"[red]Error: Search index unavailable: {str(e)}[/red]")
+        sys.exit(1)
+
+    if output_format == 'json':
+        click.echo(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+    if not results:
+        console.print("No matching rules found")
+        return
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Rule ID", style="cyan")
+    table.add_column("Name")
+    table.add_column("Status")
+    table.add_column("First seen", no_wrap=True)
+    table.add_column("Last seen", no_wrap=True)
+    table.add_column("Backups", justify="right")
+    table.add_column("Filter")
+    for result in results:
+        table.add_row(
+            result["rule_id"],
+            result["rule_name"] or "",
+            result["status"] or "",
+            result["first_seen"],
+            result["last_seen"],
+            str(result["snapshots"]),
+            result["search_filter"] or ""
+        )
+    console.print(table)
+    console.print(f"{len(results)} rule versions")
+
+@cli.command()
+@click.argument('snapshot')
+@click.option('--client-id', envvar='FALCON_CLIENT_ID', help='CrowdStrike API Client ID')
+@click.option('--client-secret', envvar='FALCON_CLIENT_SECRET', help='CrowdStrike API Client Secret')
+@click.option('--cloud-region', envvar='FALCON_CLOUDREGION', default='us-2', help='CrowdStrike Cloud Region')
+@click.option('--output-dir', default='correlation_rules_backups', help='Backup directory containing the date folders')
+@click.option('--concurrency', envvar='BACKUP_CONCURRENCY', default=Config.BACKUP_CONCURRENCY, type=click.IntRange(min=1),
+              help='API requests in flight (default: 1)')
+@click.option('--batch-size', envvar='RESTORE_BATCH_SIZE', default=Config.RESTORE_BATCH_SIZE, type=click.IntRange(min=1),
+              help='Rules per update request (default: 50)')
+@click.option('--rule-id', 'rule_ids', multiple=True, help='Only restore this rule (repeatable)')
+@click.option('--customer-id', help='CID to create rules in (default: the CID recorded in the backup)')
+@click.option('--dry-run', is_flag=True, help='Only show what would be created and updated')
+@click.option('--format', 'output_format', default='table', type=click.Choice(['table', 'json']), help='Report format')
+def restore(snapshot: str, client_id: str, client_secret: str, cloud_region: str, output_dir: str,
+            concurrency: int, batch_size: int, rule_ids: tuple, customer_id: Optional[str], dry_run: bool,
+            output_format: str):
+    """Restore the rules of a backup into a tenant
+
+    SNAPSHOT is a backup date (YYYY-MM-DD) under --output-dir, or the path of
+    a date folder. Only rules that are missing or differ from the live tenant
+    are written; running the same restore again is safe.
+    """
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+    from rich.table import Table
+    from utils.validators import validate_api_credentials, ValidationError
+    from tools.restore_rules import restore_correlation_rules
+
+    if not client_id or not client_secret:
+        console.print("[red]Error: Missing API credentials[/red]")
+        console.print("Please provide FALCON_CLIENT_ID and FALCON_CLIENT_SECRET")
+        sys.exit(1)
+    snapshot_dir = snapshot if os.path.isdir(snapshot) else os.path.join(output_dir, snapshot)
+    if not os.path.isdir(snapshot_dir):
+        console.print(f"[red]Error: Snapshot not found: {snapshot_dir}[/red]")
+        sys.exit(1)
+
+    try:
+        # The restore reuses this client and its token
+        validate_api_credentials(client_id, client_secret, cloud_region)
+    except ValidationError as e:
+        console.print(f"[red]Error: {str(e)}[/red]")
+        sys.exit(1)
+
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        console=console
+    ) as progress:
+        task = progress.add_task("Restoring correlation rules...", total=None)
+        logger = setup_logger(name="correlation_rules_restore", log_file=get_log_filename("correlation_rules_restore"),
+                              console=False)
+        result = restore_correlation_rules(client_id, client_secret, cloud_region, snapshot_dir,
+                                           concurrency=concurrency, dry_run=dry_run, batch_size=batch_size,
+                                           rule_ids=list(rule_ids), customer_id=customer_id, logger=logger)
+        progress.update(task, description="Restore finished" if result else "Restore failed")
+
+    if result is None:
+        console.print("[red]Error: Restore did not start, see the log for details[/red]")
+        sys.exit(1)
+    if output_format == 'json':
+        click.echo(json.dumps(result, indent=2, ensure_ascii=False))
+    else:
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Action", style="cyan")
+        table.add_column("Rule ID")
+        table.add_column("Name")
+        table.add_column("Details")
+        for rule in result["created"]:
+            table.add_row("create", rule["rule_id"], rule["rule_name"] or "",
+                          f"new ID {rule['new_id']}" if rule["new_id"] else "")
+        for rule in result["updated"]:
+            table.add_row("update", rule["rule_id"], rule["rule_name"] or "",
+                          f"into {rule['target_id']}" if rule["target_id"] != rule["rule_id"] else "")
+        for rule in result["failed"]:
+            table.add_row(f"[red]{rule['action']} failed[/red]", rule["rule_id"], rule["rule_name"] or "", rule["error"])
+        if table.row_count:
+            console.print(table)
+        prefix = "Dry run: would create" if dry_run else "Created"
+        console.print(f"{prefix} {len(result['created'])}, {'update' if dry_run else 'updated'} "
+                      f"{len(result['updated'])}, {result['unchanged']} unchanged, "
+                      f"{len(result['failed'])} failed in {result['seconds']:.1f}s")
+    if result["failed"]:
+        sys.exit(1)
+
+@cli.command()
+@click.option('--client-id', envvar='FALCON_CLIENT_ID', help='CrowdStrike API Client ID')
+@click.option('--client-secret', envvar='FALCON_CLIENT_SECRET', help='CrowdStrike API Client Secret')
+@click.option('--cloud-region', envvar='FALCON_CLOUDREGION', default='us-2', help='CrowdStrike Cloud Region')
+@click.option('--backup-filter', envvar='BACKUP_FILTER', default='*', help='Filter for correlation rules (default: *)')
+@click.option('--output-dir', default='correlation_rules_backups', help='Output directory for backups')
+@click.option('--interval', envvar='WATCH_INTERVAL', default=Config.WATCH_INTERVAL, type=click.FloatRange(min=1),
+              help='Seconds between change polls (default: 60)')
+@click.option('--concurrency', envvar='BACKUP_CONCURRENCY', default=Config.BACKUP_CONCURRENCY, type=click.IntRange(min=1),
+              help='Number of pages fetched in parallel during backups')
+@click.option('--format', 'output_format', envvar='BACKUP_FORMAT', default=Config.OUTPUT_FORMAT,
+              type=click.Choice(['files', 'objects', 'jsonl', 'tar']), help='Output layout')
+@click.option('--host', envvar='WATCH_HOST', default=Config.WATCH_HOST, help='Address of the health endpoint')
+@click.option('--port', envvar='WATCH_PORT', default=Config.WATCH_PORT, type=click.IntRange(min=0),
+              help='Port of the /healthz and /metrics endpoint, 0 to disable (default: 9108)')
+@click.option('--metrics-file', envvar='METRICS_FILE', type=click.Path(dir_okay=False),
+              help='Also write each backup\'s timings to this Prometheus textfile')
+@click.option('--verbose', '-v', is_flag=True, help='Log every poll')
+def watch(client_id: str, client_secret: str, cloud_region: str, backup_filter: str, output_dir: str,
+          interval: float, concurrency: int, output_format: str, host: str, port: int,
+          metrics_file: Optional[str], verbose: bool):
+    """Keep running and back up whenever the rules change
+
+    Polls the tenant every --interval seconds with a single small request and
+    writes a snapshot only when rules were created, updated or deleted.
+    SIGTERM or Ctrl+C stops the watcher after any backup in progress.
+    """
+    import signal
+    import threading
+    from utils.validators import validate_api_credentials, ValidationError
+    from tools.watch_rules import RuleWatcher, start_health_server
+
+    if not client_id or not client_secret:
+        console.print("[red]Error: Missing API credentials[/red]")
+        console.print("Please provide FALCON_CLIENT_ID and FALCON_CLIENT_SECRET")
+        sys.exit(1)
+    try:
+        session = validate_api_credentials(client_id, client_secret, cloud_region, backup_filter)
+    except ValidationError as e:
+        console.print(f"[red]Error: {str(e)}[/red]")
+        sys.exit(1)
+    # Backups start hours later; they must not reuse the page fetched to validate
+    session.take_first_page(Config.BACKUP_LIMIT, backup_filter)
+
+    logger = setup_logger(name="correlation_rules_watch", level="DEBUG" if verbose else "INFO",
+                          log_file=get_log_filename("correlation_rules_watch"))
+    watcher = RuleWatcher(client_id, client_secret, cloud_region, backup_filter, output_dir=output_dir,
+                          interval=interval, output_format=output_format, concurrency=concurrency,
+                          client=session.client, logger=logger, metrics_file=metrics_file or "")
+    server = None
+    if port:
+        server = start_health_server(watcher, host, port)
+        logger.info(f"Health endpoint on http://{host}:{server.server_address[1]}/healthz and /metrics")
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}, stopping after the current poll")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    try:
+        watcher.run(stop)
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+
+@cli.command()
+@click.argument('archive', type=click.Path(exists=True))
+@click.argument('rule_id')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the rule to this file instead of stdout')
+def extract(archive: str, rule_id: str, output: Optional[str]):
+    """Extract a single rule from a backup archive or date folder
+
+    ARCHIVE may be a jsonl or tar archive file, or a date folder: folders
+    with a rule manifest are looked up through its index whatever their
+    output format, others must contain an archive.
+    """
+    from utils.archive import extract_rule, find_archive
+    from utils.manifest import ManifestReader, find_manifest
+    from utils.serializers import get_default_serializer
+    from utils.snapshot_diff import load_entry_rule
+
+    manifest_path = find_manifest(archive) if os.path.isdir(archive) else None
+    archive_path = manifest_path or (find_archive(archive) if os.path.isdir(archive) else archive)
+    if not archive_path:
+        console.print(f"[red]Error: No manifest or archive found in {archive}[/red]")
+        sys.exit(1)
+
+    try:
+        if manifest_path:
+            with ManifestReader(manifest_path) as manifest:
+                entry = manifest.get(rule_id)
+            rule = load_entry_rule(archive, entry) if entry else None
+        else:
+            rule = extract_rule(archive_path, rule_id)
+    except (OSError, ValueError, KeyError, ImportError) as e:
+        console.print(f"[red]Error reading {archive_path}: {str(e)}[/red]")
+        sys.exit(1)
+
+    if rule is None:
+        console.print(f"[red]Rule {rule_id} not found in {archive_path}[/red]")
+        sys.exit(1)
+
+    data = get_default_serializer().dumps(rule).decode('utf-8')
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(data)
+        console.print(f"[green]Rule {rule_id} written to {output}[/green]")
+    else:
+        click.echo(data)
+
+@cli.command()
+@click.argument('snapshot', default='all')
+@click.option('--output-dir', default='correlation_rules_backups', help='Backup directory containing the date folders')
+@click.option('--workers', envvar='VERIFY_WORKERS', default=Config.VERIFY_WORKERS, type=click.IntRange(min=1),
+              help='Files hashed in parallel (default: 16)')
+@click.option('--format', 'output_format', default='table', type=click.Choice(['table', 'json']), help='Report format')
+def verify(snapshot: str, output_dir: str, workers: int, output_format: str):
+    """Check backups against the file hashes recorded in their summaries
+
+    SNAPSHOT is a backup date (YYYY-MM-DD) under --output-dir, the path of a
+    date folder, or "all" (the default). Reports missing, corrupted and
+    extra files, and exits non-zero if any file is missing or corrupted.
+    """
+    from rich.table import Table
+    from tools.verify_backups import verify_backups
+
+    report = verify_backups(output_dir, snapshot, workers=workers)
+    if not report["snapshots"]:
+        console.print(f"[red]Error: No backups found for {snapshot} in {output_dir}[/red]")
+        sys.exit(1)
+
+    if output_format == 'json':
+        click.echo(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Snapshot", style="cyan", no_wrap=True)
+        table.add_column("Files", justify="right")
+        table.add_column("MB", justify="right")
+        table.add_column("Missing", justify="right")
+        table.add_column("Corrupted", justify="right")
+        table.add_column("Extra", justify="right")
+        table.add_column("Unhashed", justify="right")
+        table.add_column("Status")
+        for result in report["snapshots"]:
+            healthy = not (result["missing"] or result["corrupted"] or result["error"])
+            table.add_row(
+                result["snapshot"],
+                str(result["files"]),
+                f"{result['bytes'] / 1e6:.1f}",
+                str(len(result["missing"])),
+                str(len(result["corrupted"])),
+                str(len(result["extra"])),
+                str(result["unhashed"]),
+                "[green]OK[/green]" if healthy else f"[red]{result['error'] or 'FAILED'}[/red]"
+            )
+        console.print(table)
+        for result in report["snapshots"]:
+            for kind in ("missing", "corrupted", "extra"):
+                for name in result[kind]:
+                    color = "yellow" if kind == "extra" else "red"
+                    console.print(f"[{color}]{result['snapshot']}: {kind} {name}[/{color}]")
+        console.print(f"Verified {report['files']} files ({report['bytes'] / 1e6:.1f} MB) in "
+                      f"{report['seconds']:.1f}s ({report['bytes_per_second'] / 1e6:.1f} MB/s)")
+    if not report["ok"]:
+        sys.exit(1)
+
 @cli.command()
 def status():
     """Check the status of your configuration"""
+    from rich.panel import Panel
+    from rich.table import Table
     console.print(Panel.fit(
         "[bold blue]Configuration Status[/bold blue]",
         title="Status Check"
@@ -191,6 +700,7 @@ def status():
 @cli.command()
 def setup():
     """Interactive setup for the backup tool"""
+    from rich.panel import Panel
     console.print(Panel.fit(
         "[bold blue]Interactive Setup[/bold blue]\n"
         "This will help you configure the backup tool",
@@ -2,8 +2,26 @@
 Configuration settings for the CrowdStrike Correlation Rules Backup Tool
 """
 import os
+import warnings
 from typing import Optional
 
+def _env_number(name: str, default: str, convert):
+    """Read a numeric setting, falling back to its default when the value does not parse"""
+    value = os.getenv(name, default)
+    try:
+        return convert(value)
+    except ValueError:
+        warnings.warn(f"Ignoring invalid {name}={value!r}, using {default}")
+        return convert(default)
+
+def env_int(name: str, default: str) -> int:
+    """Integer setting from the environment"""
+    return _env_number(name, default, int)
+
+def env_float(name: str, default: str) -> float:
+    """Float setting from the environment"""
+    return _env_number(name, default, float)
+
 class Config:
     """Configuration class for the backup tool"""
     
@@ -16,14 +34,42 @@ class Config:
     BASE_EXPORT_DIR: str = "correlation_rules_backups"
     BACKUP_LIMIT: int = 500  # Number of rules per API call
     BACKUP_FILTER: str = os.getenv("BACKUP_FILTER", "*")  # Filter for correlation rules
+    BACKUP_CONCURRENCY: int = env_int("BACKUP_CONCURRENCY", "1")  # Pages fetched in parallel
+    BACKUP_SHARDS: int = env_int("BACKUP_SHARDS", "0")  # created_on ranges listed in parallel, 0 for none
+    OUTPUT_FORMAT: str = os.getenv("BACKUP_FORMAT", "files")  # files, objects, jsonl or tar
+    ARCHIVE_COMPRESSION: str = os.getenv("ARCHIVE_COMPRESSION", "gzip")  # gzip or zstd (jsonl format)
+    ARCHIVE_BLOCK_SIZE: int = 256 * 1024  # Uncompressed bytes per seekable jsonl block
+    ASYNC_MAX_CONNECTIONS: int = env_int("ASYNC_MAX_CONNECTIONS", "20")  # Async client pool size
+    PIPELINE_QUEUE_SIZE: int = 4  # Pages buffered between the fetch and write stages
+    MAX_RETRIES: int = env_int("MAX_RETRIES", "5")  # Retries per throttled or failed page
+    RETRY_BACKOFF_BASE: float = env_float("RETRY_BACKOFF_BASE", "0.5")  # First backoff delay (seconds)
+    RETRY_BACKOFF_MAX: float = 30.0  # Longest backoff delay (seconds)
+    RATE_LIMIT_PAUSE: float = 1.0  # Pause when the rate limit quota runs low (seconds)
+    RESTORE_BATCH_SIZE: int = env_int("RESTORE_BATCH_SIZE", "50")  # Rules per update request
+    TOKEN_CACHE_FILE: str = os.path.expanduser(
+        os.getenv("TOKEN_CACHE_FILE", "~/.cache/crowdstrike-backup/tokens.json")
+    )  # OAuth2 tokens reused across runs, empty to disable
     
     # Logging Configuration
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "[%(asctime)s] %(levelname)s: %(message)s"
     
     # File Configuration
-    JSON_INDENT: int = 2
+    JSON_INDENT: int = env_int("JSON_INDENT", "2")  # 0 for compact output
+    JSON_BACKEND: str = os.getenv("JSON_BACKEND", "auto")  # auto, orjson, msgspec or json
     ENCODING: str = "utf-8"
+    FSYNC_POLICY: str = os.getenv("FSYNC_POLICY", "none")  # none, batch or always
+    FSYNC_BATCH_SIZE: int = 1000  # Files written between syncs with the batch policy
+    METRICS_FILE: str = os.getenv("METRICS_FILE", "")  # Prometheus textfile for node_exporter, empty for none
+    OBJECT_GC_GRACE_HOURS: float = env_float("OBJECT_GC_GRACE_HOURS", "24")  # Hours unreferenced blobs are kept
+    SEARCH_INDEX: bool = os.getenv("SEARCH_INDEX", "1") != "0"  # Index every backup for `cli.py search`
+    VERIFY_WORKERS: int = env_int("VERIFY_WORKERS", "16")  # Files hashed in parallel by `cli.py verify`
+    VERIFY_BUFFER_SIZE: int = 1024 * 1024  # Bytes read per call when hashing files
+    
+    # Watch Mode Configuration
+    WATCH_INTERVAL: float = env_float("WATCH_INTERVAL", "60")  # Seconds between change polls
+    WATCH_HOST: str = os.getenv("WATCH_HOST", "127.0.0.1")  # Address of the /healthz and /metrics endpoint
+    WATCH_PORT: int = env_int("WATCH_PORT", "9108")  # Port of that endpoint, 0 to disable
     
     @classmethod
     def validate_credentials(cls) -> bool:
@@ -0,0 +1,1083 @@
+#!/usr/bin/env python3
+"""
+Backup engine tests for the CrowdStrike Correlation Rules Backup Tool
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from bench.fake_api import FakeCorrelationRules, make_rule
+from config import Config
+import tools.correlation_rules_backup as backup_module
+from tools.correlation_rules_backup import backup_all_correlation_rules
+
+@pytest.fixture(autouse=True)
+def isolated_workdir(tmp_path, monkeypatch):
+    """Run every test in a scratch directory with a small page size"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, "BACKUP_LIMIT", 10)
+    monkeypatch.setattr(Config, "RETRY_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(Config, "RATE_LIMIT_PAUSE", 0.05)
+    return tmp_path
+
+def freeze_date(monkeypatch, day):
+    """Make the backup engine believe it is running on the given day"""
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2025, 7, day, 12, 0, 0)
+    monkeypatch.setattr(backup_module, "datetime", FrozenDatetime)
+
+def run_backup(client, **kwargs):
+    """Run a backup against a fake client into ./backups"""
+    return backup_all_correlation_rules(None, None, "us-2", "*", output_dir="backups",
+                                        client=client, **kwargs)
+
+def test_sequential_backup_saves_every_rule():
+    client = FakeCorrelationRules(count=25)
+    summary = run_backup(client, concurrency=1)
+
+    assert summary["total_rules_found"] == 25
+    assert summary["total_api_responses"] == 3
+    assert [call["offset"] for call in client.calls] == [0, 10, 20]
+    for entry in summary["saved_rules"]:
+        path = os.path.join(summary["export_directory"], entry["filename"])
+        with open(path, encoding="utf-8") as f:
+            assert json.load(f)["id"] == entry["rule_id"]
+
+def test_concurrent_backup_matches_sequential_order():
+    rules = FakeCorrelationRules(count=95).rules
+    sequential = run_backup(FakeCorrelationRules(rules=rules), concurrency=1)
+    concurrent = run_backup(FakeCorrelationRules(rules=rules), concurrency=4)
+
+    assert [r["rule_id"] for r in concurrent["saved_rules"]] == \
+        [r["rule_id"] for r in sequential["saved_rules"]]
+    assert concurrent["total_api_responses"] == 10
+
+def test_concurrent_backup_overlaps_page_latency():
+    import threading
+
+    class OverlapClient(FakeCorrelationRules):
+        """Holds each page request until three are in flight (or a timeout passes)"""
+        in_flight = most_in_flight = 0
+        lock = threading.Lock()
+        overlapping = threading.Event()
+
+        def get_rules_combined(self, limit=100, offset=0, filter=None, **kwargs):
+            cls = OverlapClient
+            with cls.lock:
+                cls.in_flight += 1
+                cls.most_in_flight = max(cls.most_in_flight, cls.in_flight)
+                if cls.in_flight >= 3:
+                    cls.overlapping.set()
+            try:
+                if offset:
+                    # The first page is fetched alone; the rest are fetched together
+                    cls.overlapping.wait(timeout=2)
+                return super().get_rules_combined(limit=limit, offset=offset, filter=filter, **kwargs)
+            finally:
+                with cls.lock:
+                    cls.in_flight -= 1
+
+    summary = run_backup(OverlapClient(count=100), concurrency=10)
+
+    assert summary["total_rules_found"] == 100
+    assert OverlapClient.overlapping.is_set() and OverlapClient.most_in_flight >= 3
+
+def test_backup_stops_on_api_error():
+    class FailingClient(FakeCorrelationRules):
+        def get_rules_combined(self, limit=100, offset=0, filter=None, **kwargs):
+            response = super().get_rules_combined(limit=limit, offset=offset, filter=filter)
+            if offset >= 20:
+                response["status_code"] = 500
+            return response
+
+    assert run_backup(FailingClient(count=50), concurrency=3) is None
+
+def test_failed_pages_are_retried_in_place():
+    client = FakeCorrelationRules(count=95, failures={0: [502], 20: [503, 429], 50: [500]})
+    summary = run_backup(client, concurrency=4)
+
+    assert [r["rule_id"] for r in summary["saved_rules"]] == [r["id"] for r in client.rules]
+    assert summary["request_stats"]["retries"] == 4
+    # Only the failed offsets were requested again
+    offsets = [call["offset"] for call in client.calls]
+    assert offsets.count(20) == 3 and offsets.count(50) == 2 and offsets.count(30) == 1
+
+def test_scheduler_adapts_to_rate_limit():
+    client = FakeCorrelationRules(count=300, rate_limit=6, rate_window=0.1)
+    summary = run_backup(client, concurrency=8)
+
+    assert len(summary["saved_rules"]) == 300
+    stats = summary["request_stats"]
+    assert stats["retries"] == stats["throttled"] == client.throttled
+    # Pacing on X-Ratelimit-Remaining keeps most requests clear of 429s
+    assert client.throttled < 30 // 2
+    if client.throttled:
+        assert stats["min_concurrency"] < 8
+
+def test_resume_continues_after_interruption(monkeypatch):
+    from utils.checkpoint import CHECKPOINT_FILENAME
+
+    class CrashingClient(FakeCorrelationRules):
+        def get_rules_combined(self, limit=100, offset=0, filter=None, **kwargs):
+            if offset >= 60:
+                raise RuntimeError("connection lost")
+            return super().get_rules_combined(limit=limit, offset=offset, filter=filter)
+
+    freeze_date(monkeypatch, 1)
+    rules = [make_rule(i) for i in range(95)]
+    assert run_backup(CrashingClient(rules=rules), concurrency=3) is None
+    export_dir = os.path.join("backups", "2025-07-01")
+    assert os.path.exists(os.path.join(export_dir, CHECKPOINT_FILENAME))
+    first_file = os.path.join(export_dir, f"Suspicious_Activity_Rule_0_{rules[0]['id']}.json")
+    inode = os.stat(first_file).st_ino
+
+    client = FakeCorrelationRules(rules=rules)
+    summary = run_backup(client, concurrency=3, resume=True)
+
+    assert [r["rule_id"] for r in summary["saved_rules"]] == [r["id"] for r in rules]
+    assert summary["total_rules_found"] == 95
+    # Pages 0-40 were checkpointed as complete; the last of them is fetched
+    # again and the journaled rules of pages 40 and 50 are not rewritten
+    assert min(call["offset"] for call in client.calls) == summary["resumed_from_offset"] == 40
+    assert summary["rules_skipped"] == 60
+    assert os.stat(first_file).st_ino == inode
+    assert not os.path.exists(os.path.join(export_dir, CHECKPOINT_FILENAME))
+
+def test_writer_runs_while_pages_download():
+    class WatchingClient(FakeCorrelationRules):
+        first_page_written_before_last_fetch = False
+
+        def get_rules_combined(self, limit=100, offset=0, filter=None, **kwargs):
+            if offset == 90:
+                # The writer gets to the first page while this request is still outstanding
+                deadline = time.monotonic() + 2
+                while not WatchingClient.first_page_written_before_last_fetch and time.monotonic() < deadline:
+                    written = [name for root, _, files in os.walk("backups") for name in files
+                               if not name.startswith(("api_response", "_"))]
+                    WatchingClient.first_page_written_before_last_fetch = len(written) >= 10
+                    time.sleep(0.005)
+            return super().get_rules_combined(limit=limit, offset=offset, filter=filter)
+
+    summary = run_backup(WatchingClient(count=95, latency=0.01), concurrency=1)
+
+    assert summary["total_rules_found"] == 95
+    assert WatchingClient.first_page_written_before_last_fetch
+
+def test_incremental_backup_writes_only_changes(monkeypatch):
+    rules = [make_rule(i) for i in range(30)]
+    freeze_date(monkeypatch, 1)
+    first = run_backup(FakeCorrelationRules(rules=rules), incremental=True)
+    assert len(first["saved_rules"]) == 30
+
+    changed = dict(rules[3], description="Tuned", last_updated_on="2025-07-01T10:00:00Z")
+    added = dict(make_rule(30), last_updated_on="2025-07-01T11:00:00Z")
+    deleted_id = rules[5]["id"]
+    current = [changed if r is rules[3] else r for r in rules if r["id"] != deleted_id] + [added]
+
+    freeze_date(monkeypatch, 2)
+    client = FakeCorrelationRules(rules=current)
+    second = run_backup(client, incremental=True)
+
+    fetch_filters = {c["filter"] for c in client.calls if c["method"] == "get_rules_combined"}
+    assert fetch_filters == {"last_updated_on:>='2025-06-01T00:00:00Z'"}
+    assert second["rules_written"] == 2
+    assert second["rules_linked"] == 28
+    assert [d["rule_id"] for d in second["deleted_rules"]] == [deleted_id]
+    assert len(second["saved_rules"]) == 30
+
+    entries = {e["rule_id"]: e for e in second["saved_rules"]}
+    unchanged = os.path.join("backups", "2025-07-02", entries[rules[0]["id"]]["filename"])
+    assert os.stat(unchanged).st_nlink == 2
+    old_copy = os.path.join("backups", "2025-07-01", entries[rules[3]["id"]]["filename"])
+    with open(old_copy, encoding="utf-8") as f:
+        assert json.load(f)["description"] == rules[3]["description"]
+
+def test_incremental_backup_refetches_rules_it_cannot_link(monkeypatch):
+    from utils.state_index import load_state_index
+
+    rules = [make_rule(i) for i in range(30)]
+    rules[4]["last_updated_on"] = "2025-05-01T00:00:00Z"
+    freeze_date(monkeypatch, 1)
+    first = run_backup(FakeCorrelationRules(rules=rules), incremental=True)
+    lost = first["saved_rules"][4]
+    os.remove(os.path.join("backups", "2025-07-01", lost["filename"]))
+
+    freeze_date(monkeypatch, 2)
+    client = FakeCorrelationRules(rules=rules)
+    second = run_backup(client, incremental=True)
+
+    fetch_filters = {c["filter"] for c in client.calls if c["method"] == "get_rules_combined"}
+    assert "*" in fetch_filters
+    assert second["rules_written"] == 1
+    assert second["rules_linked"] == 29
+    assert lost["rule_id"] in {e["rule_id"] for e in second["saved_rules"]}
+    assert os.path.exists(os.path.join("backups", "2025-07-02", lost["filename"]))
+    state_index = load_state_index("backups")
+    assert state_index["snapshot_date"] == "2025-07-02"
+    assert state_index["rules"][lost["rule_id"]]["path"] == os.path.join("2025-07-02", lost["filename"])
+
+def test_incremental_backup_fails_when_unlinked_rules_cannot_be_fetched(monkeypatch):
+    from utils.state_index import load_state_index
+
+    rules = [make_rule(i) for i in range(30)]
+    rules[4]["last_updated_on"] = "2025-05-01T00:00:00Z"
+    freeze_date(monkeypatch, 1)
+    first = run_backup(FakeCorrelationRules(rules=rules), incremental=True)
+    os.remove(os.path.join("backups", "2025-07-01", first["saved_rules"][4]["filename"]))
+
+    class IncrementalOnlyClient(FakeCorrelationRules):
+        def get_rules_combined(self, limit=100, offset=0, filter=None, **kwargs):
+            if filter == "*":
+                return {"status_code": 403, "headers": {}, "body": {"resources": [], "errors": [{"code": 403}]}}
+            return super().get_rules_combined(limit=limit, offset=offset, filter=filter, **kwargs)
+
+    freeze_date(monkeypatch, 2)
+    assert run_backup(IncrementalOnlyClient(rules=rules), incremental=True) is None
+    assert load_state_index("backups")["snapshot_date"] == "2025-07-01"
+
+def test_object_store_backup_deduplicates_and_collects_garbage(monkeypatch):
+    from utils.object_store import collect_garbage, get_object_store
+
+    rules = [make_rule(i) for i in range(20)]
+    freeze_date(monkeypatch, 1)
+    first = run_backup(FakeCorrelationRules(rules=rules), output_format="objects")
+    freeze_date(monkeypatch, 2)
+    changed = [dict(rules[0], description="Tuned")] + rules[1:]
+    second = run_backup(FakeCorrelationRules(rules=changed), output_format="objects")
+
+    assert first["objects_written"] == 20
+    assert second["objects_written"] == 1
+    assert second["objects_reused"] == 19
+    assert sorted(os.listdir(os.path.join("backups", "2025-07-02"))) == \
+        sorted(["_backup_summary_120000.json", second["manifest"], second["rule_manifest"]])
+
+    store = get_object_store("backups")
+    with open(os.path.join("backups", "2025-07-02", second["manifest"]), encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert store.get(manifest["rules"][rules[0]["id"]])["description"] == "Tuned"
+
+    day_one = os.path.join("backups", "2025-07-01")
+    assert collect_garbage("backups", dry_run=True, grace_seconds=0)["deleted"] == 0
+    stats = collect_garbage("backups", exclude_dirs=[day_one], grace_seconds=0)
+    assert stats["deleted"] == 1
+    assert len(list(store.iter_digests())) == 20
+
+def test_object_garbage_collection_during_a_backup_keeps_its_blobs(monkeypatch):
+    from utils.object_store import collect_garbage, get_object_store
+    from utils.writers import ObjectStoreWriter
+
+    rules = [make_rule(i) for i in range(20)]
+    freeze_date(monkeypatch, 1)
+    first = run_backup(FakeCorrelationRules(rules=rules[:10]), output_format="objects")
+    # The first snapshot is deleted and its blobs are two days old
+    shutil.rmtree(first["export_directory"])
+    store = get_object_store("backups")
+    old = time.time() - 2 * 86400
+    for digest in store.iter_digests():
+        os.utime(store.object_path(digest), (old, old))
+
+    during = {}
+    close = ObjectStoreWriter.close
+
+    def collect_then_close(self, current_time):
+        # Cleanup runs after every rule is stored but before the manifest references them
+        during["unsafe"] = collect_garbage("backups", dry_run=True, grace_seconds=0)
+        during["stats"] = collect_garbage("backups")
+        return close(self, current_time)
+
+    monkeypatch.setattr(ObjectStoreWriter, "close", collect_then_close)
+    freeze_date(monkeypatch, 2)
+    second = run_backup(FakeCorrelationRules(rules=rules), output_format="objects")
+    assert second["objects_reused"] == 10 and during["unsafe"]["deleted"] == 20
+    assert during["stats"]["deleted"] == 0 and during["stats"]["recent"] == 20
+    assert all(store.exists(entry["object"]) for entry in second["saved_rules"])
+
+@pytest.mark.parametrize("output_format, compression", [
+    ("jsonl", "gzip"),
+    ("jsonl", "zstd"),
+    ("tar", None),
+])
+def test_archive_formats_support_single_rule_extraction(monkeypatch, output_format, compression):
+    from utils import archive
+
+    if compression == "zstd" and archive.zstandard is None:
+        pytest.skip("zstandard not installed")
+    monkeypatch.setattr(Config, "ARCHIVE_BLOCK_SIZE", 4096)
+    default_compression = Config.ARCHIVE_COMPRESSION
+    client = FakeCorrelationRules(count=45)
+    summary = run_backup(client, output_format=output_format, compression=compression)
+    assert Config.ARCHIVE_COMPRESSION == default_compression
+    if compression:
+        assert archive.load_archive_index(os.path.join(summary["export_directory"], summary["archive"]))[
+            "compression"] == compression
+
+    export_dir = summary["export_directory"]
+    archive_path = os.path.join(export_dir, summary["archive"])
+    assert archive.find_archive(export_dir) == archive_path
+    assert sorted(os.listdir(export_dir)) == sorted([
+        summary["archive"], summary["archive_index"], summary["rule_manifest"],
+        f"_backup_summary_{summary['backup_timestamp']}.json"
+    ])
+    for rule in (client.rules[0], client.rules[27], client.rules[44]):
+        assert archive.extract_rule(archive_path, rule["id"]) == rule
+    assert archive.extract_rule(archive_path, "missing") is None
+
+    if compression == "gzip":
+        import gzip
+        with gzip.open(archive_path, "rt", encoding="utf-8") as f:
+            assert [json.loads(line)["id"] for line in f] == [r["id"] for r in client.rules]
+
+def test_file_writer_replaces_files_without_touching_hard_links(tmp_path):
+    import logging
+    from utils.writers import FileWriter, get_writer
+
+    writer = get_writer("files", str(tmp_path), str(tmp_path), logging.getLogger("test"), fsync_policy="batch")
+    assert isinstance(writer, FileWriter) and writer.fsync_policy == "batch" and Config.FSYNC_POLICY == "none"
+    location = writer.write_rule({"id": "a", "name": "old"}, "a.json", "")
+    os.link(tmp_path / "a.json", tmp_path / "older_snapshot.json")
+    writer.write_rule({"id": "a", "name": "new"}, "a.json", "")
+    writer.close("000000")
+
+    older = (tmp_path / "older_snapshot.json").read_bytes()
+    assert location == {"filename": "a.json", "file_size": len(older),
+                        "file_sha256": hashlib.sha256(older).hexdigest()}
+    with open(tmp_path / "older_snapshot.json", encoding="utf-8") as f:
+        assert json.load(f)["name"] == "old"
+    with open(tmp_path / "a.json", encoding="utf-8") as f:
+        assert json.load(f)["name"] == "new"
+    assert not list(tmp_path.glob("*.tmp"))
+
+@pytest.mark.parametrize("indent", [0, 2, 4])
+def test_serializer_backends_agree_and_honor_json_indent(monkeypatch, indent):
+    from utils.serializers import available_backends, get_serializer
+
+    rule = make_rule(7)
+    rule["description"] = "Unicode é and \"quotes\"\nnewline"
+    for backend in available_backends():
+        encoded = get_serializer(backend, indent).dumps(rule)
+        assert json.loads(encoded) == rule
+        assert (b"\n" in encoded) == bool(indent)
+
+    monkeypatch.setattr(Config, "JSON_INDENT", indent)
+    summary = run_backup(FakeCorrelationRules(count=3))
+    path = os.path.join(summary["export_directory"], summary["saved_rules"][0]["filename"])
+    with open(path, "rb") as f:
+        assert (b"\n" in f.read()) == bool(indent)
+
+def test_async_client_backup_against_stub_server(monkeypatch):
+    pytest.importorskip("aiohttp")
+    from bench.fake_server import FakeFalconServer
+    from utils.async_client import AsyncCorrelationRules
+
+    rules = [make_rule(i) for i in range(55)]
+    with FakeFalconServer(FakeCorrelationRules(rules=rules), latency=0.01) as server:
+        client = AsyncCorrelationRules("id", "secret", base_url=server.base_url, max_connections=4)
+        freeze_date(monkeypatch, 1)
+        first = run_backup(client, concurrency=4)
+        freeze_date(monkeypatch, 2)
+        second = run_backup(client, concurrency=4, incremental=True)
+
+        assert [r["rule_id"] for r in first["saved_rules"]] == [r["id"] for r in rules]
+        assert second["rules_linked"] == 55
+        # One token for both runs, the incremental ID listing included
+        assert server.token_requests == 1
+
+        denied = AsyncCorrelationRules("id", "wrong", base_url=server.base_url)
+        assert run_backup(denied) is None
+
+def test_async_client_retries_gateway_error_pages(monkeypatch):
+    pytest.importorskip("aiohttp")
+    from bench.fake_server import FakeFalconServer
+    from utils.async_client import AsyncCorrelationRules
+
+    class GatewayErrorClient(FakeCorrelationRules):
+        failed = False
+
+        def get_rules_combined(self, limit=100, offset=0, filter=None, **kwargs):
+            if offset == 10 and not self.failed:
+                self.failed = True
+                return {"status_code": 502, "headers": {}, "body": "<html><body>502 Bad Gateway</body></html>"}
+            return super().get_rules_combined(limit=limit, offset=offset, filter=filter, **kwargs)
+
+    rules = [make_rule(i) for i in range(25)]
+    with FakeFalconServer(GatewayErrorClient(rules=rules)) as server:
+        client = AsyncCorrelationRules("id", "secret", base_url=server.base_url)
+        summary = run_backup(client, concurrency=2)
+
+    assert [r["rule_id"] for r in summary["saved_rules"]] == [r["id"] for r in rules]
+    assert summary["request_stats"]["retries"] == 1
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_validation_client_and_token_are_reused(tmp_path, monkeypatch, use_async):
+    if use_async:
+        pytest.importorskip("aiohttp")
+    from bench.fake_server import FakeFalconServer
+    from utils.client_factory import clear_sessions
+    from utils.validators import ValidationError, validate_api_credentials
+
+    cache_file = tmp_path / "cache" / "tokens.json"
+    monkeypatch.setattr(Config, "TOKEN_CACHE_FILE", str(cache_file))
+    rules = [make_rule(i) for i in range(25)]
+    with FakeFalconServer(FakeCorrelationRules(rules=rules)) as server:
+        clear_sessions()
+        validate_api_credentials("id", "secret", server.base_url, "*", use_async=use_async)
+        summary = backup_all_correlation_rules("id", "secret", server.base_url, "*",
+                                               output_dir="backups", use_async=use_async)
+        assert len(summary["saved_rules"]) == 25
+        # The probe doubles as page 0, so three pages cost three requests
+        assert server.token_requests == 1
+        assert server.requests == 3
+
+        # A later run in a new process starts from the cached token
+        clear_sessions()
+        validate_api_credentials("id", "secret", server.base_url, "*", use_async=use_async)
+        assert server.token_requests == 1
+
+        # A wrong secret never matches the cached token
+        clear_sessions()
+        with pytest.raises(ValidationError):
+            validate_api_credentials("id", "wrong", server.base_url, "*", use_async=use_async)
+        clear_sessions()
+
+    assert cache_file.stat().st_mode & 0o777 == 0o600
+    assert "secret" not in cache_file.read_text()
+
+def test_backup_tenants_isolates_failures_and_caps_concurrency(tmp_path, monkeypatch):
+    import threading
+    from tools.multi_tenant_backup import backup_tenants, load_tenants
+
+    tenants_file = tmp_path / "tenants.json"
+    tenants_file.write_text(json.dumps({
+        "defaults": {"output_root": "backups"},
+        "tenants": [
+            {"name": "acme", "client_id": "a", "client_secret": "s"},
+            {"name": "globex", "client_id_env": "GLOBEX_ID", "client_secret_env": "GLOBEX_SECRET",
+             "cloud_region": "eu-1"},
+            {"name": "broken", "client_id": "b", "client_secret": "s"},
+        ]
+    }))
+    monkeypatch.setenv("GLOBEX_ID", "g")
+    monkeypatch.setenv("GLOBEX_SECRET", "s")
+    tenants = load_tenants(str(tenants_file))
+    assert tenants[1]["client_id"] == "g" and tenants[1]["output_dir"] == os.path.join("backups", "globex")
+
+    lock = threading.Lock()
+    in_flight = {"now": 0, "max": 0}
+
+    class CountingClient(FakeCorrelationRules):
+        def get_rules_combined(self, limit=100, offset=0, filter=None, **kwargs):
+            with lock:
+                in_flight["now"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            try:
+                if self.total == 0:
+                    raise RuntimeError("tenant unavailable")
+                return super().get_rules_combined(limit=limit, offset=offset, filter=filter)
+            finally:
+                with lock:
+                    in_flight["now"] -= 1
+
+    sizes = {"acme": 60, "globex": 45, "broken": 0}
+    summary = backup_tenants(tenants, global_concurrency=4,
+                             make_client=lambda tenant: CountingClient(count=sizes[tenant["name"]], latency=0.01),
+                             summary_file=str(tmp_path / "summary.json"))
+
+    results = {result["name"]: result for result in summary["tenants"]}
+    assert results["acme"]["status"] == "ok" and results["acme"]["rules"] == 60
+    assert results["globex"]["status"] == "ok" and results["globex"]["rules"] == 45
+    assert results["broken"]["status"] == "failed"
+    assert summary["tenants_failed"] == 1 and summary["total_rules"] == 105
+    assert in_flight["max"] <= 4
+    assert os.path.exists(results["broken"]["log_file"])
+    assert json.loads((tmp_path / "summary.json").read_text())["tenants_total"] == 3
+
+@pytest.mark.parametrize("output_format", ["files", "jsonl"])
+def test_diff_snapshots_by_rule_id(monkeypatch, output_format):
+    from utils.snapshot_diff import diff_snapshots, format_diff_text
+
+    rules = [make_rule(i) for i in range(30)]
+    freeze_date(monkeypatch, 1)
+    run_backup(FakeCorrelationRules(rules=rules), output_format=output_format)
+
+    changed = [dict(rule) for rule in rules if rule["id"] != rules[3]["id"]]
+    changed[1]["name"] = "Renamed Rule"
+    changed[2]["search"] = {**changed[2]["search"], "filter": "#event_simpleName=DnsRequest"}
+    changed.append(make_rule(99))
+    freeze_date(monkeypatch, 2)
+    run_backup(FakeCorrelationRules(rules=changed), output_format=output_format)
+
+    if output_format == "files":
+        # Unchanged rules are compared by hash only and never opened
+        os.remove(os.path.join("backups", "2025-07-02", f"Suspicious_Activity_Rule_10_{rules[10]['id']}.json"))
+
+    result = diff_snapshots(os.path.join("backups", "2025-07-01"), os.path.join("backups", "2025-07-02"))
+    assert [r["rule_id"] for r in result["added"]] == [make_rule(99)["id"]]
+    assert [r["rule_id"] for r in result["removed"]] == [rules[3]["id"]]
+    assert [(r["old_name"], r["rule_name"]) for r in result["renamed"]] == [(rules[1]["name"], "Renamed Rule")]
+    assert result["modified"][0]["changes"] == [{
+        "path": "search.filter", "change": "changed",
+        "old": rules[2]["search"]["filter"], "new": "#event_simpleName=DnsRequest"
+    }]
+    assert result["unchanged"] == 27
+    assert "M 00000000000000000000000000000002" in format_diff_text(result)
+
+def test_search_index_tracks_rule_versions_across_backups(monkeypatch):
+    from utils.search_index import SEARCH_INDEX_FILENAME, connect, has_fts, search, update_index
+
+    rules = [make_rule(i) for i in range(20)]
+    changed = [dict(rule) for rule in rules]
+    changed[2]["search"] = {**changed[2]["search"], "filter": "#event_simpleName=DnsRequest"}
+    for day, snapshot in ((1, rules), (2, rules), (3, changed)):
+        freeze_date(monkeypatch, day)
+        run_backup(FakeCorrelationRules(rules=snapshot))
+
+    db = connect("backups")
+    versions = search(db, rule_id=rules[2]["id"])
+    assert [(v["first_seen"], v["last_seen"], v["snapshots"]) for v in versions] == [
+        ("2025-07-01", "2025-07-02", 2), ("2025-07-03", "2025-07-03", 1)
+    ]
+    assert [v["rule_id"] for v in search(db, "dnsrequest")] == [rules[2]["id"]]
+    # Too short for the trigram index: falls back to LIKE
+    assert len(search(db, "Dn")) == 1
+    assert len(search(db, "Rule 1", field="name")) == 11
+    db.close()
+
+    # Indexing is incremental and can be rebuilt from the summaries alone
+    assert update_index("backups") == 0
+    # Deleted snapshots are pruned, along with versions only they held
+    shutil.rmtree(os.path.join("backups", "2025-07-03"))
+    assert update_index("backups") == 0
+    db = connect("backups")
+    assert [v["last_seen"] for v in search(db, rule_id=rules[2]["id"])] == ["2025-07-02"]
+    assert search(db, "dnsrequest") == []
+    assert db.execute("SELECT COUNT(*) FROM rule_versions").fetchone()[0] == 20
+    if has_fts(db):
+        assert db.execute("SELECT COUNT(*) FROM rule_versions_fts WHERE rule_versions_fts MATCH 'DnsRequest'"
+                          ).fetchone()[0] == 0
+    db.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(os.path.join("backups", SEARCH_INDEX_FILENAME + suffix)):
+            os.remove(os.path.join("backups", SEARCH_INDEX_FILENAME + suffix))
+    assert update_index("backups") == 2
+
+def test_restore_creates_and_updates_only_differences(monkeypatch):
+    from tools.restore_rules import restore_correlation_rules
+
+    rules = [make_rule(i) for i in range(30)]
+    freeze_date(monkeypatch, 1)
+    run_backup(FakeCorrelationRules(rules=rules))
+
+    live = FakeCorrelationRules(rules=[dict(rule) for rule in rules[5:]], failures={"write": [429]})
+    for rule in live.rules[:3]:
+        rule["status"] = "inactive" if rule["status"] == "active" else "active"
+    snapshot_dir = os.path.join("backups", "2025-07-01")
+
+    def restore(**kwargs):
+        return restore_correlation_rules(None, None, "us-2", snapshot_dir, client=live, concurrency=4,
+                                         batch_size=2, **kwargs)
+
+    plan = restore(dry_run=True)
+    assert (len(plan["created"]), len(plan["updated"]), plan["unchanged"]) == (5, 3, 22)
+    assert live.created == live.updated == 0
+
+    result = restore()
+    assert not result["failed"]
+    assert sorted(rule["rule_id"] for rule in result["created"]) == [rule["id"] for rule in rules[:5]]
+    assert (live.created, live.updated) == (5, 3)
+    # Updates go out in batches; the throttled write was retried
+    assert len({tuple(call["ids"]) for call in live.calls if call["method"] == "update_rule"}) == 2
+    assert result["request_stats"]["throttled"] == 1
+
+    # Created rules got new IDs; the journal maps them so a re-run writes nothing
+    again = restore()
+    assert (len(again["created"]), len(again["updated"]), again["unchanged"]) == (0, 0, 30)
+    assert (live.created, live.updated) == (5, 3)
+
+def test_restore_retries_creates_only_when_throttled(monkeypatch):
+    from tools.restore_rules import restore_correlation_rules
+
+    rules = [make_rule(i) for i in range(3)]
+    freeze_date(monkeypatch, 1)
+    run_backup(FakeCorrelationRules(rules=rules))
+
+    class FlakyCreates(FakeCorrelationRules):
+        """Creates the first rule, then answers 502 as if the response was lost"""
+
+        def create_rule(self, body=None, **kwargs):
+            response = super().create_rule(body=body, **kwargs)
+            if body["name"] == rules[0]["name"] and response["status_code"] == 200:
+                return {"status_code": 502, "headers": {}, "body": {"meta": {}, "resources": [], "errors": []}}
+            return response
+
+    live = FlakyCreates(rules=[], failures={"write": [429]})
+    result = restore_correlation_rules(None, None, "us-2", os.path.join("backups", "2025-07-01"), client=live,
+                                       concurrency=1)
+    # The throttled create was retried; the one that failed after creating its rule was not
+    assert live.created == 3 and result["request_stats"]["throttled"] == 1
+    assert [rule["name"] for rule in live.rules].count(rules[0]["name"]) == 1
+    assert [failure["rule_id"] for failure in result["failed"]] == [rules[0]["id"]]
+    assert sorted(rule["rule_id"] for rule in result["created"]) == [rule["id"] for rule in rules[1:]]
+
+def test_cleanup_retention_policies_and_budgeted_parallel_delete(tmp_path):
+    from tools.cleanup_backups import (DELETING_PREFIX, apply_size_cap, delete_directories,
+                                       get_backup_directories, get_pending_deletions, select_retained)
+
+    root = tmp_path / "backups"
+    for day in range(120):
+        snapshot = root / (datetime(2025, 1, 1) + timedelta(days=day)).strftime("%Y-%m-%d")
+        snapshot.mkdir(parents=True)
+        for index in range(3):
+            (snapshot / f"rule_{index}.json").write_text("x" * 100)
+    backup_dirs = get_backup_directories(str(root))
+
+    kept = select_retained(backup_dirs, keep_daily=7, keep_weekly=4, keep_monthly=3)
+    names = sorted(os.path.basename(path) for path in kept)
+    # 7 daily (04-24..04-30), newest of each of 2 earlier weeks, newest of Feb and Mar
+    assert names == ["2025-02-28", "2025-03-31", "2025-04-13", "2025-04-20"] + \
+        [f"2025-04-{day}" for day in range(24, 31)]
+    assert apply_size_cap(backup_dirs, kept, 300 * 10, {path: 300 for _, path in backup_dirs}) == 3000
+    assert len(kept) == 10 and "2025-02-28" not in {os.path.basename(path) for path in kept}
+
+    to_delete = [path for _, path in backup_dirs if path not in kept]
+    stats = delete_directories(to_delete, workers=4, budget=200)
+    assert stats["files"] == 200 and stats["bytes"] == 200 * 100
+    assert len(stats["deleted"]) == 66 and len(get_pending_deletions(str(root))) == 44
+    assert len(get_backup_directories(str(root))) == 10
+
+    stats = delete_directories(get_pending_deletions(str(root)), workers=4)
+    assert stats["files"] == 330 - 200 and not stats["pending"]
+    assert not [name for name in os.listdir(root) if name.startswith(DELETING_PREFIX)]
+
+def test_backup_reports_phase_timings_and_prometheus_metrics():
+    summary = run_backup(FakeCorrelationRules(count=45, latency=0.01), concurrency=2,
+                         metrics_file=os.path.join("metrics", "backup.prom"))
+
+    timings = summary["timings"]
+    assert {"fetch", "serialize", "write", "checkpoint", "summary"} <= set(timings["phases"])
+    # Nested phases are not double counted
+    assert sum(phase["seconds"] for phase in timings["phases"].values()) <= timings["total_seconds"]
+    assert timings["page_latency"]["count"] == 5
+    assert 0.01 <= timings["page_latency"]["p50"] <= timings["page_latency"]["p95"]
+    assert timings["rules"] == 45 and timings["bytes_written"] > 0
+
+    with open(os.path.join(summary["export_directory"], f"_backup_summary_{summary['backup_timestamp']}.json"),
+              encoding="utf-8") as f:
+        assert json.load(f)["timings"] == timings
+    with open(os.path.join("metrics", "backup.prom"), encoding="utf-8") as f:
+        text = f.read()
+    assert 'crowdstrike_backup_phase_seconds{phase="write"}' in text
+    assert 'crowdstrike_backup_page_latency_seconds{quantile="0.95"}' in text
+    assert "crowdstrike_backup_rules 45" in text
+
+def test_backup_benchmark_records_results_file(tmp_path):
+    results_path = tmp_path / "results" / "bench.json"
+    subprocess.run([sys.executable, "-m", "bench.bench_backup", "--counts", "50", "--payload-size", "2000",
+                    "--error-rate", "0.5", "--seed", "1", "--output", str(results_path)],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=True, capture_output=True)
+
+    with open(results_path, encoding="utf-8") as f:
+        report = json.load(f)
+    run = report["runs"][0]
+    assert report["parameters"]["payload_size"] == 2000 and report["environment"]["python"]
+    assert run["saved"] == 50 and run["api"]["injected_errors"] > 0
+    # 50 rule files, one page response and the summary
+    assert run["files"]["count"] >= 52 and run["files"]["bytes"] > 50 * 2000
+    assert run["syscalls"]["fs_replace"] >= 50 and run["peak_rss_mb"] > 0
+    assert run["timings"]["rules"] == 50
+
+@pytest.mark.parametrize("mode", ["cprofile", "tracemalloc"])
+def test_profile_run_writes_artifacts_next_to_log(mode):
+    from utils.profiling import profile_run
+
+    with profile_run(mode, os.path.join("logs", "run.log")) as files:
+        run_backup(FakeCorrelationRules(count=30), concurrency=2)
+
+    assert all(path.startswith(os.path.join("logs", "run.")) and os.path.getsize(path) for path in files.values())
+    with open(files["collapsed"], encoding="utf-8") as f:
+        stacks = f.read().splitlines()
+    assert stacks and all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+    if mode == "cprofile":
+        import pstats
+        # Page fetches run in worker threads and are merged into the report
+        functions = {name for _, _, name in pstats.Stats(files["pstats"]).stats}
+        assert {"backup_all_correlation_rules", "get_rules_combined"} <= functions
+    else:
+        with open(files["allocations"], encoding="utf-8") as f:
+            assert f.readline().startswith("Peak traced memory")
+
+def test_cli_backup_exits_non_zero_when_the_backup_does_not_complete(monkeypatch):
+    from click.testing import CliRunner
+    import cli
+    import utils.validators
+    from utils.checkpoint import checkpoint_path
+
+    results = []
+    monkeypatch.setattr(utils.validators, "validate_api_credentials", lambda *args, **kwargs: None)
+    monkeypatch.setattr(backup_module, "backup_all_correlation_rules", lambda *args, **kwargs: results.pop(0))
+
+    def backup():
+        return CliRunner().invoke(cli.cli, ["backup", "--client-id", "id", "--client-secret", "secret",
+                                            "--output-dir", "backups", "--log-file", "backup.log"])
+
+    results.append(None)
+    result = backup()
+    assert result.exit_code == 1 and "did not complete" in result.output and "--resume" not in result.output
+
+    # A checkpoint left behind means the backup can be resumed
+    checkpoint = checkpoint_path(os.path.join("backups", datetime.now().strftime("%Y-%m-%d")))
+    os.makedirs(os.path.dirname(checkpoint), exist_ok=True)
+    open(checkpoint, "w").close()
+    results.append(None)
+    result = backup()
+    assert result.exit_code == 1 and "--resume" in result.output
+
+    results.append({"saved_rules": []})
+    assert backup().exit_code == 0
+
+def test_cli_import_stays_light():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import cli, utils"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+                            capture_output=True, text=True)
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "self [us]" not in line:
+            _, total, name = line.split("|")
+            cumulative[name.strip()] = int(total) / 1e6
+
+    # Importing falconpy and aiohttp alone takes longer than the rest of the CLI start-up
+    heavy = {"falconpy", "aiohttp", "requests", "tools.correlation_rules_backup", "utils.client_factory",
+             "rich.progress", "rich.table", "rich.panel", "sqlite3", "concurrent.futures"}
+    assert "cli" in cumulative and not heavy & set(cumulative)
+
+def test_cli_reads_dotenv_before_config_and_survives_bad_numbers():
+    root = os.path.dirname(os.path.abspath(__file__))
+    # Stand-in for a .env file: load_dotenv sets the variable when cli calls it
+    script = ("import os, dotenv\n"
+              "dotenv.load_dotenv = lambda *args, **kwargs: os.environ.update(VERIFY_WORKERS='3')\n"
+              "import cli\n"
+              "from config import Config\n"
+              "print(Config.VERIFY_WORKERS, Config.BACKUP_CONCURRENCY, Config.WATCH_INTERVAL)\n")
+    env = {**os.environ, "BACKUP_CONCURRENCY": "four", "WATCH_INTERVAL": "", "PYTHONWARNINGS": "default"}
+    env.pop("VERIFY_WORKERS", None)
+    result = subprocess.run([sys.executable, "-c", script], cwd=root, env=env, check=True,
+                            capture_output=True, text=True)
+    assert result.stdout.split() == ["3", "1", "60.0"]
+    assert "Ignoring invalid BACKUP_CONCURRENCY='four'" in result.stderr
+    assert subprocess.run([sys.executable, "cli.py", "--help"], cwd=root, env=env, capture_output=True).returncode == 0
+
+def test_watch_backs_up_only_on_change_and_serves_health():
+    import threading
+    import urllib.request
+    from tools.watch_rules import RuleWatcher, start_health_server
+
+    client = FakeCorrelationRules(count=25)
+    watcher = RuleWatcher(None, None, "us-2", "*", output_dir="backups", interval=0.01, concurrency=2,
+                          client=client)
+    assert watcher.run_once() is True  # first snapshot
+    client.calls.clear()
+    assert watcher.run_once() is False
+    # An unchanged tenant costs one request for a single rule
+    assert [(call["limit"], call["sort"]) for call in client.calls] == [(1, "last_updated_on|desc")]
+
+    client.rules[3] = {**client.rules[3], "name": "Renamed", "last_updated_on": "2025-07-01T00:00:00Z"}
+    assert watcher.run_once() is True
+    assert watcher.watermark == "2025-07-01T00:00:00Z"
+    del client.rules[0]
+    assert watcher.run_once() is True
+    assert watcher.rule_count == 24 and watcher.run_once() is False
+
+    # A restarted watcher picks up from the state index instead of backing up again
+    restarted = RuleWatcher(None, None, "us-2", "*", output_dir="backups", interval=0.01, client=client)
+    assert restarted.rule_count == 24 and restarted.run_once() is False
+
+    server = start_health_server(watcher, port=0)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{base}/healthz") as response:
+            health = json.load(response)
+        assert health["healthy"] and health["backups"] == 3 and health["polls"] == 5
+        with urllib.request.urlopen(f"{base}/metrics") as response:
+            metrics = response.read().decode("utf-8")
+        assert "crowdstrike_backup_watch_backups_total 3" in metrics
+        assert 'crowdstrike_backup_phase_seconds{phase="write"}' in metrics
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    stop = threading.Event()
+    loop = threading.Thread(target=watcher.run, args=(stop,))
+    loop.start()
+    stop.set()
+    loop.join(timeout=5)
+    assert not loop.is_alive()
+
+def test_watch_does_not_repeat_backups_without_a_watermark():
+    from tools.watch_rules import RuleWatcher
+
+    client = FakeCorrelationRules(rules=[])
+    watcher = RuleWatcher(None, None, "us-2", "*", output_dir="backups", interval=0.01, client=client)
+    assert watcher.run_once() is False  # empty tenant, nothing to back up
+    client.calls.clear()
+    assert watcher.run_once() is False
+    assert len(client.calls) == 1
+
+    # Rules without last_updated_on leave the snapshot without a watermark
+    client.rules.extend({key: value for key, value in make_rule(i).items() if key != "last_updated_on"}
+                        for i in range(5))
+    assert watcher.run_once() is True
+    assert watcher.watermark == "" and watcher.rule_count == 5
+    client.calls.clear()
+    assert watcher.run_once() is False
+    assert len(client.calls) == 1
+    client.rules.append(make_rule(5))
+    assert watcher.run_once() is True
+
+def test_sharded_listing_partitions_by_created_on_and_checks_total():
+    client = FakeCorrelationRules(count=95)
+    summary = run_backup(client, concurrency=3, shards=4)
+
+    assert len(summary["saved_rules"]) == 95
+    assert len({entry["rule_id"] for entry in summary["saved_rules"]}) == 95
+    sharding = summary["sharding"]
+    assert sharding["shards"] == 4 and sharding["expected_total"] == sharding["listed_rules"] == 95
+    assert sharding["filters"][0] == "created_on:<'2025-01-01T00:23:00Z'"
+    assert sharding["filters"][1] == "created_on:>='2025-01-01T00:23:00Z'+created_on:<'2025-01-01T00:47:00Z'"
+    # Shard pages are offset by the rules of the shards before them, so page files stay unique
+    pages = sorted(name for name in os.listdir(summary["export_directory"]) if name.startswith("api_response"))
+    assert len(pages) == 12 and "api_response_offset_23_" in " ".join(pages)
+    # Shards are never paginated deeper than their own size
+    deepest = max(call["offset"] for call in client.calls if call["limit"] == 10)
+    assert deepest < 30
+
+
+def test_duplicate_rules_from_shifted_pages_are_skipped():
+    class ShiftingRules(FakeCorrelationRules):
+        def get_rules_combined(self, limit=100, offset=0, filter=None, **kwargs):
+            response = super().get_rules_combined(limit=limit, offset=offset, filter=filter, **kwargs)
+            if offset == 0:
+                # A rule created while listing pushes every later rule one position down
+                self.rules.insert(0, make_rule(1000))
+            return response
+
+    summary = run_backup(ShiftingRules(count=25))
+    assert summary["duplicate_rules"] == 1
+    assert len(summary["saved_rules"]) == len({entry["rule_id"] for entry in summary["saved_rules"]}) == 25
+
+def test_compact_rule_records_use_less_memory_and_stream_the_same_summary(tmp_path):
+    import tracemalloc
+    from utils.rule_records import RuleRecords
+    from utils.serializers import get_default_serializer
+    from utils.writers import write_json_stream
+
+    # Entries as a resumed journal or a previous state index hands them over:
+    # parsed JSON, so repeated values are separate string objects
+    blob = json.dumps([{
+        "rule_id": f"{index:032x}",
+        "rule_name": f"Suspicious Activity Rule {index}",
+        "description": "Not found",
+        "search_outcome": "detection",
+        "search_filter": "#event_simpleName=ProcessRollup2 | CommandLine=*powershell*",
+        "created_on": "2025-01-01T00:00:00Z",
+        "last_updated_on": "2025-06-01T00:00:00Z",
+        "status": "active",
+        "filename": f"Suspicious_Activity_Rule_{index}.json",
+        "file_size": 1234,
+        "sha256": f"{index:064x}",
+        "timestamp": "120000",
+    } for index in range(20000)])
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        dicts = json.loads(blob)
+        dict_bytes = tracemalloc.get_traced_memory()[0] - before
+
+        before = tracemalloc.get_traced_memory()[0]
+        records = RuleRecords()
+        for entry in json.loads(blob):
+            records.append(entry)
+        record_bytes = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    assert record_bytes < dict_bytes * 0.6
+    assert records == dicts
+    assert records[0]["rule_id"] == dicts[0]["rule_id"] and records[0].get("object") is None
+    assert records[1]["search_filter"] is records[0]["search_filter"]
+
+    # The streamed summary is byte for byte what encoding it whole produces
+    serializer = get_default_serializer()
+    summary = {"backup_timestamp": "120000", "saved_rules": records, "request_stats": {"requests": 3}}
+    path = tmp_path / "summary.json"
+    size = write_json_stream(str(path), summary, serializer)
+    expected = serializer.dumps({**summary, "saved_rules": dicts})
+    assert path.read_bytes() == expected and size == len(expected)
+    compact = get_default_serializer(compact=True)
+    write_json_stream(str(path), summary, compact)
+    assert path.read_bytes() == compact.dumps({**summary, "saved_rules": dicts})
+
+def test_rule_manifest_index_finds_rules_without_parsing_the_summary(tmp_path):
+    from utils.manifest import PARTIAL_MANIFEST_NAME, ManifestReader, ManifestWriter, find_manifest, manifest_filename
+    from utils.snapshot_diff import find_summary, load_entry_rule
+
+    client = FakeCorrelationRules(count=45)
+    summary = run_backup(client)
+    export_dir = summary["export_directory"]
+    path = find_manifest(export_dir)
+    # Named after the run's timestamp, like the summary
+    current_time = os.path.basename(find_summary(export_dir))[len("_backup_summary_"):-len(".json")]
+    assert os.path.basename(path) == summary["rule_manifest"] == manifest_filename(current_time)
+    assert not os.path.exists(os.path.join(export_dir, PARTIAL_MANIFEST_NAME))
+    with ManifestReader(path) as manifest:
+        assert manifest.complete and len(manifest) == 45
+        assert manifest.header["filter"] == "*"
+        assert [entry["rule_id"] for entry in manifest.entries()] == [r["id"] for r in client.rules]
+        assert list(manifest.rule_ids()) == sorted(r["id"] for r in client.rules)
+        entry = manifest.get(client.rules[27]["id"])
+        assert entry == summary["saved_rules"][27]
+        assert load_entry_rule(export_dir, entry) == client.rules[27]
+        assert manifest.get("missing") is None
+
+    # Opening a 100k-rule manifest and looking a rule up touches only the trailer and a few index pages
+    (tmp_path / "big").mkdir()
+    writer = ManifestWriter(str(tmp_path / "big"), {"snapshot_date": "2025-07-01"})
+    for index in range(100000):
+        writer.add({"rule_id": f"{index * 7919 % 100003:032x}", "filename": f"rule_{index}.json"})
+    writer.finish("000000")
+    big = writer.path
+    assert big == find_manifest(str(tmp_path / "big")) and big.endswith("_rules_000000.jsonl")
+    with ManifestReader(big) as manifest:
+        found = [manifest.get(f"{index * 7919 % 100003:032x}") for index in (0, 4242, 99999)]
+        # Found by binary search of the index block, without scanning the entry lines
+        assert manifest.complete and manifest._scanned is None
+    assert [entry["filename"] for entry in found] == ["rule_0.json", "rule_4242.json", "rule_99999.json"]
+
+    # An interrupted backup leaves a manifest without an index; it is read by scanning
+    writer = ManifestWriter(str(tmp_path), {})
+    writer.add({"rule_id": "b", "filename": "b.json"})
+    writer.add({"rule_id": "a", "filename": "a.json"})
+    writer.close()
+    partial = writer.path
+    assert os.path.basename(partial) == PARTIAL_MANIFEST_NAME and find_manifest(str(tmp_path)) is None
+    with open(partial, "ab") as f:
+        f.write(b'{"rule_id": "c", "file')
+    with ManifestReader(partial) as manifest:
+        assert not manifest.complete and len(manifest) == 2
+        assert manifest.get("a")["filename"] == "a.json" and manifest.get("c") is None
+
+def test_snapshot_readers_use_the_rule_manifest_and_fall_back_to_the_summary(monkeypatch):
+    from tools.cleanup_backups import snapshot_size
+    from tools.restore_rules import load_snapshot_rules
+    from utils.search_index import SEARCH_INDEX_FILENAME, connect, search, update_index
+    from utils import snapshot_diff
+    from utils.snapshot_diff import Snapshot, diff_snapshots, find_summary
+
+    rules = [make_rule(i) for i in range(30)]
+    freeze_date(monkeypatch, 1)
+    run_backup(FakeCorrelationRules(rules=rules))
+    changed = [dict(rule) for rule in rules[1:]]
+    changed[0]["name"] = "Renamed Rule"
+    freeze_date(monkeypatch, 2)
+    run_backup(FakeCorrelationRules(rules=changed), output_format="jsonl")
+    old_dir, new_dir = os.path.join("backups", "2025-07-01"), os.path.join("backups", "2025-07-02")
+    expected_sizes = {path: snapshot_size(path) for path in (old_dir, new_dir)}
+
+    # With the saved rules gone from the summaries, everything is read from the manifests
+    for snapshot_dir in (old_dir, new_dir):
+        summary_path = find_summary(snapshot_dir)
+        with open(summary_path, "r", encoding="utf-8") as f:
+            summary = json.load(f)
+        summary["saved_rules"] = []
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f)
+    with Snapshot(new_dir) as snapshot:
+        assert snapshot.manifest_path and snapshot.output_format == "jsonl" and len(snapshot.rules) == 29
+        assert rules[0]["id"] not in snapshot.rules and snapshot.rules[rules[1]["id"]]["rule_name"] == "Renamed Rule"
+    result = diff_snapshots(old_dir, new_dir)
+    assert [r["rule_id"] for r in result["removed"]] == [rules[0]["id"]]
+    assert [r["rule_name"] for r in result["renamed"]] == ["Renamed Rule"] and result["unchanged"] == 28
+    # The jsonl archive's index is read once, not once per rule
+    index_loads = []
+    load_archive_index = snapshot_diff.load_archive_index
+    monkeypatch.setattr(snapshot_diff, "load_archive_index", lambda path: index_loads.append(path) or
+                        load_archive_index(path))
+    assert list(load_snapshot_rules(new_dir).values()) == changed
+    assert len(index_loads) == 1
+    os.remove(os.path.join("backups", SEARCH_INDEX_FILENAME))
+    assert update_index("backups") == 2
+    db = connect("backups")
+    assert len(search(db, "Renamed", field="name")) == 1
+    db.close()
+    # The summaries shrank, the manifests did not
+    assert all(expected_sizes[path] > snapshot_size(path) > 0 for path in (old_dir, new_dir))
+
+    # Backups without a rule manifest are read from their summary
+    freeze_date(monkeypatch, 3)
+    summary = run_backup(FakeCorrelationRules(rules=rules))
+    os.remove(os.path.join(summary["export_directory"], summary["rule_manifest"]))
+    with Snapshot(summary["export_directory"]) as snapshot:
+        assert snapshot.manifest_path is None and len(snapshot.rules) == 30
+    assert list(load_snapshot_rules(summary["export_directory"]).values()) == rules
+
+def test_verify_reports_missing_corrupted_and_extra_files(monkeypatch):
+    from utils.object_store import get_object_store
+    from tools.verify_backups import verify_backups
+
+    freeze_date(monkeypatch, 1)
+    summary = run_backup(FakeCorrelationRules(count=25))
+    freeze_date(monkeypatch, 2)
+    objects = run_backup(FakeCorrelationRules(count=25), output_format="objects")
+
+    report = verify_backups("backups", workers=4)
+    assert report["ok"] and [result["snapshot"] for result in report["snapshots"]] == ["2025-07-01", "2025-07-02"]
+    # 25 rules, 3 pages and the rule manifest; 25 blobs, the object manifest and the rule manifest
+    assert [result["files"] for result in report["snapshots"]] == [29, 27]
+    assert all(not result["unhashed"] for result in report["snapshots"])
+
+    export_dir = summary["export_directory"]
+    rule_file = os.path.join(export_dir, summary["saved_rules"][3]["filename"])
+    with open(rule_file, "ab") as f:
+        f.write(b" ")
+    os.remove(os.path.join(export_dir, summary["page_files"][1]["filename"]))
+    with open(os.path.join(export_dir, "stray.json"), "w", encoding="utf-8") as f:
+        f.write("{}")
+    blob = get_object_store("backups").object_path(objects["saved_rules"][0]["object"])
+    with open(blob, "r+b") as f:
+        f.write(b"[")
+
+    report = verify_backups("backups", workers=4)
+    day_one, day_two = report["snapshots"]
+    assert not report["ok"]
+    assert day_one["corrupted"] == [summary["saved_rules"][3]["filename"]]
+    assert day_one["missing"] == [summary["page_files"][1]["filename"]]
+    assert day_one["extra"] == ["stray.json"]
+    assert day_two["corrupted"] == [f"object {objects['saved_rules'][0]['object']}"]
+    assert verify_backups("backups", "2025-07-01")["snapshots"][0]["snapshot"] == "2025-07-01"
+
+def test_rules_deleted_mid_shard_end_only_that_shard_and_skip_the_state_index():
+    from utils.state_index import load_state_index
+
+    class DeletingRules(FakeCorrelationRules):
+        def get_rules_combined(self, limit=100, offset=0, filter=None, **kwargs):
+            if limit == 10 and offset == 10 and filter and filter.startswith("created_on:<") and len(self.rules) == 60:
+                # The second half of shard 0 is deleted before its second page is read
+                del self.rules[10:20]
+            return super().get_rules_combined(limit=limit, offset=offset, filter=filter, **kwargs)
+
+    summary = run_backup(DeletingRules(count=60), concurrency=1, shards=3)
+    sharding = summary["sharding"]
+    assert sharding["expected_total"] == 60 and sharding["listed_rules"] == 50
+    assert not sharding["complete"]
+    # Shards 1 and 2 were still listed in full
+    assert sorted(entry["rule_id"] for entry in summary["saved_rules"]) == \
+        [f"{index:032x}" for index in list(range(10)) + list(range(20, 60))]
+    assert load_state_index("backups") is None
@@ -3,11 +3,37 @@
 Backup cleanup utility for CrowdStrike Correlation Rules Backup Tool
 """
 import os
+import re
 import sys
+import time
 import argparse
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 
+# Add the project root to the Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import Config
+from utils.object_store import OBJECTS_DIRNAME, collect_garbage
+from utils.snapshot_diff import Snapshot, find_summary
+
+# Snapshots being deleted are renamed first, so they stop counting as backups
+# at once and a deletion cut short by --budget is finished by the next run
+DELETING_PREFIX = ".deleting-"
+DELETE_CHUNK_SIZE = 256  # Files unlinked per worker task
+
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)I?B?\s*$", re.IGNORECASE)
+
+def parse_size(value):
+    """Parse a size such as 500M, 20G or 1.5TB into bytes"""
+    match = _SIZE.match(value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size: {value}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** "BKMGT".index(unit.upper() or "B"))
+
 def parse_arguments():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(
@@ -18,131 +44,406 @@ Examples:
   %(prog)s --days 30 --dry-run    # Show what would be deleted
   %(prog)s --days 30              # Delete backups older than 30 days
   %(prog)s --days 7               # Delete backups older than 7 days
+  %(prog)s --keep-daily 7 --keep-weekly 4 --keep-monthly 12
+                                  # Grandfather-father-son retention
+  %(prog)s --keep-daily 30 --max-size 20G --budget 100000
+                                  # Also cap total size, delete at most 100000 files
+
+A backup is kept if any policy keeps it: --days keeps everything newer than
+the given age, --keep-daily/--keep-weekly/--keep-monthly keep the newest
+backup of each of the last N days/weeks/months that have one. --max-size then
+deletes the oldest kept backups (never the newest) until the rest fits.
+
+Blobs in the content-addressed object store (.objects) are reference
+counted against the remaining snapshot manifests and deleted once no
+snapshot uses them. Blobs written or reused within --object-grace-hours are
+kept, since a backup still running has not written its manifest yet.
         """
     )
-    
+
     parser.add_argument(
         '--days',
         type=int,
-        required=True,
         help='Delete backups older than this many days'
     )
-    
+
+    parser.add_argument(
+        '--keep-daily',
+        type=int,
+        default=0,
+        help='Keep the newest backup of each of the last N days'
+    )
+
+    parser.add_argument(
+        '--keep-weekly',
+        type=int,
+        default=0,
+        help='Keep the newest backup of each of the last N weeks'
+    )
+
+    parser.add_argument(
+        '--keep-monthly',
+        type=int,
+        default=0,
+        help='Keep the newest backup of each of the last N months'
+    )
+
+    parser.add_argument(
+        '--max-size',
+        type=parse_size,
+        help='Delete the oldest kept backups until the rest fit in this size (e.g. 20G)'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=8,
+        help='Files deleted in parallel (default: 8)'
+    )
+
+    parser.add_argument(
+        '--budget',
+        type=int,
+        help='Delete at most this many files in this run; the next run continues'
+    )
+
+    parser.add_argument(
+        '--object-grace-hours',
+        type=float,
+        default=Config.OBJECT_GC_GRACE_HOURS,
+        help=f'Keep unreferenced objects younger than this (default: {Config.OBJECT_GC_GRACE_HOURS:g})'
+    )
+
     parser.add_argument(
         '--dry-run',
         action='store_true',
         help='Show what would be deleted without actually deleting'
     )
-    
+
     parser.add_argument(
         '--backup-dir',
         default='correlation_rules_backups',
         help='Backup directory to clean (default: correlation_rules_backups)'
     )
-    
+
     return parser.parse_args()
 
-def is_valid_backup_directory(dir_path):
-    """Check if directory is a valid backup directory"""
+def parse_backup_date(dir_name):
+    """Return the date of a backup directory name (YYYY-MM-DD), or None"""
     try:
-        # Check if it's a date-based directory (YYYY-MM-DD format)
-        dir_name = os.path.basename(dir_path)
-        datetime.strptime(dir_name, '%Y-%m-%d')
-        return True
+        return datetime.strptime(dir_name, '%Y-%m-%d')
     except ValueError:
-        return False
+        return None
 
 def get_backup_directories(backup_root):
-    """Get list of backup directories"""
+    """
+    Get backup directories with their dates
+
+    Returns:
+        List of (date, path) tuples, oldest first
+    """
     if not os.path.exists(backup_root):
         print(f"Backup directory '{backup_root}' does not exist")
         return []
-    
+
     backup_dirs = []
-    for item in os.listdir(backup_root):
-        item_path = os.path.join(backup_root, item)
-        if os.path.isdir(item_path) and is_valid_backup_directory(item_path):
-            backup_dirs.append(item_path)
-    
-    return backup_dirs
-
-def should_delete_directory(dir_path, days_old):
-    """Check if directory should be deleted based on age"""
-    try:
-        dir_name = os.path.basename(dir_path)
-        backup_date = datetime.strptime(dir_name, '%Y-%m-%d')
-        cutoff_date = datetime.now() - timedelta(days=days_old)
-        
-        return backup_date < cutoff_date
-    except ValueError:
-        return False
+    with os.scandir(backup_root) as entries:
+        for entry in entries:
+            backup_date = parse_backup_date(entry.name)
+            if backup_date is not None and entry.is_dir():
+                backup_dirs.append((backup_date, entry.path))
+
+    return sorted(backup_dirs)
+
+def get_pending_deletions(backup_root):
+    """Directories left half-deleted by an earlier run"""
+    if not os.path.isdir(backup_root):
+        return []
+    return sorted(os.path.join(backup_root, name) for name in os.listdir(backup_root)
+                  if name.startswith(DELETING_PREFIX))
+
+def select_retained(backup_dirs, days=None, keep_daily=0, keep_weekly=0, keep_monthly=0, now=None):
+    """
+    Apply the retention policies
+
+    Args:
+        backup_dirs: (date, path) tuples as returned by get_backup_directories
+        days: Keep backups newer than this many days
+        keep_daily, keep_weekly, keep_monthly: Keep the newest backup of each
+            of the last N days, ISO weeks and months that have a backup
+        now: Reference time (default: now)
+
+    Returns:
+        Dictionary mapping each kept path to the policies that keep it
+    """
+    kept = {}
+    if days is not None:
+        cutoff = (now or datetime.now()) - timedelta(days=days)
+        for backup_date, path in backup_dirs:
+            if backup_date >= cutoff:
+                kept.setdefault(path, []).append(f"within {days} days")
+
+    periods = (
+        ("daily", keep_daily, lambda d: d.date()),
+        ("weekly", keep_weekly, lambda d: d.isocalendar()[:2]),
+        ("monthly", keep_monthly, lambda d: (d.year, d.month)),
+    )
+    for label, count, period_of in periods:
+        seen = set()
+        for backup_date, path in reversed(backup_dirs):
+            if len(seen) >= count:
+                break
+            period = period_of(backup_date)
+            if period not in seen:
+                seen.add(period)
+                kept.setdefault(path, []).append(label)
+    return kept
+
+def snapshot_size(dir_path):
+    """
+    Size of a snapshot directory
+
+    Read from the rule sizes recorded in the rule manifest or backup
+    summary when there is one, so large snapshots are not walked file by
+    file; rules hard-linked from older snapshots by incremental backups are
+    counted in full.
+    """
+    if find_summary(dir_path):
+        try:
+            with Snapshot(dir_path) as snapshot:
+                size = os.path.getsize(snapshot.summary_path)
+                if snapshot.manifest_path:
+                    size += os.path.getsize(snapshot.manifest_path)
+                archives = set()
+                for entry in snapshot.entries():
+                    if entry.get("filename"):
+                        size += entry.get("file_size") or 0
+                    elif entry.get("archive"):
+                        archives.add(entry["archive"])
+            for archive in archives:
+                size += os.path.getsize(os.path.join(dir_path, archive))
+            return size
+        except (OSError, ValueError):
+            pass
+    size = 0
+    for root, _, files in os.walk(dir_path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return size
+
+def apply_size_cap(backup_dirs, kept, max_size, sizes):
+    """Drop the oldest kept backups (never the newest) until the kept total fits in max_size"""
+    kept_paths = [path for _, path in backup_dirs if path in kept]
+    total = sum(sizes[path] for path in kept_paths)
+    for path in kept_paths[:-1]:
+        if total <= max_size:
+            break
+        total -= sizes[path]
+        del kept[path]
+    return total
+
+def _unlink_files(paths):
+    """Delete files, returning (files deleted, bytes reclaimed, errors)"""
+    deleted, reclaimed, errors = 0, 0, 0
+    for path in paths:
+        try:
+            stat = os.lstat(path)
+            os.unlink(path)
+        except FileNotFoundError:
+            continue
+        except OSError:
+            errors += 1
+            continue
+        deleted += 1
+        # Hard-linked rule files still used by another snapshot free nothing
+        if stat.st_nlink == 1:
+            reclaimed += stat.st_size
+    return deleted, reclaimed, errors
+
+def delete_directories(dir_paths, workers=8, budget=None):
+    """
+    Delete directories with a bounded pool of workers unlinking their files
+
+    Each directory is first renamed to .deleting-<name>. With a budget, at
+    most that many files are deleted; directories not finished stay renamed
+    and are completed by the next run.
+
+    Args:
+        dir_paths: Backup or pending (.deleting-) directories to delete
+        workers: Files deleted in parallel
+        budget: Maximum number of files to delete (default: no limit)
+
+    Returns:
+        Dictionary with lists of "deleted" and "pending" directories, and the
+        number of "files" deleted, "bytes" reclaimed and "errors"
+    """
+    stats = {"deleted": [], "pending": [], "files": 0, "bytes": 0, "errors": 0}
+    remaining = budget
+    jobs = []
+    for dir_path in dir_paths:
+        parent, name = os.path.split(dir_path)
+        if not name.startswith(DELETING_PREFIX):
+            target = os.path.join(parent, DELETING_PREFIX + name)
+            try:
+                os.rename(dir_path, target)
+            except OSError as e:
+                print(f"Error deleting {dir_path}: {e}")
+                stats["errors"] += 1
+                continue
+            dir_path = target
+        files = [os.path.join(root, name) for root, _, names in os.walk(dir_path) for name in names]
+        if remaining is not None:
+            complete = len(files) <= remaining
+            files = files[:remaining]
+            remaining -= len(files)
+        else:
+            complete = True
+        jobs.append((dir_path, files, complete))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = []
+        for dir_path, files, complete in jobs:
+            chunks = [executor.submit(_unlink_files, files[start:start + DELETE_CHUNK_SIZE])
+                      for start in range(0, len(files), DELETE_CHUNK_SIZE)]
+            futures.append((dir_path, complete, chunks))
+        for dir_path, complete, chunks in futures:
+            errors = 0
+            for chunk in chunks:
+                deleted, reclaimed, chunk_errors = chunk.result()
+                stats["files"] += deleted
+                stats["bytes"] += reclaimed
+                errors += chunk_errors
+            stats["errors"] += errors
+            original = os.path.join(os.path.dirname(dir_path),
+                                    os.path.basename(dir_path)[len(DELETING_PREFIX):])
+            if not complete or errors:
+                stats["pending"].append(original)
+                continue
+            try:
+                # Only empty directories are left
+                shutil.rmtree(dir_path)
+            except OSError as e:
+                print(f"Error deleting {original}: {e}")
+                stats["errors"] += 1
+                stats["pending"].append(original)
+                continue
+            print(f"Deleted: {original}")
+            stats["deleted"].append(original)
+    return stats
+
+def format_bytes(size):
+    """Format a byte count for display"""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
 
-def delete_directory(dir_path):
-    """Safely delete a directory and its contents"""
+def garbage_collect_objects(backup_root, deleted_dirs, dry_run, grace_hours=None):
+    """Reclaim object store blobs no longer referenced by any snapshot and older than the grace period"""
+    if not os.path.isdir(os.path.join(backup_root, OBJECTS_DIRNAME)):
+        return 0
+
+    print("\nCollecting unreferenced objects...")
     try:
-        import shutil
-        shutil.rmtree(dir_path)
-        print(f"Deleted: {dir_path}")
-        return True
-    except Exception as e:
-        print(f"Error deleting {dir_path}: {e}")
-        return False
+        # In a dry run the snapshots still exist, so ignore their manifests explicitly
+        stats = collect_garbage(backup_root, exclude_dirs=deleted_dirs, dry_run=dry_run,
+                                grace_seconds=None if grace_hours is None else grace_hours * 3600)
+    except ValueError as e:
+        print(f"Error: {e}")
+        print("Skipping object garbage collection")
+        return 0
+
+    action = "Would delete" if dry_run else "Deleted"
+    print(f"Objects referenced: {stats['referenced']} of {stats['total']}")
+    if stats["recent"]:
+        print(f"Kept {stats['recent']} unreferenced objects younger than the grace period")
+    print(f"{action} {stats['deleted']} unreferenced objects ({format_bytes(stats['bytes'])})")
+    return stats['bytes']
 
 def main():
     """Main cleanup function"""
     args = parse_arguments()
-    
-    if args.days < 1:
+    started = time.monotonic()
+
+    has_policy = args.keep_daily or args.keep_weekly or args.keep_monthly or args.max_size is not None
+    if args.days is None and not has_policy:
+        print("Error: Give --days and/or a retention policy (--keep-daily, --keep-weekly, --keep-monthly, --max-size)")
+        sys.exit(1)
+    if args.days is not None and args.days < 1:
         print("Error: Days must be at least 1")
         sys.exit(1)
-    
+    if min(args.keep_daily, args.keep_weekly, args.keep_monthly) < 0 or args.workers < 1 or \
+            (args.budget is not None and args.budget < 1):
+        print("Error: --keep-*, --workers and --budget must be positive")
+        sys.exit(1)
+
     backup_dirs = get_backup_directories(args.backup_dir)
-    
-    if not backup_dirs:
+    pending = [] if args.dry_run else get_pending_deletions(args.backup_dir)
+
+    if not backup_dirs and not pending:
         print(f"No backup directories found in '{args.backup_dir}'")
         return
-    
-    # Sort directories by date (oldest first)
-    backup_dirs.sort()
-    
-    to_delete = []
-    to_keep = []
-    
-    for dir_path in backup_dirs:
-        if should_delete_directory(dir_path, args.days):
-            to_delete.append(dir_path)
-        else:
-            to_keep.append(dir_path)
-    
+
+    # Sizes come from the backup summaries, without walking the snapshots
+    sizes = {path: snapshot_size(path) for _, path in backup_dirs}
+    kept = select_retained(backup_dirs, args.days, args.keep_daily, args.keep_weekly, args.keep_monthly)
+    if args.days is None and not (args.keep_daily or args.keep_weekly or args.keep_monthly):
+        # --max-size on its own keeps everything that fits
+        kept = {path: ["size"] for _, path in backup_dirs}
+    kept_size = sum(sizes[path] for path in kept)
+    if args.max_size is not None:
+        kept_size = apply_size_cap(backup_dirs, kept, args.max_size, sizes)
+
+    to_keep = [path for _, path in backup_dirs if path in kept]
+    to_delete = [path for _, path in backup_dirs if path not in kept]
+    delete_size = sum(sizes[path] for path in to_delete)
+
     print(f"Found {len(backup_dirs)} backup directories")
-    print(f"Will keep {len(to_keep)} directories")
-    print(f"Will delete {len(to_delete)} directories")
-    
-    if to_delete:
-        print("\nDirectories to be deleted:")
-        for dir_path in to_delete:
-            dir_name = os.path.basename(dir_path)
-            print(f"  - {dir_name}")
-        
+    print(f"Will keep {len(to_keep)} directories ({format_bytes(kept_size)})")
+    print(f"Will delete {len(to_delete)} directories ({format_bytes(delete_size)})")
+    if pending:
+        print(f"Finishing {len(pending)} directories left by an earlier run")
+
+    reclaimed = 0
+    if to_delete or pending:
+        if to_delete:
+            print("\nDirectories to be deleted:")
+            for dir_path in to_delete:
+                dir_name = os.path.basename(dir_path)
+                print(f"  - {dir_name} ({format_bytes(sizes[dir_path])})")
+
         if args.dry_run:
             print(f"\nDRY RUN: Would delete {len(to_delete)} directories")
             print("Run without --dry-run to actually delete")
         else:
-            print(f"\nDeleting {len(to_delete)} directories...")
-            deleted_count = 0
-            for dir_path in to_delete:
-                if delete_directory(dir_path):
-                    deleted_count += 1
-            
-            print(f"Successfully deleted {deleted_count} directories")
+            print(f"\nDeleting {len(to_delete) + len(pending)} directories with {args.workers} workers...")
+            stats = delete_directories(pending + to_delete, workers=args.workers, budget=args.budget)
+            reclaimed += stats["bytes"]
+            print(f"Successfully deleted {len(stats['deleted'])} directories "
+                  f"({stats['files']} files, {format_bytes(stats['bytes'])} reclaimed)")
+            if stats["pending"]:
+                print(f"{len(stats['pending'])} directories not finished "
+                      f"({'budget reached' if not stats['errors'] else str(stats['errors']) + ' errors'}); "
+                      "run again to continue")
     else:
         print("No directories need to be deleted")
-    
+
+    # Only snapshots that are actually gone may release their objects
+    reclaimed += garbage_collect_objects(args.backup_dir, to_delete if args.dry_run else [], args.dry_run,
+                                         args.object_grace_hours)
+
     if to_keep:
         print(f"\nKeeping {len(to_keep)} directories:")
         for dir_path in to_keep:
             dir_name = os.path.basename(dir_path)
-            print(f"  - {dir_name}")
+            print(f"  - {dir_name} ({', '.join(kept[dir_path])})")
+
+    if not args.dry_run:
+        print(f"\nReclaimed {format_bytes(reclaimed)} in {time.monotonic() - started:.1f}s")
 
 if __name__ == "__main__":
     main()
@@ -1,32 +1,537 @@
 import os
-import json
-from falconpy import CorrelationRules
+import asyncio
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from utils.logger import setup_logger, get_log_filename
+from utils.validators import sanitize_filename
+from utils.writers import save_json, get_writer
+from utils.async_client import is_async_client
+from utils.client_factory import get_session
+from utils.scheduler import RequestScheduler
+from utils.checkpoint import CheckpointJournal, load_checkpoint, is_durable
+from utils.search_index import index_snapshot
+from utils.manifest import ManifestWriter
+from utils.metrics import BackupMetrics, write_prometheus_textfile
+from utils.rule_records import RuleRecords
+from utils.sharding import SHARD_FIELD, shard_filters
+from utils.state_index import (
+    content_hash,
+    load_state_index,
+    save_state_index,
+    build_state_index,
+    build_incremental_filter,
+    link_or_copy
+)
 from config import Config
 
 # You can change this to your desired folder path
 BASE_EXPORT_DIR = "correlation_rules_backups" 
 
-def save_json(path, data):
-    """Save data to JSON file with proper error handling"""
+def get_pagination_total(response):
+    """Return meta.pagination.total from an API response, or None if absent"""
     try:
-        # Ensure the directory exists
-        directory = os.path.dirname(path)
-        if directory:
-            os.makedirs(directory, exist_ok=True)
+        total = response["body"]["meta"]["pagination"]["total"]
+    except (KeyError, TypeError):
+        return None
+    return total if isinstance(total, int) else None
+
+def fetch_remaining_pages(rules, limit, total, filter, concurrency, scheduler=None, start=None):
+    """
+    Fetch every page from start (default: the second page) with a bounded worker pool
+    
+    At most concurrency * 2 requests are queued at any time, so only a
+    small window of responses is held in memory regardless of the total.
+    Each request goes through the scheduler, which may run fewer than
+    concurrency at once while the API is throttling and retries a failed
+    offset without touching the pages around it.
+    
+    Args:
+        rules: CorrelationRules client (or any object with get_rules_combined)
+        limit (int): Page size
+        total (int): Total number of rules reported by the first page
+        filter (str): FQL filter passed to every request
+        concurrency (int): Maximum number of requests in flight
+        scheduler (RequestScheduler): Pacing and retry policy (default: a new one)
+        start (int): First offset to fetch (default: limit)
         
-        # Save the JSON file
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
+    Yields:
+        (offset, response) tuples in ascending offset order
+    """
+    scheduler = scheduler or RequestScheduler(concurrency)
+
+    def fetch(offset):
+        return scheduler.call(lambda: rules.get_rules_combined(limit=limit, offset=offset, filter=filter),
+                              f"offset {offset}")
+
+    offsets = range(limit if start is None else start, total, limit)
+    yield from fetch_ordered(((offset, lambda offset=offset: fetch(offset)) for offset in offsets), concurrency)
+
+def fetch_ordered(jobs, concurrency):
+    """
+    Run (key, request) jobs on a bounded worker pool and yield results in job order
+    
+    At most concurrency * 2 jobs are submitted ahead of the consumer.
+    
+    Args:
+        jobs: Iterable of (key, zero-argument callable)
+        concurrency (int): Maximum number of jobs running at once
         
-        print(f"Successfully saved: {path}")
-        return True
-    except Exception as e:
-        print(f"Error saving {path}: {str(e)}")
+    Yields:
+        (key, result) tuples in the order of jobs
+    """
+    jobs = iter(jobs)
+    window = max(1, concurrency) * 2
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        pending = deque()
+        try:
+            for key, request in jobs:
+                pending.append((key, executor.submit(request)))
+                if len(pending) >= window:
+                    break
+            while pending:
+                # Consume in submission order to keep output deterministic
+                key, future = pending.popleft()
+                yield key, future.result()
+                job = next(jobs, None)
+                if job is not None:
+                    pending.append((job[0], executor.submit(job[1])))
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+def plan_shards(rules, filter, shards, scheduler, first_page=None):
+    """
+    Split a listing into shards of roughly equal size by created_on
+    
+    The unsharded total comes from a one-rule request (or the page credential
+    validation already fetched); then one single-rule request per boundary,
+    sorted by created_on at offset k * total / shards, finds the quantiles.
+    
+    Args:
+        rules: CorrelationRules client (or any object with get_rules_combined)
+        filter (str): The FQL filter to partition
+        shards (int): Number of shards wanted
+        scheduler (RequestScheduler): Pacing and retry policy
+        first_page (dict): Already fetched response for filter, if any
+        
+    Returns:
+        {"total": unsharded total, "filters": shard filters}, or None when
+        the listing cannot or need not be sharded
+    """
+    response = first_page or scheduler.call(
+        lambda: rules.get_rules_combined(limit=1, offset=0, filter=filter), "shard plan"
+    )
+    total = get_pagination_total(response) if response["status_code"] == 200 else None
+    if total is None or shards < 2 or total < shards:
+        return None
+
+    def boundary(offset):
+        page = scheduler.call(lambda: rules.get_rules_combined(limit=1, offset=offset, filter=filter,
+                                                               sort=f"{SHARD_FIELD}|asc"),
+                              f"shard boundary {offset}")
+        resources = page["body"].get("resources") if page["status_code"] == 200 else None
+        return resources[0].get(SHARD_FIELD) if resources else None
+
+    offsets = [index * total // shards for index in range(1, shards)]
+    boundaries = [value for _, value in fetch_ordered(
+        ((offset, lambda offset=offset: boundary(offset)) for offset in offsets), len(offsets))]
+    if None in boundaries:
+        return None
+    return {"total": total, "filters": shard_filters(filter, boundaries)}
+
+def iter_sharded_pages(rules, limit, filters, concurrency=1, scheduler=None):
+    """
+    Yield (offset, response) for every page of several disjoint shard filters
+    
+    The first page of every shard is fetched up front to learn each shard's
+    total; the remaining pages of all shards then share one bounded worker
+    pool. Offsets are numbered as if the shards were one listing (shard i
+    starts after the rules of shards 0..i-1), so page files and checkpoints
+    stay unique.
+    
+    Each shard ends on its own empty or short page (e.g. rules deleted while
+    listing): later pages of that shard are skipped and empty pages are never
+    yielded, since an empty page ends the whole stream downstream.
+    
+    Args:
+        rules: CorrelationRules client (or any object with get_rules_combined)
+        limit (int): Page size
+        filters (list): Disjoint FQL filters, e.g. from plan_shards
+        concurrency (int): Maximum number of requests in flight
+        scheduler (RequestScheduler): Pacing and retry policy (default: a new one)
+    """
+    scheduler = scheduler or RequestScheduler(concurrency)
+    ended = set()
+
+    def fetch(shard, filter, offset):
+        if shard in ended:
+            return None
+        return scheduler.call(lambda: rules.get_rules_combined(limit=limit, offset=offset, filter=filter),
+                              f"shard offset {offset}")
+
+    first_pages = [response for _, response in fetch_ordered(
+        ((index, lambda filter=filter: fetch(None, filter, 0)) for index, filter in enumerate(filters)),
+        concurrency)]
+    jobs = []
+    base = 0
+    for shard, (filter, response) in enumerate(zip(filters, first_pages)):
+        if response["status_code"] != 200:
+            yield base, response
+            return
+        total = get_pagination_total(response)
+        if total is None:
+            raise RuntimeError("Sharded listing needs meta.pagination.total in API responses")
+        if not total:
+            continue
+        jobs.append(((shard, base), lambda response=response: response))
+        jobs.extend(((shard, base + offset), lambda shard=shard, filter=filter, offset=offset: fetch(shard, filter, offset))
+                    for offset in range(limit, total, limit))
+        base += total
+
+    for (shard, offset), response in fetch_ordered(jobs, concurrency):
+        if response is None:
+            # Requested after its shard ended
+            continue
+        if response["status_code"] != 200:
+            yield offset, response
+            return
+        resources = response["body"].get("resources") or []
+        if len(resources) < limit:
+            ended.add(shard)
+        if resources:
+            yield offset, response
+
+def iter_rule_pages(rules, limit, filter, concurrency=1, first_page=None, scheduler=None, start_offset=0):
+    """
+    Yield (offset, response) for every page of correlation rules
+    
+    The first page is always fetched on its own. When concurrency is greater
+    than one and the response reports meta.pagination.total, the remaining
+    offsets are fetched in parallel; otherwise pages are walked one at a time.
+    Throttled and transient failures are retried by the scheduler; iteration
+    stops after a non-200 final response, an empty page or a short page.
+    
+    Args:
+        rules: CorrelationRules client (or any object with get_rules_combined)
+        limit (int): Page size
+        filter (str): FQL filter passed to every request
+        concurrency (int): Maximum number of requests in flight
+        first_page (dict): Already fetched response for offset 0, e.g. from
+            credential validation (default: fetch it)
+        scheduler (RequestScheduler): Pacing and retry policy (default: a new one)
+        start_offset (int): Offset of the first page, e.g. when resuming
+    """
+    scheduler = scheduler or RequestScheduler(concurrency)
+    offset = start_offset
+    while True:
+        if offset == 0 and first_page is not None:
+            response = first_page
+        else:
+            response = scheduler.call(
+                lambda: rules.get_rules_combined(limit=limit, offset=offset, filter=filter),
+                f"offset {offset}"
+            )
+        yield offset, response
+
+        if response["status_code"] != 200:
+            return
+        current_rules = response["body"].get("resources", [])
+        if len(current_rules) < limit:
+            return
+
+        if offset == start_offset and concurrency > 1:
+            total = get_pagination_total(response)
+            if total is not None:
+                for item in fetch_remaining_pages(rules, limit, total, filter, concurrency, scheduler,
+                                                  start=offset + limit):
+                    yield item
+                    if item[1]["status_code"] != 200:
+                        return
+                return
+
+        offset += limit
+
+def list_rule_ids(rules, limit, filter):
+    """
+    List the IDs of every rule matching filter without fetching the rules
+    
+    Args:
+        rules: CorrelationRules client (or any object with query_rules)
+        limit (int): Page size
+        filter (str): FQL filter
+        
+    Returns:
+        Set of rule IDs, or None if the listing failed
+    """
+    if is_async_client(rules):
+        return asyncio.run(alist_rule_ids(rules, limit, filter))
+
+    rule_ids = set()
+    offset = 0
+    while True:
+        response = rules.query_rules(limit=limit, offset=offset, filter=filter)
+        if response["status_code"] != 200:
+            return None
+        resources = response["body"].get("resources") or []
+        rule_ids.update(resources)
+        if len(resources) < limit:
+            return rule_ids
+        offset += limit
+
+async def aiter_rule_pages(rules, limit, filter, concurrency=1, first_page=None, scheduler=None,
+                           start_offset=0):
+    """
+    Async version of iter_rule_pages for clients such as AsyncCorrelationRules
+    
+    The first page is awaited on its own; when it reports
+    meta.pagination.total the remaining offsets are requested as concurrent
+    tasks (at most concurrency in flight, concurrency * 2 queued) and yielded
+    in offset order. The scheduler paces and retries them as in the
+    threaded version.
+    """
+    scheduler = scheduler or RequestScheduler(concurrency)
+    offset = start_offset
+    total = None
+    while total is None:
+        if offset == 0 and first_page is not None:
+            response = first_page
+        else:
+            response = await scheduler.acall(
+                lambda: rules.get_rules_combined(limit=limit, offset=offset, filter=filter),
+                f"offset {offset}"
+            )
+        yield offset, response
+
+        if response["status_code"] != 200:
+            return
+        if len(response["body"].get("resources", [])) < limit:
+            return
+        if offset == start_offset and concurrency > 1:
+            total = get_pagination_total(response)
+        offset += limit
+
+    async def fetch(page_offset):
+        return await scheduler.acall(
+            lambda: rules.get_rules_combined(limit=limit, offset=page_offset, filter=filter),
+            f"offset {page_offset}"
+        )
+
+    offsets = iter(range(offset, total, limit))
+    pending = deque()
+    try:
+        for page_offset in offsets:
+            pending.append((page_offset, asyncio.ensure_future(fetch(page_offset))))
+            if len(pending) >= concurrency * 2:
+                break
+        while pending:
+            page_offset, task = pending.popleft()
+            response = await task
+            yield page_offset, response
+            if response["status_code"] != 200:
+                return
+            next_offset = next(offsets, None)
+            if next_offset is not None:
+                pending.append((next_offset, asyncio.ensure_future(fetch(next_offset))))
+    finally:
+        for _, task in pending:
+            task.cancel()
+
+async def alist_rule_ids(rules, limit, filter):
+    """Async version of list_rule_ids"""
+    async with rules:
+        rule_ids = set()
+        offset = 0
+        while True:
+            response = await rules.query_rules(limit=limit, offset=offset, filter=filter)
+            if response["status_code"] != 200:
+                return None
+            resources = response["body"].get("resources") or []
+            rule_ids.update(resources)
+            if len(resources) < limit:
+                return rule_ids
+            offset += limit
+
+_PIPELINE_DONE = object()
+
+def produce_pages(rules, limit, filter, concurrency, page_queue, stop_event, first_page=None,
+                  scheduler=None, start_offset=0, shard_filters=None):
+    """
+    Producer stage: download pages and put them on a bounded queue
+    
+    The queue applies back-pressure, so the producer never runs more than
+    page_queue.maxsize pages ahead of the writer. Exceptions are forwarded
+    to the consumer instead of being lost in the thread.
+    """
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                page_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
         return False
 
-def backup_all_correlation_rules(client_id, client_secret, cloud_region, backup_filter=None):
+    async def produce_async():
+        # The pooled session lives for exactly one event loop in this thread
+        loop = asyncio.get_running_loop()
+        async with rules:
+            async for item in aiter_rule_pages(rules, limit, filter, concurrency, first_page, scheduler,
+                                               start_offset):
+                # Hand off without blocking the loop so in-flight requests keep going
+                if not await loop.run_in_executor(None, put, item):
+                    return
+
+    try:
+        if shard_filters:
+            for item in iter_sharded_pages(rules, limit, shard_filters, concurrency, scheduler):
+                if not put(item):
+                    return
+        elif is_async_client(rules):
+            asyncio.run(produce_async())
+        else:
+            for item in iter_rule_pages(rules, limit, filter, concurrency, first_page, scheduler,
+                                        start_offset):
+                if not put(item):
+                    return
+    except Exception as e:
+        put(e)
+    finally:
+        put(_PIPELINE_DONE)
+
+def iter_pipeline_pages(rules, limit, filter, concurrency, queue_size=None, first_page=None,
+                        scheduler=None, start_offset=0, shard_filters=None):
+    """
+    Run the page producer in a background thread and yield its pages
+    
+    Args:
+        rules: CorrelationRules client (or any object with get_rules_combined)
+        limit (int): Page size
+        filter (str): FQL filter passed to every request
+        concurrency (int): Maximum number of requests in flight
+        queue_size (int): Maximum pages buffered between producer and writer
+        first_page (dict): Already fetched response for offset 0 (default: fetch it)
+        scheduler (RequestScheduler): Pacing and retry policy (default: a new one)
+        start_offset (int): Offset of the first page, e.g. when resuming
+        shard_filters (list): List these disjoint filters instead of filter
+            (see iter_sharded_pages)
+        
+    Yields:
+        (offset, response) tuples in ascending offset order
+    """
+    page_queue = queue.Queue(maxsize=queue_size or Config.PIPELINE_QUEUE_SIZE)
+    stop_event = threading.Event()
+    producer = threading.Thread(
+        target=produce_pages,
+        args=(rules, limit, filter, concurrency, page_queue, stop_event, first_page, scheduler,
+              start_offset, shard_filters),
+        name="page-producer",
+        daemon=True
+    )
+    producer.start()
+    try:
+        while True:
+            item = page_queue.get()
+            if item is _PIPELINE_DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop_event.set()
+        producer.join()
+
+def split_rules(pages):
+    """
+    Splitter stage: turn a stream of pages into a stream of work items
+    
+    Yields ("page", offset, response) for every page, followed by
+    ("rule", offset, rule) for each rule it contains. Stops after the first
+    non-200 or empty page. Each page is released as soon as its rules have
+    been handed to the writer.
+    """
+    for offset, response in pages:
+        yield "page", offset, response
+        if response["status_code"] != 200:
+            return
+        current_rules = response["body"].get("resources", [])
+        if not current_rules:
+            return
+        del response
+        for rule in current_rules:
+            yield "rule", offset, rule
+
+def rule_file_name(rule):
+    """File name of a rule inside a snapshot (no date, it is in the folder name)"""
+    # Sanitize rule name for filename (remove special characters)
+    safe_rule_name = sanitize_filename(rule.get("name", "Name not found"))
+    return f"{safe_rule_name}_{rule['id']}.json"
+
+def build_rule_entry(rule, location, rule_hash, timestamp):
+    """
+    Build the backup summary entry of a saved rule
+
+    Args:
+        rule (dict): Rule as returned by the API
+        location (dict): Location fields returned by the writer
+        rule_hash (str): Content hash of the rule
+        timestamp (str): Backup time (HHMMSS)
+
+    Returns:
+        Summary entry with the rule's details including its search filter
+    """
+    return {
+        "rule_id": rule["id"],
+        "rule_name": rule.get("name", "Name not found"),
+        "description": rule.get("description", "No description, please update"),
+        "search_outcome": rule.get("search", {}).get("outcome", "Not found"),
+        "search_filter": rule.get("search", {}).get("filter", "Not found"),
+        "created_on": rule.get("created_on", "Not found"),
+        "last_updated_on": rule.get("last_updated_on", "Not found"),
+        "status": rule.get("status", "Not found"),
+        **location,
+        "sha256": rule_hash,
+        "timestamp": timestamp
+    }
+
+def fetch_rules_by_id(rules, limit, filter, rule_ids, concurrency=1, scheduler=None):
+    """
+    Fetch specific rules by listing every rule matching filter
+
+    Used to recover rules an incremental run expected to carry forward from
+    the previous snapshot; the listing stops as soon as all of them are found.
+
+    Args:
+        rules: CorrelationRules client (or any object with get_rules_combined)
+        limit (int): Page size
+        filter (str): FQL filter the rules match
+        rule_ids (list): IDs of the rules to fetch
+        concurrency (int): Maximum number of requests in flight
+        scheduler (RequestScheduler): Pacing and retry policy (default: a new one)
+
+    Returns:
+        Dictionary mapping rule ID to rule for the rules that were found
+    """
+    wanted = set(rule_ids)
+    found = {}
+    pages = iter_pipeline_pages(rules, limit, filter, concurrency, scheduler=scheduler)
+    try:
+        for kind, offset, item in split_rules(pages):
+            if kind == "rule" and item["id"] in wanted:
+                found[item["id"]] = item
+                if len(found) == len(wanted):
+                    break
+    finally:
+        pages.close()
+    return found
+
+def backup_all_correlation_rules(client_id, client_secret, cloud_region, backup_filter=None,
+                                 concurrency=None, output_dir=None, client=None, incremental=False,
+                                 output_format=None, use_async=False, resume=False, logger=None,
+                                 request_gate=None, metrics_file=None, shards=None, compression=None,
+                                 fsync_policy=None):
     """
     Backup all correlation rules using falconpy
     
@@ -35,153 +540,493 @@ def backup_all_correlation_rules(client_id, client_secret, cloud_region, backup_
         client_secret (str): CrowdStrike API client secret
         cloud_region (str): CrowdStrike cloud region (default: us-2)
         backup_filter (str): Filter for correlation rules (default: from Config.BACKUP_FILTER)
+        concurrency (int): Number of pages fetched in parallel (default: from Config.BACKUP_CONCURRENCY)
+        output_dir (str): Base backup directory (default: BASE_EXPORT_DIR)
+        client: Pre-built CorrelationRules compatible client (default: the shared
+            client from utils.client_factory, reusing its cached token and any
+            first page already fetched by credential validation)
+        incremental (bool): Only write new or changed rules and hard-link the
+            rest from the previous snapshot recorded in the state index
+        output_format (str): Output layout, "files", "objects", "jsonl" or "tar"
+            (default: from Config.OUTPUT_FORMAT)
+        use_async (bool): Fetch pages with the pooled asyncio client instead of falconpy
+        resume (bool): Continue an interrupted backup of the same day from its
+            checkpoint journal instead of starting again at offset 0
+        logger: Logger to report to (default: a new timestamped log file in logs/)
+        request_gate (threading.Semaphore): Cap on API requests in flight shared
+            with other backups running in the same process
+        metrics_file (str): Prometheus textfile to write the run's timings to
+            (default: from Config.METRICS_FILE, empty for none)
+        shards (int): Split the listing into this many created_on ranges that
+            are paginated in parallel (default: from Config.BACKUP_SHARDS, 0 or 1 for none)
+        compression (str): Block compression of the jsonl format, "gzip" or
+            "zstd" (default: from Config.ARCHIVE_COMPRESSION)
+        fsync_policy (str): fsync policy of the files format, "none", "batch"
+            or "always" (default: from Config.FSYNC_POLICY)
+        
+    Returns:
+        The backup summary dictionary, or None if the backup did not complete
     """
     # Setup logging
-    log_file = get_log_filename()
-    logger = setup_logger(log_file=log_file)
+    if logger is None:
+        log_file = get_log_filename()
+        logger = setup_logger(log_file=log_file)
+    
+    base_export_dir = output_dir or BASE_EXPORT_DIR
+    concurrency = concurrency if concurrency is not None else Config.BACKUP_CONCURRENCY
+    output_format = output_format or Config.OUTPUT_FORMAT
+    
+    metrics_file = Config.METRICS_FILE if metrics_file is None else metrics_file
+    shards = Config.BACKUP_SHARDS if shards is None else shards
+    metrics = BackupMetrics()
     
     logger.info("Starting correlation rules backup process")
-    logger.info(f"Backup directory: {BASE_EXPORT_DIR}")
+    logger.info(f"Backup directory: {base_export_dir}")
+    journal = None
+    manifest = None
     
     try:
         # Create date based subfolder
         current_date = datetime.now().strftime("%Y-%m-%d")
-        EXPORT_DIR = os.path.join(BASE_EXPORT_DIR, current_date)
+        EXPORT_DIR = os.path.join(base_export_dir, current_date)
 
         logger.info(f"Creating date based export directory: {EXPORT_DIR}")
         os.makedirs(EXPORT_DIR, exist_ok=True)
         logger.info(f"Export directory ready: {EXPORT_DIR}")
+        writer = get_writer(output_format, base_export_dir, EXPORT_DIR, logger, compression=compression,
+                            fsync_policy=fsync_policy)
+        if hasattr(writer, "serializer"):
+            writer.serializer = metrics.timed_serializer(writer.serializer)
+        logger.info(f"Output format: {output_format}")
         
         # Initialize the CorrelationRules client
-        logger.info("Initializing CrowdStrike API client")
-        rules = CorrelationRules(
-            client_id=client_id,
-            client_secret=client_secret,
-            cloud_region=cloud_region
-        )
+        session = None
+        if client is not None:
+            rules = client
+        else:
+            logger.info(f"Initializing {'asyncio ' if use_async else ''}CrowdStrike API client")
+            session = get_session(client_id, client_secret, cloud_region, use_async=use_async,
+                                  max_connections=max(concurrency, Config.ASYNC_MAX_CONNECTIONS))
+            rules = session.client
+            # Includes a login during credential validation
+            metrics.add("auth", session.take_auth_seconds())
 
-        # Get list of all rule IDs with pagination
+        # Stream pages through producer -> splitter -> writer so rule files are
+        # written while later pages are still downloading
         logger.info("Fetching all correlation rules...")
-        all_responses = []
-        all_rules = []
-        offset = 0
+        total_responses = 0
+        total_rules = 0
+        saved_rules = RuleRecords()
         limit = Config.BACKUP_LIMIT
         filter = backup_filter if backup_filter is not None else Config.BACKUP_FILTER
         
         logger.info(f"Using filter: {filter}")
         
-        while True:
-            query_response = rules.get_rules_combined(limit=limit, offset=offset, filter=filter)
-            
-            if not query_response["status_code"] == 200:
-                logger.error(f"Error fetching rules: {query_response['status_code']}")
-                return
-                
-            # Save the complete API response with time (no date in filename since it's in folder)
-            current_time = datetime.now().strftime("%H%M%S")
-            response_filename = os.path.join(EXPORT_DIR, f"api_response_offset_{offset}_{current_time}.json")
-            if save_json(response_filename, query_response):
-                logger.info(f"API response saved: {response_filename}")
-                # Verify file was actually created
-                if os.path.exists(response_filename):
-                    file_size = os.path.getsize(response_filename)
-                    logger.info(f"  File size: {file_size} bytes")
-                else:
-                    logger.warning(f"  File not found after save attempt")
+        if concurrency > 1:
+            logger.info(f"Fetching pages with concurrency {concurrency}")
+        
+        # Incremental mode: compare against the previous snapshot's state index
+        # and, when possible, only ask the API for rules updated since then
+        previous_rules = {}
+        fetch_filter = filter
+        watermark = None
+        if incremental and output_format != "files":
+            # Object stores never rewrite unchanged rules, archives are rewritten whole
+            logger.warning(f"Incremental mode only applies to the files format, ignoring for {output_format}")
+            incremental = False
+        if incremental:
+            state_index = load_state_index(base_export_dir)
+            if state_index and state_index.get("filter") == filter:
+                previous_rules = state_index.get("rules", {})
+                watermark = state_index.get("high_watermark")
+                if watermark:
+                    fetch_filter = build_incremental_filter(filter, watermark)
+                logger.info(f"Incremental backup against snapshot {state_index.get('snapshot_date')} "
+                            f"({len(previous_rules)} rules)")
+                logger.info(f"Using incremental filter: {fetch_filter}")
             else:
-                logger.error(f"Failed to save API response: {response_filename}")
-                
-            current_rules = query_response["body"].get("resources", [])
-            
-            if not current_rules:
-                break
-                
-            all_responses.append(query_response)
-            all_rules.extend(current_rules)
-            logger.info(f"Fetched {len(current_rules)} rules (offset: {offset})")
-            
-            # If we got fewer rules than the limit, we've reached the end
-            if len(current_rules) < limit:
-                break
-                
-            offset += limit
+                logger.info("No usable state index found, performing a full backup")
+        rules_written = 0
+        rules_linked = 0
+        seen_rule_ids = set()
 
-        if not all_responses:
-            logger.warning("No rules found.")
-            return
+        if shards > 1 and is_async_client(rules):
+            logger.warning("Sharded listing is not supported with the asyncio client, ignoring shards")
+            shards = 0
+        if shards > 1 and resume:
+            # Shard boundaries, and so page offsets, differ between runs
+            logger.warning("Resume is not supported with a sharded listing, starting from the beginning")
+            resume = False
 
-        logger.info(f"Found {len(all_responses)} API responses total.")
-        logger.info(f"Found {len(all_rules)} individual rules total.")
-
-        # Save individual rule details with search filters
-        logger.info("Saving individual rule details...")
-        saved_rules = []
-        for rule in all_rules:
-            rule_id = rule["id"]
-            rule_name = rule.get("name", "Name not found")
-            description = rule.get("description", "No description, please update")
-            search_outcome = rule.get("search", {}).get("outcome", "Not found")
-            search_filter = rule.get("search", {}).get("filter", "Not found")
-            last_updated_on = rule.get("last_updated_on", "Not found")
-            created_on = rule.get("created_on", "Not found")
-            status = rule.get("status", "Not found")
-            
-            # Create individual rule file with all details including search filter
-            # Sanitize rule name for filename (remove special characters)
-            from utils.validators import sanitize_filename
-            safe_rule_name = sanitize_filename(rule_name)
-            
-            # Create filename with rule name (no date in filename since it's in folder)
-            rule_filename = os.path.join(EXPORT_DIR, f"{safe_rule_name}_{rule_id}.json")
-
-            if save_json(rule_filename, rule):
-                logger.info(f"Rule saved: {rule_id} ({rule_name})")
-                # Verify file was actually created
-                if os.path.exists(rule_filename):
-                    file_size = os.path.getsize(rule_filename)
-                    logger.info(f"  File size: {file_size} bytes")
-                    saved_rules.append({
+        # Resume: take completed pages and durable rule files from the checkpoint
+        # journal of an interrupted run of the same day, with the same parameters
+        if resume and output_format != "files":
+            # Other formats only produce their output when the run completes
+            logger.warning(f"Resume only applies to the files format, ignoring for {output_format}")
+            resume = False
+        checkpoint_header = {"filter": filter, "fetch_filter": fetch_filter, "limit": limit,
+                             "format": output_format}
+        # The manifest lists saved rules as they are saved; its index is added once the backup completes
+        manifest = ManifestWriter(EXPORT_DIR, {"snapshot_date": current_date, "filter": filter,
+                                               "output_format": output_format})
+        start_offset = 0
+        journaled_rules = {}
+        resumed_rule_ids = set()
+        rules_skipped = 0
+        if resume:
+            checkpoint = load_checkpoint(EXPORT_DIR)
+            header = checkpoint["header"] if checkpoint else {}
+            if checkpoint and all(header.get(key) == value for key, value in checkpoint_header.items()):
+                journaled_rules = checkpoint["rules"]
+                completed_pages = checkpoint["pages"]
+                while start_offset in completed_pages:
+                    start_offset += limit
+                # Fetch the last completed page again so rules shifted by
+                # deletions in the meantime are not missed, and any page with
+                # a rule file that did not survive
+                start_offset = max(0, start_offset - limit)
+                for record in journaled_rules.values():
+                    if not is_durable(EXPORT_DIR, record["entry"]):
+                        start_offset = min(start_offset, record["offset"])
+                for page_offset, rule_count in completed_pages.items():
+                    if page_offset < start_offset:
+                        total_responses += 1
+                        total_rules += rule_count
+                for rule_id, record in journaled_rules.items():
+                    if record["offset"] < start_offset:
+                        saved_rules.append(record["entry"])
+                        manifest.add(record["entry"])
+                        resumed_rule_ids.add(rule_id)
+                seen_rule_ids.update(resumed_rule_ids)
+                logger.info(f"Resuming from offset {start_offset} with {len(resumed_rule_ids)} rules "
+                            f"already saved")
+            else:
+                logger.info("No matching checkpoint found, starting from offset 0")
+                resume = False
+        if output_format == "files":
+            journal = CheckpointJournal(EXPORT_DIR, checkpoint_header, resume=resume)
+        
+        # Start from the page credential validation already fetched, if it matches
+        first_page = session.take_first_page(limit, fetch_filter) if session and not start_offset else None
+        if first_page is not None:
+            logger.info("Reusing first page fetched during credential validation")
+        scheduler = RequestScheduler(concurrency, logger=logger, gate=request_gate)
+        shard_plan = None
+        if shards > 1:
+            with metrics.phase("fetch"):
+                shard_plan = plan_shards(rules, fetch_filter, shards, scheduler, first_page)
+            if shard_plan:
+                logger.info(f"Listing {shard_plan['total']} rules in {len(shard_plan['filters'])} "
+                            f"{SHARD_FIELD} shards")
+                first_page = None
+            else:
+                logger.info("Listing is too small or reports no total, not sharding")
+        pages = iter_pipeline_pages(rules, limit, fetch_filter, concurrency, first_page=first_page,
+                                    scheduler=scheduler, start_offset=start_offset,
+                                    shard_filters=shard_plan["filters"] if shard_plan else None)
+        open_page = None
+        rule_bytes = 0
+        duplicate_rules = 0
+        try:
+            for kind, offset, item in metrics.timed_iter(split_rules(pages), "fetch"):
+                if kind == "page":
+                    query_response = item
+                    if not query_response["status_code"] == 200:
+                        logger.error(f"Error fetching rules: {query_response['status_code']}")
+                        return
+                    # Every rule of the previous page has been handled by now
+                    if journal and open_page:
+                        with metrics.phase("checkpoint"):
+                            journal.record_page(*open_page)
+                    
+                    # Save the complete API response with time (no date in filename since it's in folder)
+                    current_time = datetime.now().strftime("%H%M%S")
+                    with metrics.phase("write"):
+                        writer.write_page(offset, query_response, current_time)
+                    
+                    current_rules = query_response["body"].get("resources", [])
+                    if current_rules:
+                        total_responses += 1
+                        total_rules += len(current_rules)
+                        logger.info(f"Fetched {len(current_rules)} rules (offset: {offset})")
+                        open_page = (offset, len(current_rules))
+                    del query_response, current_rules, item
+                    continue
+
+                # Save individual rule details with search filters
+                rule = item
+                rule_id = rule["id"]
+                if rule_id in resumed_rule_ids:
+                    # Already restored from the checkpoint (page boundaries shifted)
+                    continue
+                if rule_id in seen_rule_ids:
+                    # Returned twice because pages shifted while listing
+                    duplicate_rules += 1
+                    logger.debug(f"Skipping duplicate rule: {rule_id}")
+                    continue
+                rule_name = rule.get("name", "Name not found")
+                filename = rule_file_name(rule)
+                rule_filename = os.path.join(EXPORT_DIR, filename)
+                with metrics.phase("serialize"):
+                    rule_hash = content_hash(rule)
+                seen_rule_ids.add(rule_id)
+
+                # Rules the interrupted run already wrote are kept as they are
+                journaled = journaled_rules.get(rule_id)
+                if journaled and journaled["entry"].get("sha256") == rule_hash and \
+                        journaled["entry"].get("filename") == filename and is_durable(EXPORT_DIR, journaled["entry"]):
+                    logger.debug(f"Rule already saved before interruption: {rule_id} ({rule_name})")
+                    rules_skipped += 1
+                    saved_rules.append(journaled["entry"])
+                    manifest.add(journaled["entry"])
+                    continue
+
+                # Unchanged rules are hard-linked from the previous snapshot
+                previous = previous_rules.get(rule_id)
+                previous_path = os.path.join(base_export_dir, previous["path"]) if previous else None
+                with metrics.phase("write"):
+                    linked = previous and previous.get("sha256") == rule_hash and \
+                        link_or_copy(previous_path, rule_filename)
+                    location = None if linked else writer.write_rule(rule, filename, rule_hash)
+                if linked:
+                    logger.debug(f"Rule unchanged, linked: {rule_id} ({rule_name})")
+                    rules_linked += 1
+                    location = {"filename": filename, "file_size": previous.get("file_size"),
+                                "file_sha256": previous.get("file_sha256")}
+                elif location:
+                    rules_written += 1
+                    rule_bytes += location.get("file_size") or 0
+                    logger.info(f"Rule saved: {rule_id} ({rule_name})")
+                    # A renamed rule leaves its old file behind in a same-day re-run
+                    if previous_path and os.path.dirname(previous_path) == EXPORT_DIR and \
+                            previous_path != rule_filename and os.path.exists(previous_path):
+                        os.remove(previous_path)
+                else:
+                    logger.error(f"Failed to save rule: {rule_id}")
+
+                if location:
+                    entry = build_rule_entry(rule, location, rule_hash, current_time)
+                    saved_rules.append(entry)
+                    manifest.add(entry)
+                    if journal:
+                        with metrics.phase("checkpoint"):
+                            journal.record_rule(offset, entry)
+            if journal and open_page:
+                with metrics.phase("checkpoint"):
+                    journal.record_page(*open_page)
+        finally:
+            # Stop the producer thread however the writer loop exits
+            pages.close()
+            if session:
+                # The token may have been refreshed during a long backup
+                session.save_token()
+
+        # Carry forward rules the incremental query did not return, and record
+        # rules that have disappeared from the tenant as deletions
+        deleted_rules = []
+        unlinked_rule_ids = []
+        unseen_rule_ids = [rule_id for rule_id in previous_rules if rule_id not in seen_rule_ids]
+        if unseen_rule_ids:
+            current_rule_ids = None
+            if watermark:
+                current_rule_ids = list_rule_ids(rules, limit, filter)
+                if current_rule_ids is None:
+                    logger.warning("Could not list current rule IDs; deletions will not be detected")
+            for rule_id in unseen_rule_ids:
+                previous = previous_rules[rule_id]
+                still_present = current_rule_ids is None or rule_id in current_rule_ids
+                if not watermark or not still_present:
+                    logger.info(f"Rule deleted since previous snapshot: {rule_id} ({previous.get('rule_name')})")
+                    deleted_rules.append({
                         "rule_id": rule_id,
-                        "rule_name": rule_name,
-                        "description": description,
-                        "search_outcome": search_outcome,
-                        "search_filter": search_filter,
-                        "created_on": created_on,
-                        "last_updated_on": last_updated_on,
-                        "status": status,
-                        "filename": os.path.basename(rule_filename),
-                        "file_size": file_size,
-                        "timestamp": current_time
+                        "rule_name": previous.get("rule_name"),
+                        "previous_path": previous["path"]
                     })
+                    continue
+                previous_path = os.path.join(base_export_dir, previous["path"])
+                rule_filename = os.path.join(EXPORT_DIR, previous["filename"])
+                if link_or_copy(previous_path, rule_filename):
+                    rules_linked += 1
+                    entry = {key: value for key, value in previous.items() if key != "path"}
+                    entry["linked_from"] = previous["path"]
+                    saved_rules.append(entry)
+                    manifest.add(entry)
                 else:
-                    logger.warning(f"  File not found after save attempt")
+                    logger.warning(f"Failed to link unchanged rule: {rule_id} from {previous_path}")
+                    unlinked_rule_ids.append(rule_id)
+
+        # The incremental filter will not return rules that could not be linked,
+        # so fetch them without it; otherwise they would drop out of every later snapshot
+        unrecovered_rule_ids = []
+        if unlinked_rule_ids:
+            logger.info(f"Fetching {len(unlinked_rule_ids)} rules that could not be linked")
+            with metrics.phase("fetch"):
+                recovered = fetch_rules_by_id(rules, limit, filter, unlinked_rule_ids, concurrency, scheduler)
+            for rule_id in unlinked_rule_ids:
+                rule = recovered.get(rule_id)
+                location = None
+                if rule:
+                    with metrics.phase("write"):
+                        rule_hash = content_hash(rule)
+                        location = writer.write_rule(rule, rule_file_name(rule), rule_hash)
+                if location:
+                    rules_written += 1
+                    rule_bytes += location.get("file_size") or 0
+                    logger.info(f"Rule saved: {rule_id} ({rule.get('name', 'Name not found')})")
+                    entry = build_rule_entry(rule, location, rule_hash, current_time)
+                    saved_rules.append(entry)
+                    manifest.add(entry)
+                else:
+                    logger.error(f"Failed to recover unchanged rule: {rule_id}")
+                    unrecovered_rule_ids.append(rule_id)
+
+        if incremental:
+            logger.info(f"Incremental backup: {rules_written} written, {rules_linked} linked, "
+                        f"{len(deleted_rules)} deleted")
+        if duplicate_rules:
+            logger.warning(f"Skipped {duplicate_rules} duplicate rules returned by shifted pages")
+
+        # The shards together must hold what the unsharded filter matched
+        sharding = None
+        if shard_plan:
+            sharding = {
+                "shards": len(shard_plan["filters"]),
+                "field": SHARD_FIELD,
+                "filters": shard_plan["filters"],
+                "expected_total": shard_plan["total"],
+                "listed_rules": len(seen_rule_ids),
+                "duplicate_rules": duplicate_rules,
+                "complete": len(seen_rule_ids) == shard_plan["total"],
+            }
+            if sharding["complete"]:
+                logger.info(f"Sharded listing matches the unsharded total of {shard_plan['total']} rules")
             else:
-                logger.error(f"Failed to save rule: {rule_id}")
-
-        # Create backup summary file
-        backup_summary = {
-            "backup_timestamp": current_time,
-            "backup_date": datetime.now().isoformat(),
-            "total_rules_found": len(all_rules),
-            "total_api_responses": len(all_responses),
-            "saved_rules": saved_rules,
-            "export_directory": EXPORT_DIR,
-            "filter_used": filter
-        }
+                logger.error(f"Sharded listing returned {len(seen_rule_ids)} rules but the unsharded total was "
+                             f"{shard_plan['total']}; rules were probably added or deleted during the backup. "
+                             f"This snapshot will not be used as the base for incremental backups")
+
+        if not total_responses and not saved_rules:
+            logger.warning("No rules found.")
+            if journal:
+                journal.complete()
+            return
+
+        logger.info(f"Found {total_responses} API responses total.")
+        if scheduler.stats["retries"]:
+            logger.info(f"Retried {scheduler.stats['retries']} requests "
+                        f"({scheduler.stats['throttled']} throttled, {scheduler.stats['errors']} errors)")
+        logger.info(f"Found {total_rules} individual rules total.")
+
+        with metrics.phase("write"):
+            writer_fields = writer.close(current_time)
+
+        with metrics.phase("summary"):
+            # Create backup summary file
+            backup_summary = {
+                "backup_timestamp": current_time,
+                "backup_date": datetime.now().isoformat(),
+                "total_rules_found": total_rules,
+                "total_api_responses": total_responses,
+                "saved_rules": saved_rules,
+                "export_directory": EXPORT_DIR,
+                "filter_used": filter
+            }
+            backup_summary["output_format"] = output_format
+            backup_summary["request_stats"] = dict(scheduler.stats)
+            if duplicate_rules:
+                backup_summary["duplicate_rules"] = duplicate_rules
+            if sharding:
+                backup_summary["sharding"] = sharding
+            backup_summary.update(writer_fields)
+            manifest.finish(current_time)
+            backup_summary["rule_manifest"] = os.path.basename(manifest.path)
+            backup_summary["rule_manifest_sha256"] = manifest.sha256
+            if incremental:
+                backup_summary.update({
+                    "incremental": True,
+                    "incremental_filter": fetch_filter,
+                    "rules_written": rules_written,
+                    "rules_linked": rules_linked,
+                    "deleted_rules": deleted_rules
+                })
+                if unrecovered_rule_ids:
+                    backup_summary["unrecovered_rules"] = unrecovered_rule_ids
+            if resume:
+                backup_summary.update({
+                    "resumed": True,
+                    "resumed_from_offset": start_offset,
+                    "rules_skipped": rules_skipped + len(resumed_rule_ids)
+                })
+
+            # Record this snapshot as the base for the next incremental run
+            if output_format == "files" and sharding and not sharding["complete"]:
+                # Later incremental runs link from the state index, so rules this listing missed would stay missing
+                logger.warning("State index not updated: sharded listing incomplete")
+            elif unrecovered_rule_ids:
+                # The previous index stays, so the next run tries to carry these rules forward again
+                logger.error(f"State index not updated: {len(unrecovered_rule_ids)} unchanged rules "
+                             f"are missing from this snapshot")
+            elif output_format == "files":
+                if save_state_index(base_export_dir, build_state_index(current_date, filter, saved_rules)):
+                    logger.info("State index updated")
+                else:
+                    logger.warning("Failed to update state index")
+
+        # Timings cover the run up to writing the summary itself; writers
+        # without a serializer (objects) report the size of the rules they stored
+        backup_summary["timings"] = metrics.report(
+            total_rules, scheduler.latencies, None if hasattr(writer, "serializer") else rule_bytes
+        )
         
         summary_filename = os.path.join(EXPORT_DIR, f"_backup_summary_{current_time}.json")
-        if save_json(summary_filename, backup_summary):
+        summary_saved = save_json(summary_filename, backup_summary)
+        if summary_saved:
             logger.info(f"Backup summary saved: {summary_filename}")
         else:
             logger.error(f"Failed to save backup summary")
+        if journal:
+            journal.complete()
+
+        # Make the snapshot searchable with `cli.py search`
+        if Config.SEARCH_INDEX and summary_saved:
+            if index_snapshot(base_export_dir, summary_filename, backup_summary):
+                logger.info("Search index updated")
+            else:
+                logger.warning("Failed to update search index")
+
+        timings = backup_summary["timings"]
+        logger.info("Timings: " + ", ".join(f"{name} {phase['seconds']:.3f}s"
+                                           for name, phase in timings["phases"].items()) +
+                    f" of {timings['total_seconds']:.3f}s; {timings['rules_per_second']} rules/s, "
+                    f"{timings['bytes_per_second'] / 1e6:.2f} MB/s")
+        if timings["page_latency"]["count"]:
+            logger.info(f"Page latency: p50 {timings['page_latency']['p50'] * 1000:.0f} ms, "
+                        f"p95 {timings['page_latency']['p95'] * 1000:.0f} ms "
+                        f"({timings['page_latency']['count']} requests)")
+        if metrics_file:
+            if write_prometheus_textfile(metrics_file, timings, backup_summary["request_stats"]):
+                logger.info(f"Metrics written: {metrics_file}")
+            else:
+                logger.warning(f"Failed to write metrics file: {metrics_file}")
 
         logger.info(f"Backup completed at {datetime.now().isoformat()}")
-        logger.info(f"Total rules processed: {len(all_rules)}")
-        logger.info(f"Total files saved: {len(saved_rules) + len(all_responses)}")
+        logger.info(f"Total rules processed: {total_rules}")
+        logger.info(f"Total files saved: {writer.files_written + 1}")
+
+        if unrecovered_rule_ids:
+            logger.error("Backup incomplete: unchanged rules could not be carried forward")
+            return
+        return backup_summary
 
     except Exception as e:
         logger.error(f"Error during backup process: {str(e)}")
         logger.error(f"Backup process failed: {type(e).__name__}: {str(e)}")
+    finally:
+        if manifest:
+            manifest.close()
+        if journal and os.path.exists(journal.path):
+            journal.close()
+            logger.info("Checkpoint kept; run the backup again with --resume to continue")
         
 if __name__ == "__main__":
     # Get credentials from environment variables (recommended approach)
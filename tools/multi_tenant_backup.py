@@ -0,0 +1,213 @@
+"""
+Multi-tenant backup orchestrator for the CrowdStrike Correlation Rules Backup Tool
+
+Backs up correlation rules for many Falcon CIDs / cloud regions in one
+process, so Python start-up, the falconpy import and the token cache are
+shared instead of being paid once per tenant by separate cron jobs.
+
+Tenants run on a thread pool (the work is network bound). A single
+semaphore caps API requests in flight across every tenant, and each tenant
+gets a fair share of that budget as its own concurrency. A failing tenant
+never affects the others, and every tenant logs to its own file.
+
+Tenant file (JSON):
+
+    {
+        "defaults": {"cloud_region": "us-2", "filter": "*", "output_root": "correlation_rules_backups"},
+        "tenants": [
+            {"name": "acme", "client_id_env": "ACME_CLIENT_ID", "client_secret_env": "ACME_CLIENT_SECRET"},
+            {"name": "globex", "client_id": "...", "client_secret": "...", "cloud_region": "eu-1",
+             "filter": "status:'active'", "output_dir": "/backups/globex"}
+        ]
+    }
+
+Credentials may be given inline or, preferably, as the names of environment
+variables holding them. output_dir defaults to <output_root>/<name>.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from config import Config
+from tools.correlation_rules_backup import backup_all_correlation_rules
+from utils.logger import ensure_log_directory, setup_logger
+from utils.validators import sanitize_filename
+
+TENANT_DEFAULTS = {
+    "cloud_region": Config.FALCON_CLOUD_REGION,
+    "filter": Config.BACKUP_FILTER,
+    "output_root": Config.BASE_EXPORT_DIR,
+}
+
+def load_tenants(path: str) -> List[Dict[str, Any]]:
+    """
+    Load and validate a tenant file
+
+    Args:
+        path: JSON file with a "tenants" list (and optional "defaults"), or a bare list
+
+    Returns:
+        Tenant dictionaries with name, client_id, client_secret, cloud_region,
+        filter and output_dir resolved
+
+    Raises:
+        ValueError: If the file is malformed, a name is repeated or credentials are missing
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Cannot read tenant file {path}: {str(e)}")
+
+    if isinstance(data, list):
+        data = {"tenants": data}
+    if not isinstance(data, dict) or not isinstance(data.get("tenants"), list) or not data["tenants"]:
+        raise ValueError(f"Tenant file {path} must contain a non-empty \"tenants\" list")
+    defaults = {**TENANT_DEFAULTS, **data.get("defaults", {})}
+
+    tenants = []
+    names = set()
+    for position, entry in enumerate(data["tenants"], start=1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Tenant #{position} must be an object")
+        tenant = {**defaults, **entry}
+        name = sanitize_filename(str(tenant.get("name") or f"tenant_{position}"))
+        if name in names:
+            raise ValueError(f"Duplicate tenant name: {name}")
+        names.add(name)
+        tenant["name"] = name
+        for field in ("client_id", "client_secret"):
+            env_name = tenant.pop(f"{field}_env", None)
+            if env_name and not tenant.get(field):
+                tenant[field] = os.getenv(env_name)
+            if not tenant.get(field):
+                source = f"environment variable {env_name}" if env_name else f"\"{field}\""
+                raise ValueError(f"Tenant {name}: missing {field} (set {source})")
+        tenant["output_dir"] = tenant.get("output_dir") or os.path.join(tenant.pop("output_root"), name)
+        tenant.pop("output_root", None)
+        tenants.append(tenant)
+    return tenants
+
+def fair_share(global_concurrency: int, parallel_tenants: int) -> int:
+    """Per-tenant concurrency so that all running tenants fit in the global budget"""
+    return max(1, global_concurrency // max(1, parallel_tenants))
+
+def run_tenant_backup(tenant: Dict[str, Any], concurrency: int, request_gate: threading.Semaphore,
+                      timestamp: str, make_client: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                      output_format: Optional[str] = None, incremental: bool = False) -> Dict[str, Any]:
+    """
+    Back up one tenant and report how it went
+
+    Never raises: any failure is recorded in the returned result.
+
+    Returns:
+        Result dictionary with name, status ("ok" or "failed"), rules,
+        api_responses, seconds, rules_per_second, request stats, log_file,
+        export_directory and error
+    """
+    name = tenant["name"]
+    log_file = os.path.join(ensure_log_directory(), f"correlation_rules_backup_{name}_{timestamp}.log")
+    logger = setup_logger(name=f"correlation_rules_backup.tenant.{name}", log_file=log_file, console=False)
+    logger.propagate = False
+    result = {"name": name, "cloud_region": tenant["cloud_region"], "status": "failed", "rules": 0,
+              "api_responses": 0, "seconds": 0.0, "rules_per_second": 0.0, "log_file": log_file,
+              "export_directory": None, "error": None}
+
+    started = time.monotonic()
+    try:
+        summary = backup_all_correlation_rules(
+            tenant["client_id"], tenant["client_secret"], tenant["cloud_region"], tenant["filter"],
+            concurrency=tenant.get("concurrency", concurrency),
+            output_dir=tenant["output_dir"],
+            client=make_client(tenant) if make_client else None,
+            incremental=tenant.get("incremental", incremental),
+            output_format=tenant.get("format", output_format),
+            use_async=tenant.get("async_http", False),
+            logger=logger,
+            request_gate=request_gate
+        )
+    except Exception as e:
+        logger.error(f"Tenant backup failed: {type(e).__name__}: {str(e)}")
+        summary = None
+        result["error"] = f"{type(e).__name__}: {str(e)}"
+    finally:
+        for handler in logger.handlers:
+            handler.close()
+    result["seconds"] = round(time.monotonic() - started, 3)
+
+    if summary is None:
+        result["error"] = result["error"] or f"Backup did not complete, see {log_file}"
+        return result
+    result.update({
+        "status": "ok",
+        "rules": len(summary["saved_rules"]),
+        "api_responses": summary["total_api_responses"],
+        "rules_per_second": round(len(summary["saved_rules"]) / result["seconds"], 1) if result["seconds"] else 0.0,
+        "request_stats": summary.get("request_stats"),
+        "export_directory": summary["export_directory"],
+    })
+    return result
+
+def backup_tenants(tenants: List[Dict[str, Any]], global_concurrency: Optional[int] = None,
+                   max_parallel: Optional[int] = None,
+                   make_client: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                   output_format: Optional[str] = None, incremental: bool = False,
+                   summary_file: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Back up every tenant in one process
+
+    Args:
+        tenants: Tenants as returned by load_tenants
+        global_concurrency: API requests in flight across all tenants
+            (default: from Config.BACKUP_CONCURRENCY, at least one per parallel tenant)
+        max_parallel: Tenants backed up at the same time (default: all of them,
+            up to global_concurrency)
+        make_client: Builds a client for a tenant instead of the shared
+            falconpy client (used with fake clients in tests)
+        output_format: Output layout for every tenant without its own "format"
+        incremental: Incremental mode for every tenant without its own setting
+        summary_file: Where to write the consolidated summary
+            (default: logs/backup_all_summary_<timestamp>.json)
+
+    Returns:
+        Consolidated summary with per-tenant results, totals and timings
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    global_concurrency = max(1, global_concurrency or Config.BACKUP_CONCURRENCY)
+    parallel = max(1, min(len(tenants), max_parallel or global_concurrency))
+    concurrency = fair_share(global_concurrency, parallel)
+    request_gate = threading.BoundedSemaphore(max(global_concurrency, parallel))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="tenant") as executor:
+        results = list(executor.map(
+            lambda tenant: run_tenant_backup(tenant, concurrency, request_gate, timestamp, make_client,
+                                             output_format, incremental),
+            tenants
+        ))
+    seconds = round(time.monotonic() - started, 3)
+
+    total_rules = sum(result["rules"] for result in results)
+    summary = {
+        "backup_date": datetime.now().isoformat(),
+        "seconds": seconds,
+        "global_concurrency": global_concurrency,
+        "parallel_tenants": parallel,
+        "tenant_concurrency": concurrency,
+        "tenants_total": len(results),
+        "tenants_succeeded": sum(1 for result in results if result["status"] == "ok"),
+        "tenants_failed": sum(1 for result in results if result["status"] != "ok"),
+        "total_rules": total_rules,
+        "rules_per_second": round(total_rules / seconds, 1) if seconds else 0.0,
+        "tenants": results,
+    }
+
+    summary_file = summary_file or os.path.join(ensure_log_directory(), f"backup_all_summary_{timestamp}.json")
+    with open(summary_file, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    summary["summary_file"] = summary_file
+    return summary
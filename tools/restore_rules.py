@@ -0,0 +1,315 @@
+"""
+Restore engine for the CrowdStrike Correlation Rules Backup Tool
+
+Pushes the rules of a backup snapshot back into a Falcon tenant. The
+snapshot is compared with the live rules first, so only what differs is
+written:
+
+- rules whose ID is not live any more are created (the API assigns a new ID);
+- rules whose restorable fields differ from the live version are updated,
+  many rules per PATCH request;
+- everything else is left alone.
+
+Writes run in parallel through the same rate-limit aware RequestScheduler
+as the backup. Every rule created is recorded in a restore journal in the
+snapshot folder, mapping its backed-up ID to the new one. Re-running a
+restore, whether after an interruption or later on, therefore updates the
+rules it created before instead of creating them twice.
+"""
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List
+
+from config import Config
+from tools.correlation_rules_backup import iter_rule_pages
+from utils.client_factory import get_session
+from utils.logger import get_log_filename, setup_logger
+from utils.scheduler import RequestScheduler
+from utils.snapshot_diff import Snapshot, find_summary
+from utils.state_index import content_hash
+
+# Fields the create and update endpoints accept; everything else in a backed
+# up rule (ID, timestamps, user, state) is assigned by the API
+RESTORE_FIELDS = (
+    "name", "description", "status", "severity", "search", "operation", "notifications",
+    "guardrail_notifications", "mitre_attack", "comment", "tactic", "technique", "template_id",
+    "trigger_on_create", "anomaly",
+)
+RESTORE_JOURNAL_PATTERN = ".restore_journal_{target}.jsonl"
+
+def restore_payload(rule: Dict[str, Any]) -> Dict[str, Any]:
+    """The restorable fields of a rule"""
+    return {field: rule[field] for field in RESTORE_FIELDS if field in rule}
+
+def load_snapshot_rules(snapshot_dir: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Read every rule of a backup snapshot
+
+    Snapshots with a backup summary are read through it (or the rule
+    manifest written with it), which works for every output format. A files snapshot without a summary (e.g. from an
+    interrupted backup) is read from its rule files directly.
+
+    Returns:
+        Rules by ID, in backup order
+
+    Raises:
+        ValueError: If the folder holds no readable rules
+    """
+    if find_summary(snapshot_dir):
+        with Snapshot(snapshot_dir) as snapshot:
+            return {entry["rule_id"]: snapshot.load_entry(entry) for entry in snapshot.entries()}
+
+    rules = {}
+    for path in sorted(glob.glob(os.path.join(glob.escape(snapshot_dir), "*.json"))):
+        if os.path.basename(path).startswith(("_", ".")):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            rule = json.load(f)
+        if isinstance(rule, dict) and rule.get("id"):
+            rules[rule["id"]] = rule
+    if not rules:
+        raise ValueError(f"No backed up rules found in {snapshot_dir}")
+    return rules
+
+class RestoreJournal:
+    """
+    Append-only record of the rules a restore created in one tenant
+
+    Args:
+        snapshot_dir: Snapshot being restored; the journal lives next to its rules
+        target: Identifies the tenant restored to, so restores of the same
+            snapshot into different tenants keep separate journals
+    """
+
+    def __init__(self, snapshot_dir: str, target: str):
+        self.path = os.path.join(snapshot_dir, RESTORE_JOURNAL_PATTERN.format(target=target))
+        self._file = None
+
+    def load(self) -> Dict[str, str]:
+        """Backed-up rule ID -> ID of the rule created from it"""
+        created = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write at the end of an interrupted run
+                        break
+                    if record.get("type") == "created":
+                        created[record["rule_id"]] = record["new_id"]
+        except OSError:
+            pass
+        return created
+
+    def record_created(self, rule_id: str, new_id: str):
+        """Record a created rule durably before anything else happens"""
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps({"type": "created", "rule_id": rule_id, "new_id": new_id}) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def fetch_live_rules(rules, concurrency: int, scheduler: RequestScheduler) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch every rule currently in the tenant
+
+    Raises:
+        RuntimeError: If a page cannot be fetched
+    """
+    live = {}
+    for offset, response in iter_rule_pages(rules, Config.BACKUP_LIMIT, "*", concurrency, scheduler=scheduler):
+        if response["status_code"] != 200:
+            raise RuntimeError(f"Fetching live rules failed at offset {offset} "
+                               f"(status {response['status_code']}): {response['body'].get('errors')}")
+        for rule in response["body"].get("resources", []):
+            live[rule["id"]] = rule
+    return live
+
+def plan_restore(snapshot_rules: Dict[str, Dict[str, Any]], live_rules: Dict[str, Dict[str, Any]],
+                 created: Dict[str, str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Decide what each backed-up rule needs
+
+    Args:
+        snapshot_rules: Backed-up rules by ID
+        live_rules: Live rules by ID
+        created: Rules created by earlier restores (backed-up ID -> new ID)
+
+    Returns:
+        Dictionary with "create", "update" and "unchanged" lists of
+        {"rule_id", "rule_name", "target_id", "rule"}
+    """
+    plan = {"create": [], "update": [], "unchanged": []}
+    for rule_id, rule in snapshot_rules.items():
+        target_id = rule_id if rule_id in live_rules else created.get(rule_id)
+        if target_id not in live_rules:
+            target_id = None
+        item = {"rule_id": rule_id, "rule_name": rule.get("name"), "target_id": target_id, "rule": rule}
+        if target_id is None:
+            plan["create"].append(item)
+        elif content_hash(restore_payload(rule)) == content_hash(restore_payload(live_rules[target_id])):
+            plan["unchanged"].append(item)
+        else:
+            plan["update"].append(item)
+    return plan
+
+def _batches(items: List[Any], size: int) -> Iterable[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _error_message(response: Dict[str, Any]) -> str:
+    errors = response.get("body", {}).get("errors") or []
+    messages = "; ".join(str(error.get("message", error) if isinstance(error, dict) else error)
+                         for error in errors if error)
+    return f"status {response['status_code']}" + (f": {messages}" if messages else "")
+
+def restore_correlation_rules(client_id, client_secret, cloud_region, snapshot_dir, concurrency=None,
+                              client=None, dry_run=False, batch_size=None, rule_ids=None,
+                              customer_id=None, logger=None):
+    """
+    Restore a backup snapshot into a tenant
+
+    Args:
+        client_id (str): CrowdStrike API client ID
+        client_secret (str): CrowdStrike API client secret
+        cloud_region (str): CrowdStrike cloud region
+        snapshot_dir (str): Date based snapshot directory to restore
+        concurrency (int): API requests in flight (default: from Config.BACKUP_CONCURRENCY)
+        client: Pre-built CorrelationRules compatible client (default: the shared
+            falconpy client from utils.client_factory)
+        dry_run (bool): Only report what would be created and updated
+        batch_size (int): Rules per update request (default: from Config.RESTORE_BATCH_SIZE)
+        rule_ids (list): Only restore these backed-up rule IDs
+        customer_id (str): CID to create rules in (default: the CID recorded in
+            each backed-up rule)
+        logger: Logger to report to (default: a new timestamped log file in logs/)
+
+    Returns:
+        Result dictionary with "created", "updated" and "failed" rules and the
+        number of "unchanged" ones, or None if the snapshot or the live rules
+        could not be read
+    """
+    if logger is None:
+        logger = setup_logger(name="correlation_rules_restore", log_file=get_log_filename("correlation_rules_restore"))
+
+    concurrency = concurrency if concurrency is not None else Config.BACKUP_CONCURRENCY
+    batch_size = max(1, batch_size or Config.RESTORE_BATCH_SIZE)
+    started = time.monotonic()
+    logger.info(f"Starting {'dry run of ' if dry_run else ''}restore from {snapshot_dir}")
+
+    try:
+        snapshot_rules = load_snapshot_rules(snapshot_dir)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Cannot read snapshot: {str(e)}")
+        return None
+    if rule_ids:
+        unknown = set(rule_ids) - set(snapshot_rules)
+        if unknown:
+            logger.warning(f"Rules not in snapshot: {', '.join(sorted(unknown))}")
+        wanted = set(rule_ids)
+        snapshot_rules = {rule_id: rule for rule_id, rule in snapshot_rules.items() if rule_id in wanted}
+    logger.info(f"Snapshot rules: {len(snapshot_rules)}")
+
+    if client is not None:
+        rules = client
+    else:
+        # Writes need the falconpy client; the asyncio client only reads
+        rules = get_session(client_id, client_secret, cloud_region).client
+    scheduler = RequestScheduler(concurrency, logger=logger)
+
+    try:
+        live_rules = fetch_live_rules(rules, concurrency, scheduler)
+    except (RuntimeError, KeyError, TypeError) as e:
+        logger.error(str(e))
+        return None
+    logger.info(f"Live rules: {len(live_rules)}")
+
+    journal = RestoreJournal(snapshot_dir, content_hash([cloud_region, client_id, customer_id])[:12])
+    plan = plan_restore(snapshot_rules, live_rules, journal.load())
+    logger.info(f"To create: {len(plan['create'])}, to update: {len(plan['update'])}, "
+                f"unchanged: {len(plan['unchanged'])}")
+
+    result = {
+        "snapshot": snapshot_dir,
+        "dry_run": dry_run,
+        "snapshot_rules": len(snapshot_rules),
+        "live_rules": len(live_rules),
+        "created": [],
+        "updated": [],
+        "unchanged": len(plan["unchanged"]),
+        "failed": [],
+        "seconds": 0.0,
+        "request_stats": None,
+    }
+    if dry_run:
+        result["created"] = [{"rule_id": item["rule_id"], "rule_name": item["rule_name"], "new_id": None}
+                             for item in plan["create"]]
+        result["updated"] = [{"rule_id": item["rule_id"], "rule_name": item["rule_name"],
+                              "target_id": item["target_id"]} for item in plan["update"]]
+        result["seconds"] = round(time.monotonic() - started, 3)
+        return result
+
+    def create(item):
+        body = restore_payload(item["rule"])
+        body["customer_id"] = customer_id or item["rule"].get("customer_id")
+        # A create that failed with a 5xx or timed out may still have created the rule, so only
+        # throttled creates are retried; anything else is reported for the operator to check
+        return scheduler.call(lambda: rules.create_rule(body=body), f"create of {item['rule_id']}",
+                              idempotent=False)
+
+    def update(batch):
+        body = [{**restore_payload(item["rule"]), "id": item["target_id"]} for item in batch]
+        return scheduler.call(lambda: rules.update_rule(body=body), f"update of {len(batch)} rules")
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    futures = {}
+    try:
+        futures.update({executor.submit(update, batch): ("update", batch)
+                        for batch in _batches(plan["update"], batch_size)})
+        futures.update({executor.submit(create, item): ("create", [item]) for item in plan["create"]})
+        for future in as_completed(futures):
+            kind, items = futures[future]
+            try:
+                response = future.result()
+                error = None if response["status_code"] in (200, 201) else _error_message(response)
+            except Exception as e:
+                response, error = None, f"{type(e).__name__}: {str(e)}"
+            if error:
+                logger.error(f"Failed to {kind} {len(items)} rule(s): {error}")
+                result["failed"].extend({"rule_id": item["rule_id"], "rule_name": item["rule_name"],
+                                         "action": kind, "error": error} for item in items)
+                continue
+            if kind == "create":
+                item = items[0]
+                resources = response["body"].get("resources") or [{}]
+                new_id = resources[0].get("id") if isinstance(resources[0], dict) else resources[0]
+                if new_id:
+                    journal.record_created(item["rule_id"], new_id)
+                result["created"].append({"rule_id": item["rule_id"], "rule_name": item["rule_name"],
+                                          "new_id": new_id})
+            else:
+                result["updated"].extend({"rule_id": item["rule_id"], "rule_name": item["rule_name"],
+                                          "target_id": item["target_id"]} for item in items)
+    finally:
+        # On an interruption, drop queued writes so nothing is created
+        # without being journaled (shutdown(cancel_futures=True) needs Python 3.9)
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        journal.close()
+
+    result["seconds"] = round(time.monotonic() - started, 3)
+    result["request_stats"] = dict(scheduler.stats)
+    logger.info(f"Restore finished in {result['seconds']:.1f}s: {len(result['created'])} created, "
+                f"{len(result['updated'])} updated, {result['unchanged']} unchanged, "
+                f"{len(result['failed'])} failed")
+    return result
@@ -0,0 +1,239 @@
+"""
+Backup integrity verification for the CrowdStrike Correlation Rules Backup Tool
+
+Every backup summary records the SHA-256 of each file the backup wrote:
+rule files (file_sha256 on their entries), API page files (page_files),
+archives and their indexes, the object store manifest and the rule
+manifest. Object store blobs are named by the SHA-256 of their bytes.
+
+verify_backups() re-hashes those files in a thread pool and reports per
+snapshot which files are missing, which no longer match their recorded
+hash or size, and which files in the folder the summary does not list.
+Blobs shared by several snapshots are hashed once per run. Entries from
+backups that predate file hashes are only checked for existence and size.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import Config
+from utils.object_store import get_object_store
+from utils.snapshot_diff import find_summary
+from tools.cleanup_backups import parse_backup_date
+
+VERIFY_CHUNK_SIZE = 64  # Files hashed per worker task
+
+# (path relative to the snapshot, absolute path, expected SHA-256 or None, expected size or None)
+Check = Tuple[str, str, Optional[str], Optional[int]]
+
+_buffers = threading.local()
+
+def file_sha256(path: str, buffer_size: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Hash a file with unbuffered reads into a reusable per-thread buffer
+
+    hashlib releases the GIL while hashing large chunks, so several threads
+    hash in parallel.
+
+    Returns:
+        Tuple of (hex digest, bytes read)
+    """
+    buffer_size = buffer_size or Config.VERIFY_BUFFER_SIZE
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None or len(buffer) != buffer_size:
+        buffer = _buffers.buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            count = f.readinto(view)
+            if not count:
+                break
+            digest.update(view[:count])
+            size += count
+    return digest.hexdigest(), size
+
+def check_file(check: Check) -> Tuple[str, int]:
+    """
+    Verify one file
+
+    Returns:
+        Tuple of (status, bytes read) where status is "ok", "missing",
+        "corrupted" or "unhashed" (present, but no hash was recorded)
+    """
+    _, path, expected_hash, expected_size = check
+    try:
+        if expected_hash is None:
+            size = os.stat(path).st_size
+            if expected_size is not None and size != expected_size:
+                return "corrupted", 0
+            return "unhashed", 0
+        digest, size = file_sha256(path)
+    except FileNotFoundError:
+        return "missing", 0
+    except OSError:
+        return "corrupted", 0
+    if digest != expected_hash or (expected_size is not None and size != expected_size):
+        return "corrupted", size
+    return "ok", size
+
+def _check_chunk(chunk: List[Check]) -> List[Tuple[str, int]]:
+    return [check_file(check) for check in chunk]
+
+def snapshot_checks(snapshot_dir: str, summary: Dict[str, Any]) -> Tuple[List[Check], List[Check]]:
+    """
+    List the files a snapshot's summary says it holds
+
+    Returns:
+        Tuple of (files inside the snapshot folder, object store blobs)
+    """
+    files: Dict[str, Check] = {}
+    blobs: Dict[str, Check] = {}
+
+    def add(name: Optional[str], expected_hash: Optional[str], expected_size: Optional[int] = None):
+        if name:
+            files[name] = (name, os.path.join(snapshot_dir, name), expected_hash, expected_size)
+
+    store = None
+    for entry in summary.get("saved_rules", []):
+        if entry.get("object"):
+            store = store or get_object_store(os.path.dirname(os.path.abspath(snapshot_dir)))
+            digest = entry["object"]
+            blobs[digest] = (f"object {digest}", store.object_path(digest), digest, entry.get("file_size"))
+        elif not entry.get("archive"):
+            # Rules inside an archive are covered by the archive's hash
+            add(entry.get("filename"), entry.get("file_sha256"), entry.get("file_size"))
+    for page in summary.get("page_files", []):
+        add(page["filename"], page.get("sha256"), page.get("file_size"))
+    add(summary.get("archive"), summary.get("archive_sha256"))
+    add(summary.get("archive_index"), summary.get("archive_index_sha256"))
+    add(summary.get("manifest"), summary.get("manifest_sha256"))
+    add(summary.get("rule_manifest"), summary.get("rule_manifest_sha256"))
+    return list(files.values()), list(blobs.values())
+
+def extra_files(snapshot_dir: str, listed: Iterable[str]) -> List[str]:
+    """
+    Files in a snapshot folder its summary does not list
+
+    Names starting with "_" or "." are the snapshot's own bookkeeping
+    (summaries, manifests, checkpoint and restore journals) and are skipped
+    unless the summary lists them.
+    """
+    listed = set(listed)
+    with os.scandir(snapshot_dir) as entries:
+        return sorted(entry.name for entry in entries
+                      if entry.is_file() and entry.name not in listed and not entry.name.startswith(("_", ".")))
+
+def find_snapshots(base_dir: str, snapshot: str = "all") -> List[str]:
+    """
+    Resolve the snapshots to verify
+
+    Args:
+        base_dir: Base backup directory
+        snapshot: "all", a backup date (YYYY-MM-DD) under base_dir, or the path of a date folder
+
+    Returns:
+        Snapshot directories, oldest first
+    """
+    if snapshot != "all":
+        snapshot_dir = snapshot if os.path.isdir(snapshot) else os.path.join(base_dir, snapshot)
+        return [snapshot_dir] if os.path.isdir(snapshot_dir) else []
+    if not os.path.isdir(base_dir):
+        return []
+    with os.scandir(base_dir) as entries:
+        return sorted(entry.path for entry in entries if entry.is_dir() and parse_backup_date(entry.name))
+
+def _bounded(executor: ThreadPoolExecutor, tasks: Iterable[Tuple[Any, List[Check]]],
+             window: int) -> Iterator[Tuple[Any, List[Check], List[Tuple[str, int]]]]:
+    """Run (key, chunk) tasks keeping at most window chunks in flight, yielding results in order"""
+    pending = deque()
+    for key, chunk in tasks:
+        pending.append((key, chunk, executor.submit(_check_chunk, chunk)))
+        if len(pending) >= window:
+            key, chunk, future = pending.popleft()
+            yield key, chunk, future.result()
+    while pending:
+        key, chunk, future = pending.popleft()
+        yield key, chunk, future.result()
+
+def verify_backups(base_dir: str, snapshot: str = "all", workers: Optional[int] = None,
+                   logger=None) -> Dict[str, Any]:
+    """
+    Re-hash the files of one or all snapshots and compare them to their summaries
+
+    Snapshots are read one after another, but their files go through one
+    pool, so the disk is kept busy across snapshot boundaries.
+
+    Args:
+        base_dir: Base backup directory
+        snapshot: "all", a backup date or a date folder path
+        workers: Files hashed in parallel (default: Config.VERIFY_WORKERS)
+        logger: Logger for per-file problems (optional)
+
+    Returns:
+        Dictionary with a "snapshots" list (each with its "missing",
+        "corrupted" and "extra" files, "unhashed" count and any "error"),
+        totals of "files" and "bytes" checked, "seconds",
+        "bytes_per_second" and "ok" (no missing or corrupted files and
+        every summary readable)
+    """
+    workers = max(1, workers or Config.VERIFY_WORKERS)
+    start = time.perf_counter()
+    results = []
+    hashed_blobs = set()
+
+    def plan() -> Iterator[Tuple[Dict[str, Any], List[Check]]]:
+        for snapshot_dir in find_snapshots(base_dir, snapshot):
+            result = {"snapshot": os.path.basename(os.path.normpath(snapshot_dir)), "path": snapshot_dir,
+                      "summary": None, "files": 0, "bytes": 0, "missing": [], "corrupted": [], "extra": [],
+                      "unhashed": 0, "error": None}
+            results.append(result)
+            summary_path = find_summary(snapshot_dir)
+            if summary_path is None:
+                result["error"] = f"No backup summary found in {snapshot_dir}"
+                continue
+            try:
+                with open(summary_path, "r", encoding="utf-8") as f:
+                    summary = json.load(f)
+            except (OSError, ValueError) as e:
+                result["error"] = f"Cannot read {summary_path}: {str(e)}"
+                continue
+            result["summary"] = os.path.basename(summary_path)
+            files, blobs = snapshot_checks(snapshot_dir, summary)
+            del summary
+            result["extra"] = extra_files(snapshot_dir, [name for name, _, _, _ in files])
+            # Blobs shared with an earlier snapshot were hashed already
+            blobs = [check for check in blobs if check[2] not in hashed_blobs]
+            hashed_blobs.update(check[2] for check in blobs)
+            checks = files + blobs
+            for index in range(0, len(checks), VERIFY_CHUNK_SIZE):
+                yield result, checks[index:index + VERIFY_CHUNK_SIZE]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for result, chunk, outcomes in _bounded(executor, plan(), workers * 2):
+            for (name, _, _, _), (status, size) in zip(chunk, outcomes):
+                result["files"] += 1
+                result["bytes"] += size
+                if status == "unhashed":
+                    result["unhashed"] += 1
+                elif status != "ok":
+                    result[status].append(name)
+                    if logger:
+                        logger.error(f"{result['snapshot']}: {status} {name}")
+
+    seconds = time.perf_counter() - start
+    total_bytes = sum(result["bytes"] for result in results)
+    return {
+        "snapshots": results,
+        "files": sum(result["files"] for result in results),
+        "bytes": total_bytes,
+        "seconds": round(seconds, 3),
+        "bytes_per_second": round(total_bytes / seconds, 1) if seconds else 0.0,
+        "ok": all(not result["missing"] and not result["corrupted"] and not result["error"] for result in results),
+    }
@@ -0,0 +1,362 @@
+"""
+Watch mode for the CrowdStrike Correlation Rules Backup Tool
+
+A long-running alternative to an hourly cron job. The watcher keeps one
+authenticated client (and its token) for its whole lifetime and polls the
+tenant every interval with a single request for one rule:
+
+    get_rules_combined(limit=1, filter=<filter>, sort="last_updated_on|desc")
+
+The newest rule's last_updated_on shows whether anything was created or
+updated since the last snapshot, and the pagination total shows whether
+rules were deleted. Only then does it run a backup (incremental for the
+files format), so an unchanged tenant costs one small request per interval
+instead of a full listing of every rule.
+
+The watcher's state is a handful of numbers: the watermark, the known rule
+count, the IDs last updated at exactly the watermark and the timings of the
+last backup. Backup summaries are dropped as soon as that state has been
+taken from them, so memory stays flat however long the process runs.
+
+An optional HTTP endpoint serves /healthz (JSON, 503 when polls keep
+failing or have stalled) and /metrics (Prometheus text format).
+"""
+import gc
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Set
+
+from config import Config
+from tools.correlation_rules_backup import backup_all_correlation_rules
+from utils.metrics import METRIC_PREFIX, format_prometheus
+from utils.scheduler import RequestScheduler
+from utils.state_index import load_state_index
+
+# Consecutive failed polls after which /healthz reports unhealthy
+UNHEALTHY_AFTER_FAILURES = 3
+
+# Newest rule first, so one rule per poll shows whether anything changed
+POLL_SORT = "last_updated_on|desc"
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, None where /proc is unavailable"""
+    try:
+        import resource
+        with open("/proc/self/statm", "r", encoding="ascii") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ImportError, ValueError, IndexError):
+        return None
+
+class RuleWatcher:
+    """
+    Poll a tenant for rule changes and back it up when something changed
+
+    Args:
+        client_id: CrowdStrike API client ID
+        client_secret: CrowdStrike API client secret
+        cloud_region: CrowdStrike cloud region
+        backup_filter: FQL filter (default: from Config.BACKUP_FILTER)
+        output_dir: Base backup directory (default: from Config.BASE_EXPORT_DIR)
+        interval: Seconds between polls (default: from Config.WATCH_INTERVAL)
+        output_format: Output layout (default: from Config.OUTPUT_FORMAT)
+        concurrency: Pages fetched in parallel during backups
+        client: Pre-built CorrelationRules compatible client (default: the
+            shared client from utils.client_factory)
+        logger: Logger for the watcher and its backups
+        metrics_file: Prometheus textfile each backup writes its timings to
+    """
+
+    def __init__(self, client_id: Optional[str], client_secret: Optional[str], cloud_region: Optional[str],
+                 backup_filter: Optional[str] = None, output_dir: Optional[str] = None,
+                 interval: Optional[float] = None, output_format: Optional[str] = None,
+                 concurrency: Optional[int] = None, client: Any = None, logger=None,
+                 metrics_file: Optional[str] = None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.cloud_region = cloud_region or Config.FALCON_CLOUD_REGION
+        self.filter = backup_filter if backup_filter is not None else Config.BACKUP_FILTER
+        self.output_dir = output_dir or Config.BASE_EXPORT_DIR
+        self.interval = interval if interval is not None else Config.WATCH_INTERVAL
+        self.output_format = output_format or Config.OUTPUT_FORMAT
+        self.concurrency = concurrency
+        self.client = client
+        self.logger = logger
+        self.metrics_file = metrics_file
+        self.started = time.time()
+
+        # Tenant state as of the last snapshot
+        self.watermark: Optional[str] = None
+        self.rule_count: Optional[int] = None
+        self.at_watermark: Set[str] = set()
+        # Rule count the last poll saw, kept when a backup leaves nothing to remember
+        self.polled_count: Optional[int] = None
+
+        self.counters = {"polls": 0, "poll_failures": 0, "changes": 0, "backups": 0, "backup_failures": 0}
+        self.consecutive_failures = 0
+        self.last_poll: Optional[float] = None
+        self.last_change: Optional[float] = None
+        self.last_backup: Optional[float] = None
+        self.last_timings: Optional[Dict[str, Any]] = None
+        self.last_request_stats: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+        self._seed_from_state_index()
+
+    def _log(self, level: str, message: str):
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    def _rules(self):
+        if self.client is None:
+            from utils.client_factory import get_session
+            self.client = get_session(self.client_id, self.client_secret, self.cloud_region).client
+        return self.client
+
+    def _seed_from_state_index(self):
+        """Start from the last files-format snapshot, so a restart does not force a full backup"""
+        if self.output_format != "files":
+            return
+        state_index = load_state_index(self.output_dir)
+        if not state_index or state_index.get("filter") != self.filter:
+            return
+        self._remember(state_index.get("high_watermark") or "", state_index.get("rules", {}).values())
+        self._log("info", f"Watching from snapshot {state_index.get('snapshot_date')}: {self.rule_count} rules, "
+                          f"watermark {self.watermark}")
+
+    def _remember(self, watermark: Optional[str], entries):
+        """Keep only what the next poll needs from a snapshot's rule entries"""
+        count = 0
+        at_watermark = set()
+        for entry in entries:
+            count += 1
+            if watermark and entry.get("last_updated_on") == watermark:
+                at_watermark.add(entry["rule_id"])
+        with self._lock:
+            self.watermark, self.rule_count, self.at_watermark = watermark, count, at_watermark
+
+    def poll(self) -> Optional[str]:
+        """
+        Check the tenant for changes since the last snapshot
+
+        Returns:
+            A description of the change, or None if nothing changed
+
+        Raises:
+            RuntimeError: If the API request failed
+        """
+        rules = self._rules()
+        scheduler = RequestScheduler(1, logger=self.logger)
+        response = scheduler.call(lambda: rules.get_rules_combined(limit=1, offset=0, filter=self.filter,
+                                                                   sort=POLL_SORT), "poll")
+        if response.get("status_code") != 200:
+            errors = response.get("body", {}).get("errors") or []
+            message = errors[0].get("message", "") if errors and isinstance(errors[0], dict) else ""
+            raise RuntimeError(f"API returned status {response.get('status_code')} {message}".rstrip())
+
+        body = response["body"]
+        total = body.get("meta", {}).get("pagination", {}).get("total")
+        if total is None:
+            total = len(body.get("resources") or [])
+        with self._lock:
+            self.polled_count = total
+        if self.watermark is None or self.rule_count is None:
+            return "no previous snapshot"
+
+        newest = (body.get("resources") or [None])[0]
+        if newest is not None:
+            updated = newest.get("last_updated_on") or ""
+            if updated and (updated > self.watermark or
+                            (updated == self.watermark and newest.get("id") not in self.at_watermark)):
+                return f"rule {newest.get('id')} updated at {updated}"
+        if total != self.rule_count:
+            return f"rule count changed from {self.rule_count} to {total}"
+        return None
+
+    def backup(self) -> bool:
+        """Run a backup and take the next poll's state from its summary"""
+        summary = backup_all_correlation_rules(
+            self.client_id, self.client_secret, self.cloud_region, self.filter,
+            concurrency=self.concurrency, output_dir=self.output_dir, client=self.client,
+            incremental=self.output_format == "files", output_format=self.output_format,
+            logger=self.logger, metrics_file=self.metrics_file
+        )
+        if summary is None:
+            if self.polled_count == 0:
+                # An empty tenant writes no snapshot; wait for a rule to appear instead of retrying every poll
+                self._remember("", [])
+            return False
+        entries = summary.get("saved_rules", [])
+        watermarks = [entry["last_updated_on"] for entry in entries
+                      if entry.get("last_updated_on") and entry["last_updated_on"] != "Not found"]
+        # An empty watermark still lets the count and any dated rule trigger the next backup
+        self._remember(max(watermarks) if watermarks else "", entries)
+        with self._lock:
+            self.last_backup = time.time()
+            self.last_timings = summary.get("timings")
+            self.last_request_stats = summary.get("request_stats")
+        return True
+
+    def run_once(self) -> bool:
+        """
+        Poll once and back up if the tenant changed
+
+        Returns:
+            True if a backup was written
+        """
+        try:
+            change = self.poll()
+        except Exception as e:
+            with self._lock:
+                self.counters["polls"] += 1
+                self.counters["poll_failures"] += 1
+                self.consecutive_failures += 1
+                self.last_error = str(e)
+            self._log("error", f"Poll failed: {str(e)}")
+            return False
+        with self._lock:
+            self.counters["polls"] += 1
+            self.consecutive_failures = 0
+            self.last_poll = time.time()
+        if change is None:
+            self._log("debug", "No changes")
+            return False
+
+        self._log("info", f"Change detected ({change}), starting backup")
+        with self._lock:
+            self.counters["changes"] += 1
+            self.last_change = time.time()
+        try:
+            written = self.backup()
+        except Exception as e:
+            self._log("error", f"Backup failed: {str(e)}")
+            written = False
+        finally:
+            # Return the summary's memory before the process sleeps again
+            gc.collect()
+        with self._lock:
+            if written:
+                self.counters["backups"] += 1
+                self.last_error = None
+            else:
+                self.counters["backup_failures"] += 1
+                self.last_error = "backup did not complete"
+        return written
+
+    def run(self, stop: threading.Event, max_polls: Optional[int] = None):
+        """
+        Poll every interval until stop is set
+
+        A backup in progress is finished before the loop exits.
+
+        Args:
+            stop: Event that ends the loop, e.g. set from a signal handler
+            max_polls: Stop after this many polls (default: run until stopped)
+        """
+        self._log("info", f"Watching {self.cloud_region} every {self.interval:g}s with filter {self.filter}")
+        polls = 0
+        while not stop.is_set():
+            started = time.monotonic()
+            self.run_once()
+            polls += 1
+            if max_polls is not None and polls >= max_polls:
+                break
+            stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+        self._log("info", "Watcher stopped")
+
+    def _healthy(self, now: float) -> bool:
+        # Caller holds self._lock; a poll is overdue after three missed intervals
+        last_success = self.last_poll or self.started
+        return (self.consecutive_failures < UNHEALTHY_AFTER_FAILURES
+                and now - last_success <= max(3 * self.interval, 60))
+
+    def health(self) -> Dict[str, Any]:
+        """Health report for /healthz; "healthy" is False when polls keep failing or have stalled"""
+        now = time.time()
+        with self._lock:
+            return {
+                "healthy": self._healthy(now),
+                "uptime_seconds": round(now - self.started, 1),
+                "interval_seconds": self.interval,
+                "consecutive_failures": self.consecutive_failures,
+                "last_poll": _isoformat(self.last_poll),
+                "last_change": _isoformat(self.last_change),
+                "last_backup": _isoformat(self.last_backup),
+                "last_error": self.last_error,
+                "rules": self.rule_count,
+                "watermark": self.watermark,
+                **self.counters,
+            }
+
+    def prometheus(self) -> str:
+        """Watcher counters, plus the last backup's timings, in the Prometheus text format"""
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = {
+                "watch_up": 1 if self._healthy(time.time()) else 0,
+                "watch_uptime_seconds": round(time.time() - self.started, 1),
+                "watch_last_poll_timestamp_seconds": self.last_poll,
+                "watch_last_change_timestamp_seconds": self.last_change,
+                "watch_known_rules": self.rule_count,
+                "process_resident_memory_bytes": current_rss_bytes(),
+            }
+            timings, request_stats, last_backup = self.last_timings, self.last_request_stats, self.last_backup
+        lines = []
+        for name, value in counters.items():
+            lines += [f"# TYPE {METRIC_PREFIX}_watch_{name}_total counter",
+                      f"{METRIC_PREFIX}_watch_{name}_total {value}"]
+        for name, value in gauges.items():
+            if value is not None:
+                lines += [f"# TYPE {METRIC_PREFIX}_{name} gauge", f"{METRIC_PREFIX}_{name} {value}"]
+        text = "\n".join(lines) + "\n"
+        if timings:
+            text += format_prometheus(timings, request_stats, timestamp=last_backup)
+        return text
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
+
+def start_health_server(watcher: RuleWatcher, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Serve /healthz and /metrics for a watcher from a background thread
+
+    Args:
+        watcher: The RuleWatcher to report on
+        host: Address to bind
+        port: Port to bind (0 picks a free port, see server.server_address)
+
+    Returns:
+        The running server; call shutdown() to stop it
+    """
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path in ("/healthz", "/health"):
+                report = watcher.health()
+                body = json.dumps(report).encode("utf-8")
+                status, content_type = (200 if report["healthy"] else 503), "application/json"
+            elif path == "/metrics":
+                body = watcher.prometheus().encode("utf-8")
+                status, content_type = 200, "text/plain; version=0.0.4"
+            else:
+                body, status, content_type = b"Not found\n", 404, "text/plain"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would flood the log
+            pass
+
+    server = ThreadingHTTPServer((host, port), HealthHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="watch-health", daemon=True).start()
+    return server
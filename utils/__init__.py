@@ -2,14 +2,42 @@
 Utility modules for the CrowdStrike Correlation Rules Backup Tool
 """
 
+import importlib
+
 from .logger import setup_logger, get_log_filename
-from .validators import (
-    ValidationError,
-    validate_api_credentials,
-    validate_directory_path,
-    validate_rule_data,
-    sanitize_filename
-)
+
+# Everything else is imported on first access, so importing utils (or a
+# light module such as utils.logger) does not load falconpy, aiohttp or the
+# JSON backends
+_LAZY_EXPORTS = {
+    'ValidationError': 'validators',
+    'validate_api_credentials': 'validators',
+    'validate_directory_path': 'validators',
+    'validate_rule_data': 'validators',
+    'sanitize_filename': 'validators',
+    'content_hash': 'state_index',
+    'load_state_index': 'state_index',
+    'save_state_index': 'state_index',
+    'build_state_index': 'state_index',
+    'ObjectStore': 'object_store',
+    'get_object_store': 'object_store',
+    'collect_garbage': 'object_store',
+    'save_json': 'writers',
+    'get_writer': 'writers',
+    'TokenCache': 'client_factory',
+    'get_session': 'client_factory',
+}
+
+def __getattr__(name):
+    module = _LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_EXPORTS))
 
 __all__ = [
     'setup_logger',
@@ -18,5 +46,16 @@ __all__ = [
     'validate_api_credentials',
     'validate_directory_path',
     'validate_rule_data',
-    'sanitize_filename'
+    'sanitize_filename',
+    'content_hash',
+    'load_state_index',
+    'save_state_index',
+    'build_state_index',
+    'ObjectStore',
+    'get_object_store',
+    'collect_garbage',
+    'save_json',
+    'get_writer',
+    'TokenCache',
+    'get_session'
 ] 
\ No newline at end of file
@@ -0,0 +1,289 @@
+"""
+Single-file archive output formats for correlation rule backups
+
+Both formats are written as a stream into one file per snapshot with a
+single fsync at the end, plus a small sidecar index (<archive>.idx.json)
+that lets a single rule be extracted without reading the whole archive:
+
+- jsonl: JSON Lines compressed in independent gzip (or zstd) blocks; the
+  index maps each rule ID to its block and line
+- tar: an uncompressed tar of per-rule JSON files; the index maps each rule
+  ID to the byte offset and size of its member data
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import tarfile
+import time
+from typing import Any, Dict, Optional
+
+from config import Config
+from .serializers import get_default_serializer
+
+try:
+    import zstandard
+except ImportError:  # zstd output is optional
+    zstandard = None
+
+INDEX_SUFFIX = ".idx.json"
+INDEX_VERSION = 1
+ARCHIVE_PREFIX = "snapshot_"
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+def compress_block(data: bytes, compression: str) -> bytes:
+    """Compress one independently decodable block"""
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+def decompress_block(data: bytes, compression: str) -> bytes:
+    """Decompress one block written by compress_block"""
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstandard is required to read zstd archives (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+class _HashingFile:
+    """Binary file wrapper that hashes everything written through it"""
+
+    def __init__(self, file):
+        self._file = file
+        self.hash = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.hash.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class _StreamingArchive:
+    """Shared bookkeeping for archives written to a temporary file and renamed on close"""
+
+    def __init__(self, export_dir: str, logger):
+        self.export_dir = export_dir
+        self.logger = logger
+        self.pages = []
+        self.rules: Dict[str, Any] = {}
+        self.files_written = 0
+        self._file = None
+        self.archive_name = None
+
+    def _open(self, current_time: str, extension: str):
+        self.archive_name = f"{ARCHIVE_PREFIX}{current_time}{extension}"
+        self.archive_path = os.path.join(self.export_dir, self.archive_name)
+        self._temp_path = f"{self.archive_path}.partial"
+        self._file = _HashingFile(open(self._temp_path, "wb"))
+
+    def write_page(self, offset: int, response: Dict[str, Any], current_time: str) -> bool:
+        """Record page metadata and the IDs of the rules it contained in the index"""
+        if self._file is None:
+            self._open(current_time, self.extension)
+        body = response.get("body", {})
+        self.pages.append({
+            "offset": offset,
+            "status_code": response.get("status_code"),
+            "meta": body.get("meta", {}),
+            "errors": body.get("errors", []),
+            "rule_ids": [rule.get("id") for rule in body.get("resources", []) or []],
+            "timestamp": current_time
+        })
+        return True
+
+    def _finish(self, index: Dict[str, Any]) -> Dict[str, Any]:
+        # One fsync for the whole archive, then publish it under its final name
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._temp_path, self.archive_path)
+
+        index_path = self.archive_path + INDEX_SUFFIX
+        index_data = json.dumps(index, separators=(",", ":")).encode("utf-8")
+        with open(f"{index_path}.tmp", "wb") as f:
+            f.write(index_data)
+        os.replace(f"{index_path}.tmp", index_path)
+        self.files_written += 2
+
+        self.logger.info(f"Archive saved: {self.archive_path} ({os.path.getsize(self.archive_path)} bytes)")
+        self.logger.info(f"Archive index saved: {index_path}")
+        return {
+            "archive": self.archive_name,
+            "archive_sha256": self._file.hash.hexdigest(),
+            "archive_index": os.path.basename(index_path),
+            "archive_index_sha256": hashlib.sha256(index_data).hexdigest()
+        }
+
+class JsonlArchiveWriter(_StreamingArchive):
+    """
+    Write every rule as one line of a block-compressed JSON Lines file
+    
+    Concatenated gzip members (and zstd frames) form a valid stream, so the
+    archive can still be read end to end with zcat/zstdcat.
+    
+    Args:
+        base_dir: Base backup directory
+        export_dir: Date based snapshot directory
+        logger: Logger for progress messages
+        compression: "gzip" or "zstd" (default: from Config.ARCHIVE_COMPRESSION)
+        block_size: Uncompressed bytes per independently compressed block
+    """
+    format_name = "jsonl"
+
+    def __init__(self, base_dir: str, export_dir: str, logger, compression: Optional[str] = None,
+                 block_size: Optional[int] = None):
+        super().__init__(export_dir, logger)
+        self.compression = compression or Config.ARCHIVE_COMPRESSION
+        if self.compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"Unknown compression: {self.compression}")
+        if self.compression == "zstd" and zstandard is None:
+            raise ImportError("zstandard is required for zstd compression (pip install zstandard)")
+        self.block_size = block_size or Config.ARCHIVE_BLOCK_SIZE
+        self.serializer = get_default_serializer(compact=True)
+        self.extension = ".jsonl" + COMPRESSION_EXTENSIONS[self.compression]
+        self.blocks = []
+        self._block = []
+        self._block_bytes = 0
+        self._position = 0
+
+    def _flush_block(self):
+        if not self._block:
+            return
+        data = compress_block(b"".join(self._block), self.compression)
+        self._file.write(data)
+        self.blocks.append([self._position, len(data)])
+        self._position += len(data)
+        self._block = []
+        self._block_bytes = 0
+
+    def write_rule(self, rule: Dict[str, Any], filename: str, rule_hash: str) -> Optional[Dict[str, Any]]:
+        """Append a rule as one JSON line"""
+        line = self.serializer.dumps(rule) + b"\n"
+        try:
+            self.rules[rule["id"]] = [len(self.blocks), len(self._block)]
+            self._block.append(line)
+            self._block_bytes += len(line)
+            if self._block_bytes >= self.block_size:
+                self._flush_block()
+        except OSError as e:
+            self.logger.error(f"Error writing archive {self.archive_path}: {str(e)}")
+            return None
+        return {"filename": None, "archive": self.archive_name, "file_size": len(line)}
+
+    def close(self, current_time: str) -> Dict[str, Any]:
+        """Flush the last block, fsync the archive and write its index"""
+        if self._file is None:
+            self._open(current_time, self.extension)
+        self._flush_block()
+        return self._finish({
+            "version": INDEX_VERSION,
+            "format": self.format_name,
+            "compression": self.compression,
+            "blocks": self.blocks,
+            "rules": self.rules,
+            "pages": self.pages
+        })
+
+class TarArchiveWriter(_StreamingArchive):
+    """
+    Write every rule as a JSON member of one uncompressed tar archive
+    
+    The tar is left uncompressed so member data can be read directly at the
+    offset recorded in the index.
+    
+    Args:
+        base_dir: Base backup directory
+        export_dir: Date based snapshot directory
+        logger: Logger for progress messages
+    """
+    format_name = "tar"
+    extension = ".tar"
+
+    def __init__(self, base_dir: str, export_dir: str, logger):
+        super().__init__(export_dir, logger)
+        self._tar = None
+        self.serializer = get_default_serializer()
+
+    def _ensure_open(self, current_time: str):
+        if self._file is None:
+            self._open(current_time, self.extension)
+        if self._tar is None:
+            self._tar = tarfile.open(fileobj=self._file, mode="w", format=tarfile.PAX_FORMAT)
+
+    def write_page(self, offset: int, response: Dict[str, Any], current_time: str) -> bool:
+        """Record page metadata and the IDs of the rules it contained in the index"""
+        super().write_page(offset, response, current_time)
+        self._ensure_open(current_time)
+        return True
+
+    def write_rule(self, rule: Dict[str, Any], filename: str, rule_hash: str) -> Optional[Dict[str, Any]]:
+        """Append a rule as a tar member named like its per-file counterpart"""
+        data = self.serializer.dumps(rule)
+        info = tarfile.TarInfo(name=filename)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        try:
+            header = info.tobuf(self._tar.format, self._tar.encoding, self._tar.errors)
+            data_offset = self._tar.offset + len(header)
+            self._tar.addfile(info, io.BytesIO(data))
+        except OSError as e:
+            self.logger.error(f"Error writing archive {self.archive_path}: {str(e)}")
+            return None
+        self.rules[rule["id"]] = {"name": filename, "offset": data_offset, "size": len(data)}
+        return {"filename": filename, "archive": self.archive_name, "file_size": len(data)}
+
+    def close(self, current_time: str) -> Dict[str, Any]:
+        """Finish the tar, fsync it and write its index"""
+        self._ensure_open(current_time)
+        self._tar.close()
+        return self._finish({
+            "version": INDEX_VERSION,
+            "format": self.format_name,
+            "rules": self.rules,
+            "pages": self.pages
+        })
+
+def load_archive_index(archive_path: str) -> Dict[str, Any]:
+    """Load the sidecar index of an archive"""
+    with open(archive_path + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def find_archive(snapshot_dir: str) -> Optional[str]:
+    """Return the newest archive in a snapshot directory, if any"""
+    archives = sorted(
+        name for name in os.listdir(snapshot_dir)
+        if name.startswith(ARCHIVE_PREFIX) and not name.endswith((INDEX_SUFFIX, ".partial", ".tmp"))
+    )
+    return os.path.join(snapshot_dir, archives[-1]) if archives else None
+
+def extract_rule(archive_path: str, rule_id: str, index: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Read a single rule from an archive using its seek index
+    
+    Args:
+        archive_path: Path to a jsonl or tar archive
+        rule_id: ID of the rule to extract
+        index: The archive's already loaded index, when extracting several
+            rules (default: read it from the sidecar file)
+        
+    Returns:
+        The rule, or None if the archive does not contain it
+    """
+    index = index if index is not None else load_archive_index(archive_path)
+    location = index["rules"].get(rule_id)
+    if location is None:
+        return None
+
+    with open(archive_path, "rb") as f:
+        if index["format"] == TarArchiveWriter.format_name:
+            f.seek(location["offset"])
+            return json.loads(f.read(location["size"]))
+
+        block_number, line_number = location
+        block_offset, block_length = index["blocks"][block_number]
+        f.seek(block_offset)
+        block = decompress_block(f.read(block_length), index["compression"])
+    return json.loads(block.splitlines()[line_number])
@@ -0,0 +1,163 @@
+"""
+Asyncio client for the Falcon correlation rules endpoints
+
+One pooled aiohttp session with keep-alive serves every request and a
+single OAuth2 token is shared across all of them (and across sessions),
+so many page requests can be awaited concurrently without paying a TLS
+handshake or token exchange per request. Responses use the same
+{"status_code", "headers", "body"} shape as falconpy.
+
+Requires the optional aiohttp package.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import aiohttp
+except ImportError:  # async client is optional
+    aiohttp = None
+
+CLOUD_BASE_URLS = {
+    "us-1": "https://api.crowdstrike.com",
+    "us-2": "https://api.us-2.crowdstrike.com",
+    "us-3": "https://api.us-3.crowdstrike.com",
+    "eu-1": "https://api.eu-1.crowdstrike.com",
+    "us-gov-1": "https://api.laggar.gcw.crowdstrike.com",
+    "us-gov-2": "https://api.us-gov-2.crowdstrike.mil",
+}
+
+TOKEN_PATH = "/oauth2/token"
+COMBINED_RULES_PATH = "/correlation-rules/combined/rules/v1"
+QUERY_RULES_PATH = "/correlation-rules/queries/rules/v1"
+
+# Refresh the token this many seconds before it actually expires
+TOKEN_RENEW_WINDOW = 120
+
+def resolve_base_url(cloud_region: Optional[str] = None, base_url: Optional[str] = None) -> str:
+    """Return the API base URL for a cloud region or an explicit URL"""
+    if base_url:
+        return base_url.rstrip("/") if "://" in base_url else f"https://{base_url.rstrip('/')}"
+    region = (cloud_region or "us-1").lower()
+    if region not in CLOUD_BASE_URLS:
+        raise ValueError(f"Unknown cloud region: {cloud_region}")
+    return CLOUD_BASE_URLS[region]
+
+class AsyncCorrelationRules:
+    """
+    Async counterpart of falconpy.CorrelationRules for the backup endpoints
+    
+    Use as an async context manager so the pooled session is closed:
+    
+        async with AsyncCorrelationRules(client_id, client_secret, "us-2") as rules:
+            response = await rules.get_rules_combined(limit=500, offset=0)
+    
+    Args:
+        client_id: CrowdStrike API client ID
+        client_secret: CrowdStrike API client secret
+        cloud_region: CrowdStrike cloud region (default: us-1)
+        base_url: Explicit API base URL, overriding cloud_region
+        max_connections: Size of the connection pool (default: from Config.ASYNC_MAX_CONNECTIONS)
+        timeout: Total timeout per request in seconds
+    """
+
+    def __init__(self, client_id: str, client_secret: str, cloud_region: Optional[str] = None,
+                 base_url: Optional[str] = None, max_connections: Optional[int] = None,
+                 timeout: float = 60.0):
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for the async client (pip install aiohttp)")
+        from config import Config
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.base_url = resolve_base_url(cloud_region, base_url)
+        self.max_connections = max_connections or Config.ASYNC_MAX_CONNECTIONS
+        self.timeout = timeout
+        self.token: Optional[str] = None
+        self.token_expires_at = 0.0
+        self._session = None
+        self._token_lock = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        """Create the pooled session for the running event loop"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._token_lock = asyncio.Lock()
+
+    async def close(self):
+        """Close the pooled session; the token is kept for later sessions"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def token_valid(self) -> bool:
+        """Whether the cached token can still be used"""
+        return self.token is not None and time.time() < self.token_expires_at - TOKEN_RENEW_WINDOW
+
+    async def authenticate(self) -> str:
+        """
+        Return a valid OAuth2 token, requesting one only when needed
+        
+        Raises:
+            PermissionError: If the token request is rejected
+        """
+        if self.token_valid:
+            return self.token
+        await self.open()
+        async with self._token_lock:
+            # Another task may have refreshed the token while we waited
+            if self.token_valid:
+                return self.token
+            async with self._session.post(
+                f"{self.base_url}{TOKEN_PATH}",
+                data={"client_id": self.client_id, "client_secret": self.client_secret}
+            ) as response:
+                body = await response.json(content_type=None)
+                if response.status not in (200, 201) or "access_token" not in body:
+                    raise PermissionError(f"API authentication failed: {response.status}")
+            self.token = body["access_token"]
+            self.token_expires_at = time.time() + int(body.get("expires_in", 1799))
+            return self.token
+
+    async def _get(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        token = await self.authenticate()
+        params = {key: str(value) for key, value in params.items() if value is not None}
+        async with self._session.get(
+            f"{self.base_url}{path}",
+            params=params,
+            headers={"Authorization": f"Bearer {token}", "Accept": "application/json"}
+        ) as response:
+            try:
+                body = await response.json(content_type=None) or {}
+            except ValueError:
+                # Gateways answer 502/503/504 with an HTML page; keep the status so it is retried
+                body = {}
+            if response.status == 401:
+                # Token revoked or expired early; force a refresh next time
+                self.token = None
+            return {"status_code": response.status, "headers": dict(response.headers), "body": body}
+
+    async def get_rules_combined(self, limit: int = 100, offset: int = 0, filter: Optional[str] = None,
+                                 **kwargs) -> Dict[str, Any]:
+        """Fetch one page of full rules"""
+        return await self._get(COMBINED_RULES_PATH, {"limit": limit, "offset": offset, "filter": filter, **kwargs})
+
+    async def query_rules(self, limit: int = 100, offset: int = 0, filter: Optional[str] = None,
+                          **kwargs) -> Dict[str, Any]:
+        """Fetch one page of rule IDs"""
+        return await self._get(QUERY_RULES_PATH, {"limit": limit, "offset": offset, "filter": filter, **kwargs})
+
+def is_async_client(client: Any) -> bool:
+    """Check whether a client's methods must be awaited"""
+    return asyncio.iscoroutinefunction(getattr(client, "get_rules_combined", None))
@@ -0,0 +1,121 @@
+"""
+Checkpoint journal for resumable backups
+
+While a backup runs, an append-only JSON Lines journal in the date folder
+records every rule file written and every page whose rules are all on
+disk. If the run is interrupted, `cli.py backup --resume` reads the journal
+back and continues from the last completed page instead of offset 0. The
+journal is removed once the backup summary has been written.
+
+Lines:
+    {"type": "start", "filter": ..., "fetch_filter": ..., "limit": ..., "format": ...}
+    {"type": "rule", "offset": 500, "entry": {...backup summary entry...}}
+    {"type": "page", "offset": 500, "rules": 500}
+
+A partially written last line (e.g. from a kill mid-write) is ignored.
+"""
+import json
+import os
+from typing import Any, Dict, Optional
+
+CHECKPOINT_FILENAME = ".backup_checkpoint.jsonl"
+CHECKPOINT_VERSION = 1
+
+def checkpoint_path(export_dir: str) -> str:
+    """Return the journal path for a snapshot directory"""
+    return os.path.join(export_dir, CHECKPOINT_FILENAME)
+
+def load_checkpoint(export_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the checkpoint journal of an interrupted backup
+
+    Args:
+        export_dir: Date based snapshot directory
+
+    Returns:
+        Dictionary with the start record under "header", rule entries by ID
+        under "rules" (each with the offset of its page) and completed pages
+        as {offset: rule count} under "pages", or None if there is no usable
+        journal
+    """
+    try:
+        with open(checkpoint_path(export_dir), "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+
+    state = {"header": None, "rules": {}, "pages": {}}
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # Torn write at the end of an interrupted run
+            break
+        kind = record.get("type")
+        if kind == "start":
+            if record.get("version") != CHECKPOINT_VERSION:
+                return None
+            state["header"] = record
+        elif kind == "rule":
+            state["rules"][record["entry"]["rule_id"]] = {"offset": record["offset"], "entry": record["entry"]}
+        elif kind == "page":
+            state["pages"][record["offset"]] = record["rules"]
+    if state["header"] is None:
+        return None
+    return state
+
+def is_durable(export_dir: str, entry: Dict[str, Any]) -> bool:
+    """Check that a journaled rule file is still on disk with the recorded size"""
+    try:
+        return os.path.getsize(os.path.join(export_dir, entry["filename"])) == entry.get("file_size")
+    except (OSError, KeyError):
+        return False
+
+class CheckpointJournal:
+    """
+    Append-only writer for the checkpoint journal
+
+    Rule records are buffered; every page record flushes and fsyncs the
+    journal, so a completed page survives a crash of the process or host.
+
+    Args:
+        export_dir: Date based snapshot directory
+        header: Run parameters recorded in the start line; ignored when resuming
+        resume: Append to an existing journal instead of starting a new one
+    """
+
+    def __init__(self, export_dir: str, header: Dict[str, Any], resume: bool = False):
+        self.path = checkpoint_path(export_dir)
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        if not resume:
+            self._append({"type": "start", "version": CHECKPOINT_VERSION, **header})
+            self._sync()
+
+    def _append(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n")
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record_rule(self, offset: int, entry: Dict[str, Any]):
+        """Record a rule whose file has been written"""
+        self._append({"type": "rule", "offset": offset, "entry": entry})
+
+    def record_page(self, offset: int, rule_count: int):
+        """Record that every rule of the page at offset is on disk"""
+        self._append({"type": "page", "offset": offset, "rules": rule_count})
+        self._sync()
+
+    def close(self):
+        """Close the journal, keeping it for a later --resume"""
+        if not self._file.closed:
+            self._file.close()
+
+    def complete(self):
+        """Close and remove the journal after a successful backup"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
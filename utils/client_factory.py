@@ -0,0 +1,258 @@
+"""
+Shared API client factory for the CrowdStrike Correlation Rules Backup Tool
+
+Credential validation and the backup itself used to build separate clients
+and each fetch its own OAuth2 token. get_session() hands out one client per
+(credentials, cloud region, client type) for the lifetime of the process and
+seeds it from an on-disk token cache, so back-to-back runs (e.g. from cron)
+reuse a token until it is about to expire instead of re-authenticating.
+
+The cache file is written atomically with 0600 permissions and only holds
+access tokens and their expiry; entries are keyed by a hash of the
+credentials and region, and the client secret itself is never stored.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from falconpy import CorrelationRules, OAuth2
+
+from .async_client import TOKEN_RENEW_WINDOW, AsyncCorrelationRules
+from config import Config
+
+TOKEN_CACHE_VERSION = 1
+
+# Serialises read-modify-write cycles of every TokenCache in the process
+_CACHE_LOCK = threading.Lock()
+
+def token_cache_key(client_id: str, client_secret: str, cloud_region: str) -> str:
+    """Return the cache key for a set of credentials in a cloud region"""
+    material = "\0".join([cloud_region.lower(), client_id, client_secret])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class TokenCache:
+    """
+    File-backed cache of OAuth2 access tokens
+
+    Args:
+        path: Cache file location (default: from Config.TOKEN_CACHE_FILE);
+            an empty path disables persistence
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Config.TOKEN_CACHE_FILE if path is None else path
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != TOKEN_CACHE_VERSION:
+            return {}
+        tokens = data.get("tokens")
+        return tokens if isinstance(tokens, dict) else {}
+
+    def _save(self, tokens: Dict[str, Any]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": TOKEN_CACHE_VERSION, "tokens": tokens}, f)
+        os.replace(temp_path, self.path)
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """
+        Return (access_token, expires_at) if a usable token is cached
+
+        Tokens inside the renew window are treated as expired.
+        """
+        if not self.enabled:
+            return None
+        with _CACHE_LOCK:
+            entry = self._load().get(key)
+        if not isinstance(entry, dict):
+            return None
+        token, expires_at = entry.get("access_token"), entry.get("expires_at", 0)
+        if not token or time.time() >= expires_at - TOKEN_RENEW_WINDOW:
+            return None
+        return token, float(expires_at)
+
+    def put(self, key: str, access_token: str, expires_at: float):
+        """Store a token, dropping any expired entries while the file is open"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with _CACHE_LOCK:
+            tokens = {k: v for k, v in self._load().items()
+                      if isinstance(v, dict) and v.get("expires_at", 0) > now}
+            tokens[key] = {"access_token": access_token, "expires_at": expires_at}
+            self._save(tokens)
+
+    def discard(self, key: str):
+        """Forget a token, e.g. after the API rejected it"""
+        if not self.enabled:
+            return
+        with _CACHE_LOCK:
+            tokens = self._load()
+            if tokens.pop(key, None) is not None:
+                self._save(tokens)
+
+class ClientSession:
+    """
+    An API client plus the state shared between validation and backup
+
+    Besides the client itself this keeps the first page fetched by probe(),
+    so the backup can start from it instead of requesting offset 0 again.
+
+    Args:
+        client: CorrelationRules or AsyncCorrelationRules instance
+        cache_key: Token cache key for the client's credentials
+        token_cache: TokenCache the client's token is persisted to
+    """
+
+    def __init__(self, client: Any, cache_key: str, token_cache: TokenCache):
+        self.client = client
+        self.cache_key = cache_key
+        self.token_cache = token_cache
+        self.is_async = isinstance(client, AsyncCorrelationRules)
+        self.auth_seconds = 0.0
+        self._first_pages: Dict[Tuple[int, str], Dict[str, Any]] = {}
+
+    def _token(self) -> Tuple[Optional[str], float]:
+        if self.is_async:
+            return self.client.token, self.client.token_expires_at
+        auth = self.client.auth_object
+        return auth.token_value, auth.token_time + auth.token_expiration
+
+    def _reset_token(self):
+        self.token_cache.discard(self.cache_key)
+        if self.is_async:
+            self.client.token = None
+        else:
+            self.client.auth_object.login()
+
+    def save_token(self):
+        """Persist the client's current token if it is still valid"""
+        token, expires_at = self._token()
+        if token and expires_at > time.time():
+            self.token_cache.put(self.cache_key, token, expires_at)
+
+    def _get_page(self, limit: int, filter: Optional[str]) -> Dict[str, Any]:
+        if not self.is_async:
+            return self.client.get_rules_combined(limit=limit, offset=0, filter=filter)
+
+        async def fetch():
+            async with self.client:
+                return await self.client.get_rules_combined(limit=limit, offset=0, filter=filter)
+        return asyncio.run(fetch())
+
+    def probe(self, limit: int, filter: Optional[str]) -> Dict[str, Any]:
+        """
+        Fetch the first page of rules to check that the credentials work
+
+        A cached token the API no longer accepts is dropped and the request
+        is retried once with a fresh one. Successful responses are kept for
+        take_first_page().
+
+        Args:
+            limit: Page size
+            filter: FQL filter
+
+        Returns:
+            The API response for offset 0
+        """
+        response = self._get_page(limit, filter)
+        if response.get("status_code") == 401:
+            self._reset_token()
+            response = self._get_page(limit, filter)
+        if response.get("status_code") == 200:
+            self.save_token()
+            self._first_pages[(limit, filter)] = response
+        return response
+
+    def take_auth_seconds(self) -> float:
+        """Return (and reset) the time spent building the client and logging in"""
+        seconds, self.auth_seconds = self.auth_seconds, 0.0
+        return seconds
+
+    def take_first_page(self, limit: int, filter: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Return (and forget) the probed page for limit and filter, if any"""
+        return self._first_pages.pop((limit, filter), None)
+
+_SESSIONS: Dict[Tuple[str, bool], ClientSession] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+def _build_client(client_id: str, client_secret: str, cloud_region: str, use_async: bool,
+                  max_connections: Optional[int], cached: Optional[Tuple[str, float]]) -> Any:
+    if use_async:
+        if "://" in cloud_region:
+            client = AsyncCorrelationRules(client_id, client_secret, base_url=cloud_region,
+                                           max_connections=max_connections)
+        else:
+            client = AsyncCorrelationRules(client_id, client_secret, cloud_region=cloud_region,
+                                           max_connections=max_connections)
+        if cached:
+            client.token, client.token_expires_at = cached
+        return client
+
+    # falconpy maps region names such as "us-2" to base URLs itself
+    auth = OAuth2(client_id=client_id, client_secret=client_secret, base_url=cloud_region)
+    if cached:
+        # Seed the token so the service class skips its login; the auth object
+        # keeps the credentials and refreshes the token when it goes stale
+        token, expires_at = cached
+        now = time.time()
+        auth.token_value = token
+        auth.token_time = now
+        auth.token_expiration = int(expires_at - now)
+        auth.token_status = 201
+    return CorrelationRules(auth_object=auth)
+
+def get_session(client_id: str, client_secret: str, cloud_region: Optional[str] = None,
+                use_async: bool = False, max_connections: Optional[int] = None,
+                token_cache: Optional[TokenCache] = None) -> ClientSession:
+    """
+    Return the shared client session for a set of credentials
+
+    Args:
+        client_id: CrowdStrike API client ID
+        client_secret: CrowdStrike API client secret
+        cloud_region: CrowdStrike cloud region or API base URL
+            (default: from Config.FALCON_CLOUD_REGION)
+        use_async: Build an AsyncCorrelationRules client instead of falconpy's
+        max_connections: Connection pool size for the async client
+        token_cache: Token cache to use (default: TokenCache())
+
+    Returns:
+        ClientSession, created on first use and reused afterwards
+    """
+    cloud_region = cloud_region or Config.FALCON_CLOUD_REGION
+    cache_key = token_cache_key(client_id, client_secret, cloud_region)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get((cache_key, use_async))
+        if session is None:
+            token_cache = token_cache or TokenCache()
+            started = time.perf_counter()
+            # falconpy logs in here unless the token cache had a usable token
+            client = _build_client(client_id, client_secret, cloud_region, use_async,
+                                   max_connections, token_cache.get(cache_key))
+            session = ClientSession(client, cache_key, token_cache)
+            session.auth_seconds = time.perf_counter() - started
+            _SESSIONS[(cache_key, use_async)] = session
+        return session
+
+def clear_sessions():
+    """Forget every shared session (the on-disk token cache is kept)"""
+    with _SESSIONS_LOCK:
+        _SESSIONS.clear()
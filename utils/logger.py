@@ -17,7 +17,8 @@ def ensure_log_directory():
 def setup_logger(
     name: str = "correlation_rules_backup",
     level: str = "INFO",
-    log_file: Optional[str] = None
+    log_file: Optional[str] = None,
+    console: bool = True
 ) -> logging.Logger:
     """
     Set up a logger with console and optional file output
@@ -26,6 +27,7 @@ def setup_logger(
         name: Logger name
         level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
         log_file: Optional file path for logging
+        console: Also log to stdout
         
     Returns:
         Configured logger instance
@@ -43,9 +45,10 @@ def setup_logger(
     )
     
     # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(formatter)
+        logger.addHandler(console_handler)
     
     # File handler (if specified)
     if log_file:
@@ -57,12 +60,12 @@ def setup_logger(
     
     return logger
 
-def get_log_filename() -> str:
+def get_log_filename(prefix: str = "correlation_rules_backup") -> str:
     """Generate a log filename based on current timestamp"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
     # Create logs directory if it doesn't exist
     ensure_log_directory()
     
-    filename = os.path.join("logs", f"correlation_rules_backup_{timestamp}.log")
+    filename = os.path.join("logs", f"{prefix}_{timestamp}.log")
     return filename
@@ -0,0 +1,249 @@
+"""
+Backup manifests for the CrowdStrike Correlation Rules Backup Tool
+
+A rule manifest (_rules_HHMMSS.jsonl, version 2 of the manifest format;
+version 1 is the object store's _manifest_HHMMSS.json) lists the same
+entries as the backup summary's saved_rules, in a layout that can be read
+without parsing all of it. It is an append-only JSON Lines file written
+while the backup runs:
+
+    {"manifest": 2, ...header}                    first line
+    {"rule_id": "...", "filename": "...", ...}    one line per saved rule
+    ...
+    <rule_id padded to key_width> <offset>        sorted index block, fixed
+    ...                                           width lines, offset in hex
+    {"manifest": 2, "index_offset": ..., ...}     trailer, always the last line
+
+While the backup runs the file is named _rules.jsonl.partial. When the
+backup completes the index block and trailer are appended and the file is
+renamed after the run's timestamp, like the summary. A reader maps the
+file, reads the trailer from the end and binary searches the index block,
+so opening a manifest and looking up one rule costs a few page reads
+whatever the number of rules. A partial manifest (an interrupted backup)
+has no trailer and is read by scanning its entry lines.
+"""
+import glob
+import hashlib
+import json
+import mmap
+import os
+from typing import Any, Dict, Iterator, Mapping, Optional
+
+RULES_MANIFEST_VERSION = 2
+RULES_MANIFEST_PREFIX = "_rules_"
+RULES_MANIFEST_EXTENSION = ".jsonl"
+PARTIAL_MANIFEST_NAME = "_rules.jsonl.partial"
+OFFSET_WIDTH = 16  # Hex digits per index offset
+
+def manifest_filename(current_time: str) -> str:
+    """File name of the rule manifest of a run finished at current_time (HHMMSS)"""
+    return f"{RULES_MANIFEST_PREFIX}{current_time}{RULES_MANIFEST_EXTENSION}"
+
+def find_manifest(snapshot_dir: str) -> Optional[str]:
+    """Return the newest finished rule manifest in a snapshot directory, if any"""
+    pattern = f"{RULES_MANIFEST_PREFIX}*{RULES_MANIFEST_EXTENSION}"
+    manifests = sorted(glob.glob(os.path.join(glob.escape(snapshot_dir), pattern)))
+    return manifests[-1] if manifests else None
+
+def _line(data: Mapping[str, Any]) -> bytes:
+    return json.dumps(dict(data), separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+
+class ManifestWriter:
+    """
+    Append summary entries to a snapshot's rule manifest as rules are saved
+
+    Args:
+        export_dir: Date based snapshot directory
+        header: Fields for the first line, e.g. snapshot date and filter
+    """
+
+    def __init__(self, export_dir: str, header: Dict[str, Any]):
+        self.export_dir = export_dir
+        self.path = os.path.join(export_dir, PARTIAL_MANIFEST_NAME)
+        self._file = open(self.path, "wb")
+        self._hash = hashlib.sha256()
+        self._offsets: Dict[str, int] = {}
+        self._write(_line({"manifest": RULES_MANIFEST_VERSION, **header}))
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    @property
+    def sha256(self) -> str:
+        """SHA-256 of everything written so far (the whole file once finished)"""
+        return self._hash.hexdigest()
+
+    def _write(self, data: bytes):
+        self._hash.update(data)
+        self._file.write(data)
+
+    def add(self, entry: Mapping[str, Any]):
+        """Append one backup summary entry; a later entry for the same rule ID wins"""
+        self._offsets[entry["rule_id"]] = self._file.tell()
+        self._write(_line(entry))
+
+    def finish(self, current_time: str) -> Dict[str, Any]:
+        """
+        Write the sorted index block and trailer, close the manifest and
+        rename it to its final name (see manifest_filename)
+
+        Returns:
+            The trailer
+        """
+        keys = sorted((rule_id.encode("utf-8"), offset) for rule_id, offset in self._offsets.items())
+        key_width = max((len(key) for key, _ in keys), default=1)
+        trailer = {
+            "manifest": RULES_MANIFEST_VERSION,
+            "index_offset": self._file.tell(),
+            "index_count": len(keys),
+            "key_width": key_width,
+            "entry_width": key_width + OFFSET_WIDTH + 2,
+        }
+        self._write(b"".join(key.ljust(key_width) + b" " + b"%0*x" % (OFFSET_WIDTH, offset) + b"\n"
+                             for key, offset in keys))
+        self._write(_line(trailer))
+        self.close()
+        final_path = os.path.join(self.export_dir, manifest_filename(current_time))
+        os.replace(self.path, final_path)
+        self.path = final_path
+        return trailer
+
+    def close(self):
+        """Close without an index block, leaving a partial manifest readable by scanning"""
+        if not self._file.closed:
+            self._file.close()
+
+class ManifestReader:
+    """
+    Memory-mapped manifest with rule lookups by binary search
+
+    Args:
+        path: Manifest path
+
+    Raises:
+        ValueError: If the file is not a manifest
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = None
+        self._scanned: Optional[Dict[str, int]] = None
+        try:
+            if os.fstat(self._file.fileno()).st_size == 0:
+                raise ValueError(f"Empty manifest: {path}")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.header = json.loads(self._map[:self._map.find(b"\n") + 1])
+            if self.header.get("manifest") != RULES_MANIFEST_VERSION:
+                raise ValueError(f"Unsupported manifest version in {path}: {self.header.get('manifest')}")
+            self.trailer = self._read_trailer()
+        except Exception:
+            self.close()
+            raise
+        self.complete = self.trailer is not None
+        if self.complete:
+            self._index_offset = self.trailer["index_offset"]
+            self._count = self.trailer["index_count"]
+            self._key_width = self.trailer["key_width"]
+            self._entry_width = self.trailer["entry_width"]
+            self._data_end = self._index_offset
+        else:
+            self._data_end = len(self._map)
+
+    def _read_trailer(self) -> Optional[Dict[str, Any]]:
+        end = len(self._map)
+        if self._map[end - 1:end] != b"\n":
+            return None
+        start = self._map.rfind(b"\n", 0, end - 1) + 1
+        try:
+            trailer = json.loads(self._map[start:end])
+        except ValueError:
+            return None
+        return trailer if isinstance(trailer, dict) and "index_offset" in trailer else None
+
+    def _entry_at(self, offset: int) -> Dict[str, Any]:
+        return json.loads(self._map[offset:self._map.find(b"\n", offset)])
+
+    def _scan(self) -> Dict[str, int]:
+        """Offsets of every complete entry line, for manifests without an index block"""
+        if self._scanned is None:
+            self._scanned = {}
+            for offset, entry in self._iter_lines():
+                self._scanned[entry["rule_id"]] = offset
+        return self._scanned
+
+    def _iter_lines(self) -> Iterator[tuple]:
+        offset = self._map.find(b"\n") + 1
+        while offset < self._data_end:
+            end = self._map.find(b"\n", offset, self._data_end)
+            if end < 0:
+                # Torn last line of an interrupted backup
+                return
+            try:
+                entry = json.loads(self._map[offset:end])
+            except ValueError:
+                return
+            yield offset, entry
+            offset = end + 1
+
+    def _key(self, position: int) -> bytes:
+        start = self._index_offset + position * self._entry_width
+        return self._map[start:start + self._key_width]
+
+    def offset_of(self, rule_id: str) -> Optional[int]:
+        """Byte offset of a rule's entry line, or None if the manifest does not list it"""
+        if not self.complete:
+            return self._scan().get(rule_id)
+        target = rule_id.encode("utf-8")
+        if len(target) > self._key_width:
+            return None
+        target = target.ljust(self._key_width)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count or self._key(low) != target:
+            return None
+        start = self._index_offset + low * self._entry_width + self._key_width + 1
+        return int(self._map[start:start + OFFSET_WIDTH], 16)
+
+    def get(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        """The backup summary entry of a rule, or None"""
+        offset = self.offset_of(rule_id)
+        return None if offset is None else self._entry_at(offset)
+
+    def __contains__(self, rule_id: str) -> bool:
+        return self.offset_of(rule_id) is not None
+
+    def __len__(self) -> int:
+        return self._count if self.complete else len(self._scan())
+
+    def rule_ids(self) -> Iterator[str]:
+        """Rule IDs in sorted order"""
+        if not self.complete:
+            yield from sorted(self._scan())
+            return
+        for position in range(self._count):
+            yield self._key(position).rstrip(b" ").decode("utf-8")
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        """Every rule's entry in the order the backup saved them, skipping entries a later line replaced"""
+        for offset, entry in self._iter_lines():
+            if self.offset_of(entry["rule_id"]) == offset:
+                yield entry
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
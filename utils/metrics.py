@@ -0,0 +1,216 @@
+"""
+Run instrumentation for the CrowdStrike Correlation Rules Backup Tool
+
+BackupMetrics times the phases of a backup run (auth, waiting for pages,
+serializing, writing, summary), collects API page latencies and counts
+bytes encoded. Phases nest: time spent in an inner phase (e.g. serializing
+inside a write) is not counted again in the outer one, so the phases add
+up to the time the run was measured.
+
+The report goes into the backup summary under "timings" and can be
+exported in the Prometheus text format for node_exporter's textfile
+collector.
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+METRIC_PREFIX = "crowdstrike_backup"
+
+def percentile(values: Iterable[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile, e.g. fraction=0.95 for p95; None for no values"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+class TimedSerializer:
+    """Serializer wrapper that books encoding time and bytes to a BackupMetrics"""
+
+    def __init__(self, serializer, metrics: "BackupMetrics"):
+        self.serializer = serializer
+        self.metrics = metrics
+
+    def dumps(self, data: Any) -> bytes:
+        with self.metrics.phase("serialize"):
+            payload = self.serializer.dumps(data)
+        self.metrics.bytes_encoded += len(payload)
+        return payload
+
+    def __getattr__(self, name):
+        return getattr(self.serializer, name)
+
+class BackupMetrics:
+    """
+    Phase timers and throughput counters for one backup run
+
+    Phases may be entered from any thread; nesting is tracked per thread.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.bytes_encoded = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, count: int = 1):
+        """Book time to a phase measured elsewhere"""
+        with self._lock:
+            phase = self.phases.setdefault(name, {"seconds": 0.0, "count": 0})
+            phase["seconds"] += seconds
+            phase["count"] += count
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a block as phase name, pausing any enclosing phase meanwhile"""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        now = time.perf_counter()
+        if stack:
+            # Pause the enclosing phase
+            outer = stack[-1]
+            outer[1] += now - outer[2]
+        frame = [name, 0.0, now]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            stack.pop()
+            frame[1] += now - frame[2]
+            self.add(name, frame[1])
+            if stack:
+                stack[-1][2] = now
+
+    def timed_iter(self, iterable: Iterable[Any], name: str) -> Iterator[Any]:
+        """Yield from iterable, booking the time spent waiting for each item as phase name"""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def timed_serializer(self, serializer) -> TimedSerializer:
+        """Wrap a writer's serializer so its encoding time is booked as "serialize" """
+        return TimedSerializer(serializer, self)
+
+    def report(self, rules: int, page_latencies: List[float], bytes_written: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Summarize the run so far
+
+        Args:
+            rules: Rules processed
+            page_latencies: Seconds per API page request
+            bytes_written: Bytes written (default: bytes encoded by timed serializers)
+
+        Returns:
+            Dictionary with total seconds, per-phase seconds and counts,
+            rules and bytes per second and page latency percentiles
+        """
+        elapsed = time.perf_counter() - self.started
+        bytes_written = self.bytes_encoded if bytes_written is None else bytes_written
+        with self._lock:
+            phases = {name: {"seconds": round(phase["seconds"], 6), "count": int(phase["count"])}
+                      for name, phase in self.phases.items()}
+        latencies = list(page_latencies)
+        return {
+            "total_seconds": round(elapsed, 6),
+            "phases": phases,
+            "rules": rules,
+            "rules_per_second": round(rules / elapsed, 1) if elapsed else 0.0,
+            "bytes_written": bytes_written,
+            "bytes_per_second": round(bytes_written / elapsed, 1) if elapsed else 0.0,
+            "page_latency": {
+                "count": len(latencies),
+                "sum": round(sum(latencies), 6),
+                "p50": percentile(latencies, 0.5),
+                "p95": percentile(latencies, 0.95),
+                "max": max(latencies) if latencies else None,
+            },
+        }
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_prometheus(timings: Dict[str, Any], request_stats: Optional[Dict[str, Any]] = None,
+                      labels: Optional[Dict[str, str]] = None, timestamp: Optional[float] = None) -> str:
+    """
+    Render a timings report in the Prometheus text exposition format
+
+    Args:
+        timings: BackupMetrics.report() result
+        request_stats: RequestScheduler stats of the run
+        labels: Labels added to every sample, e.g. {"format": "files"}
+        timestamp: Completion time for the last-success gauge (default: now)
+    """
+    base = ",".join(f'{key}="{_escape(value)}"' for key, value in sorted((labels or {}).items()))
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples):
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+        for suffix, extra, value in samples:
+            label_text = ",".join(part for part in (base, extra) if part)
+            lines.append(f"{METRIC_PREFIX}_{name}{suffix}{{{label_text}}} {value}" if label_text
+                         else f"{METRIC_PREFIX}_{name}{suffix} {value}")
+
+    metric("last_success_timestamp_seconds", "gauge", "Unix time the last successful backup finished.",
+           [("", "", round(timestamp if timestamp is not None else time.time(), 3))])
+    metric("duration_seconds", "gauge", "Wall time of the last backup.",
+           [("", "", timings["total_seconds"])])
+    metric("phase_seconds", "gauge", "Time the last backup spent in each phase.",
+           [("", f'phase="{_escape(name)}"', phase["seconds"]) for name, phase in sorted(timings["phases"].items())])
+    metric("rules", "gauge", "Rules processed by the last backup.", [("", "", timings["rules"])])
+    metric("bytes_written", "gauge", "Bytes written by the last backup.", [("", "", timings["bytes_written"])])
+    metric("rules_per_second", "gauge", "Rules per second of the last backup.",
+           [("", "", timings["rules_per_second"])])
+    metric("bytes_per_second", "gauge", "Bytes written per second by the last backup.",
+           [("", "", timings["bytes_per_second"])])
+    latency = timings["page_latency"]
+    samples = [("", f'quantile="{q}"', latency[key]) for q, key in (("0.5", "p50"), ("0.95", "p95"))
+               if latency[key] is not None]
+    samples += [("_sum", "", latency["sum"]), ("_count", "", latency["count"])]
+    metric("page_latency_seconds", "summary", "Latency of API page requests in the last backup.", samples)
+    if request_stats:
+        metric("api_requests", "gauge", "API page request attempts of the last backup, and how many were retried, "
+               "throttled or failed.",
+               [("", f'kind="{kind}"', request_stats.get(key, 0))
+                for kind, key in (("attempts", "requests"), ("retried", "retries"), ("throttled", "throttled"),
+                                  ("failed", "errors"))])
+    return "\n".join(lines) + "\n"
+
+def write_prometheus_textfile(path: str, timings: Dict[str, Any], request_stats: Optional[Dict[str, Any]] = None,
+                              labels: Optional[Dict[str, str]] = None) -> bool:
+    """
+    Write metrics for node_exporter's textfile collector
+
+    The file is written to a temporary name and renamed into place, so the
+    collector never reads a partial file.
+
+    Returns:
+        True if the file was written
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(format_prometheus(timings, request_stats, labels))
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return False
+    return True
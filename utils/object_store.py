@@ -0,0 +1,193 @@
+"""
+Content-addressed object store for deduplicated correlation rule backups
+
+Rule payloads are stored once as blobs named by the SHA-256 of their
+canonical JSON encoding. Each snapshot writes a small manifest mapping rule
+IDs to blobs; blobs no longer referenced by any manifest are reclaimed by
+collect_garbage.
+
+A running backup only writes its manifest when it finishes, so its blobs
+are unreferenced until then. Writing or reusing a blob refreshes its
+modification time, and collect_garbage leaves blobs younger than a grace
+period alone.
+"""
+import glob
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from config import Config
+
+OBJECTS_DIRNAME = ".objects"
+MANIFEST_PREFIX = "_manifest_"
+MANIFEST_VERSION = 1
+
+class ObjectStore:
+    """
+    Write-once blob store laid out as <root>/<hash[:2]>/<hash[2:]>.json
+    
+    Args:
+        root: Directory holding the blobs
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._known_dirs = set()
+
+    def object_path(self, digest: str) -> str:
+        """Return the path of the blob with the given digest"""
+        return os.path.join(self.root, digest[:2], f"{digest[2:]}.json")
+
+    def exists(self, digest: str) -> bool:
+        """Check whether a blob is already stored"""
+        return os.path.exists(self.object_path(digest))
+
+    def size(self, digest: str) -> Optional[int]:
+        """Return the size of a stored blob, or None if it does not exist"""
+        try:
+            return os.stat(self.object_path(digest)).st_size
+        except FileNotFoundError:
+            return None
+
+    def put(self, data: bytes, digest: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Store a blob unless an identical one already exists
+        
+        Args:
+            data: Blob content
+            digest: Precomputed SHA-256 of data (optional)
+            
+        Returns:
+            Tuple of (digest, written) where written is False for duplicates
+        """
+        digest = digest or hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if self.touch(digest):
+            return digest, False
+
+        directory = os.path.dirname(path)
+        if directory not in self._known_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._known_dirs.add(directory)
+
+        # Write under a temporary name so a crash never leaves a truncated blob
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return digest, True
+
+    def touch(self, digest: str) -> bool:
+        """
+        Mark a stored blob as in use by refreshing its modification time
+
+        Returns:
+            False if the blob does not exist
+        """
+        try:
+            os.utime(self.object_path(digest))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def get(self, digest: str) -> Dict[str, Any]:
+        """Load and decode a stored blob"""
+        with open(self.object_path(digest), "rb") as f:
+            return json.loads(f.read())
+
+    def iter_digests(self) -> Iterable[str]:
+        """Yield the digest of every stored blob"""
+        if not os.path.isdir(self.root):
+            return
+        for shard in os.scandir(self.root):
+            if not shard.is_dir() or len(shard.name) != 2:
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    yield shard.name + entry.name[:-len(".json")]
+
+def get_object_store(base_dir: str) -> ObjectStore:
+    """Return the object store that belongs to a backup directory"""
+    return ObjectStore(os.path.join(base_dir, OBJECTS_DIRNAME))
+
+def find_manifests(base_dir: str, exclude_dirs: Iterable[str] = ()) -> list:
+    """
+    Find every snapshot manifest under a backup directory
+    
+    Args:
+        base_dir: Base backup directory
+        exclude_dirs: Snapshot directories to ignore (e.g. pending deletion)
+        
+    Returns:
+        Sorted list of manifest paths
+    """
+    excluded = {os.path.abspath(path) for path in exclude_dirs}
+    manifests = []
+    for path in glob.glob(os.path.join(base_dir, "*", f"{MANIFEST_PREFIX}*.json")):
+        if os.path.abspath(os.path.dirname(path)) not in excluded:
+            manifests.append(path)
+    return sorted(manifests)
+
+def count_references(manifest_paths: Iterable[str]) -> Dict[str, int]:
+    """
+    Count how many manifests reference each blob
+    
+    Raises:
+        ValueError: If a manifest cannot be read, since collecting garbage
+            with an incomplete reference set could delete live blobs
+    """
+    references: Dict[str, int] = {}
+    for path in manifest_paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Unreadable manifest {path}: {e}")
+        for digest in manifest.get("rules", {}).values():
+            references[digest] = references.get(digest, 0) + 1
+    return references
+
+def collect_garbage(base_dir: str, exclude_dirs: Iterable[str] = (), dry_run: bool = False,
+                    grace_seconds: Optional[float] = None) -> Dict[str, int]:
+    """
+    Delete blobs that no remaining snapshot manifest references
+    
+    Args:
+        base_dir: Base backup directory
+        exclude_dirs: Snapshot directories whose manifests should not count
+        dry_run: Only report what would be deleted
+        grace_seconds: Keep unreferenced blobs written or reused more
+            recently than this, since a backup still running may need them
+            (default: from Config.OBJECT_GC_GRACE_HOURS)
+        
+    Returns:
+        Dictionary with blob counts (total, referenced, recent, deleted) and bytes reclaimed
+    """
+    if grace_seconds is None:
+        grace_seconds = Config.OBJECT_GC_GRACE_HOURS * 3600
+    store = get_object_store(base_dir)
+    # Taken before the manifests are read: a blob a backup touches after this point is kept
+    cutoff = time.time() - grace_seconds
+    references = count_references(find_manifests(base_dir, exclude_dirs))
+    stats = {"total": 0, "referenced": 0, "recent": 0, "deleted": 0, "bytes": 0}
+    for digest in list(store.iter_digests()):
+        stats["total"] += 1
+        if references.get(digest, 0) > 0:
+            stats["referenced"] += 1
+            continue
+        path = store.object_path(digest)
+        try:
+            stat = os.stat(path)
+            if stat.st_mtime > cutoff:
+                stats["recent"] += 1
+                continue
+            size = stat.st_size
+            if not dry_run:
+                os.remove(path)
+        except OSError:
+            continue
+        stats["deleted"] += 1
+        stats["bytes"] += size
+    return stats
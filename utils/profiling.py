@@ -0,0 +1,194 @@
+"""
+Profiling hooks for the CrowdStrike Correlation Rules Backup Tool
+
+profile_run() wraps a block in one of two profilers and writes its
+artifacts next to the run's log file (same name, different extension):
+
+    cprofile     <log>.prof       pstats file (python -m pstats, snakeviz)
+                 <log>.collapsed  collapsed stacks in microseconds for
+                                  flamegraph.pl / speedscope
+                 <log>.top.txt    functions sorted by cumulative time
+    tracemalloc  <log>.alloc.txt  top allocation sites by line and traceback
+                 <log>.alloc.collapsed
+                                  collapsed stacks weighted by bytes still
+                                  allocated at the end of the run
+
+Before Python 3.12 cProfile only sees the thread that enabled it, so a
+profiler is also started in every thread created during the block (the
+page fetchers and the pipeline's producer) and all of them are merged into
+one report. From 3.12 cProfile is built on sys.monitoring, which allows a
+single active profiler per interpreter (a second one raises ValueError)
+and reports events from every thread, so only one profiler is used.
+
+This module is only imported when profiling is requested.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+PROFILE_MODES = ("cprofile", "tracemalloc")
+TRACEMALLOC_FRAMES = 25  # Frames kept per allocation traceback
+TOP_ENTRIES = 40  # Rows in the text reports
+
+# Call paths contributing less than this many seconds are left out of the collapsed stacks
+_MIN_STACK_SECONDS = 1e-5
+
+# Whether each thread needs a profiler of its own (see the module docstring)
+_PER_THREAD_PROFILERS = sys.version_info < (3, 12)
+
+def profile_paths(log_file: str, mode: str) -> Dict[str, str]:
+    """Artifact paths for a profiling mode, derived from the log file name"""
+    base = os.path.splitext(log_file)[0]
+    if mode == "cprofile":
+        return {"pstats": f"{base}.prof", "collapsed": f"{base}.collapsed", "top": f"{base}.top.txt"}
+    if mode == "tracemalloc":
+        return {"allocations": f"{base}.alloc.txt", "collapsed": f"{base}.alloc.collapsed"}
+    raise ValueError(f"Unknown profile mode: {mode} (choose from {', '.join(PROFILE_MODES)})")
+
+def _label(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    label = name if filename == "~" else f"{name} ({os.path.basename(filename)}:{line})"
+    return label.replace(";", ":")
+
+def collapsed_stacks(stats: pstats.Stats) -> List[str]:
+    """
+    Approximate collapsed stacks from a cProfile call graph
+
+    cProfile records caller -> callee edges, not full stacks, so each
+    function's own time is split across its call paths in proportion to the
+    time spent under each caller (the approach of flameprof/gprof2dot).
+    Recursive calls are folded into the first occurrence on a path.
+
+    Returns:
+        Lines of "frame;frame;frame microseconds"
+    """
+    entries = stats.stats
+    callees: Dict[tuple, Dict[tuple, float]] = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, {})[func] = edge[3]
+
+    totals: Dict[str, float] = {}
+
+    def walk(func, path, fraction):
+        _, _, own, cumulative, _ = entries[func]
+        if own * fraction > 0:
+            key = ";".join(path)
+            totals[key] = totals.get(key, 0.0) + own * fraction
+        for callee, edge_seconds in callees.get(func, {}).items():
+            label = _label(callee)
+            callee_total = entries[callee][3]
+            if label in path or callee_total <= 0 or edge_seconds * fraction < _MIN_STACK_SECONDS:
+                continue
+            walk(callee, path + [label], fraction * edge_seconds / callee_total)
+
+    for func, (_, _, _, _, callers) in entries.items():
+        if not callers:
+            walk(func, [_label(func)], 1.0)
+    return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in sorted(totals.items())
+            if round(seconds * 1e6) > 0]
+
+def _write_cprofile(profilers: List[cProfile.Profile], paths: Dict[str, str]):
+    stats = pstats.Stats(profilers[0])
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+    stats.dump_stats(paths["pstats"])
+    with open(paths["collapsed"], "w", encoding="utf-8") as f:
+        f.write("\n".join(collapsed_stacks(stats)) + "\n")
+    report = io.StringIO()
+    stats.stream = report
+    stats.sort_stats("cumulative").print_stats(TOP_ENTRIES)
+    with open(paths["top"], "w", encoding="utf-8") as f:
+        f.write(report.getvalue())
+
+def _write_tracemalloc(snapshot: tracemalloc.Snapshot, peak: int, paths: Dict[str, str]):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    lines = [f"Peak traced memory: {peak / (1024 * 1024):.1f} MiB", "",
+             f"Top {TOP_ENTRIES} allocation sites still allocated at the end of the run:"]
+    for stat in snapshot.statistics("lineno")[:TOP_ENTRIES]:
+        lines.append(f"  {stat}")
+    lines += ["", f"Top {TOP_ENTRIES // 4} allocation tracebacks:"]
+    for stat in snapshot.statistics("traceback")[:TOP_ENTRIES // 4]:
+        lines.append(f"  {stat.size / 1024:.1f} KiB in {stat.count} blocks")
+        lines.extend(f"    {line}" for line in stat.traceback.format())
+    with open(paths["allocations"], "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    with open(paths["collapsed"], "w", encoding="utf-8") as f:
+        for stat in snapshot.statistics("traceback"):
+            # Frames are ordered oldest first, as collapsed stacks expect
+            frames = ";".join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback)
+            f.write(f"{frames} {stat.size}\n")
+
+@contextmanager
+def profile_run(mode: str, log_file: str) -> Iterator[Dict[str, str]]:
+    """
+    Profile the enclosed block and write its artifacts next to log_file
+
+    Args:
+        mode: "cprofile" or "tracemalloc"
+        log_file: Log file of the run; artifacts share its name
+
+    Yields:
+        Dictionary of artifact kind to path, filled in once the block exits
+    """
+    paths = profile_paths(log_file, mode)
+    directory = os.path.dirname(log_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    written: Dict[str, str] = {}
+
+    if mode == "tracemalloc":
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        if hasattr(tracemalloc, "reset_peak"):
+            # Python 3.9+; a fresh start has no earlier peak anyway
+            tracemalloc.reset_peak()
+        try:
+            yield written
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started:
+                tracemalloc.stop()
+            _write_tracemalloc(snapshot, peak, paths)
+            written.update(paths)
+        return
+
+    profilers = [cProfile.Profile()]
+    lock = threading.Lock()
+
+    def start_thread_profiler(*_):
+        # Runs as the first profile event of each new thread; enabling
+        # the thread's own profiler replaces this hook
+        profiler = cProfile.Profile()
+        with lock:
+            profilers.append(profiler)
+        profiler.enable()
+
+    if _PER_THREAD_PROFILERS:
+        threading.setprofile(start_thread_profiler)
+    profilers[0].enable()
+    try:
+        yield written
+    finally:
+        profilers[0].disable()
+        if _PER_THREAD_PROFILERS:
+            threading.setprofile(None)
+        with lock:
+            finished = list(profilers)
+        # Stop threads still running from adding to the stats being merged
+        for profiler in finished[1:]:
+            profiler.disable()
+        _write_cprofile(finished, paths)
+        written.update(paths)
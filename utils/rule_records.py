@@ -0,0 +1,104 @@
+"""
+Compact backup summary records for the CrowdStrike Correlation Rules Backup Tool
+
+Every saved rule gets an entry in the backup summary. Held as plain dicts,
+100k entries cost a hash table each, and the values that repeat on nearly
+every entry ("Not found" defaults, the shared search filter text, the run's
+timestamp, the archive name) are separate string objects whenever the
+entries come from parsed JSON (a resumed journal, the previous state index).
+
+RuleRecord stores an entry in fixed __slots__ and behaves as a read-only
+mapping, so consumers keep using entry["rule_id"], entry.get(...) and
+entry.items(). RuleRecords is the list the engine appends entries to; it
+converts each dict to a RuleRecord and shares repeated strings through a
+per-list table, so the table is released together with the summary.
+"""
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional
+
+# Entry keys in the order they are written to the summary
+RECORD_FIELDS = (
+    "rule_id", "rule_name", "description", "search_outcome", "search_filter", "created_on",
+    "last_updated_on", "status", "filename", "object", "archive", "file_size", "file_sha256",
+    "sha256", "timestamp", "linked_from",
+)
+
+# Fields whose values repeat across the entries of a snapshot
+SHARED_FIELDS = frozenset({"description", "search_outcome", "search_filter", "status", "timestamp", "archive"})
+
+_MISSING = object()
+
+class RuleRecord(Mapping):
+    """
+    One backup summary entry
+
+    Keys absent from the source entry stay absent (a slot left at a
+    sentinel), so a record compares equal to the dict it was built from.
+    Keys outside RECORD_FIELDS are kept in a small overflow dict.
+    """
+    __slots__ = RECORD_FIELDS + ("_extra",)
+
+    def __init__(self, entry: Mapping, strings: Optional[Dict[str, str]] = None):
+        extra = None
+        for field in RECORD_FIELDS:
+            object.__setattr__(self, field, _MISSING)
+        for key, value in entry.items():
+            if strings is not None and key in SHARED_FIELDS and isinstance(value, str):
+                value = strings.setdefault(value, value)
+            if key in RECORD_FIELDS:
+                object.__setattr__(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        object.__setattr__(self, "_extra", extra)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RuleRecord is read-only")
+
+    def __getitem__(self, key: str) -> Any:
+        if key in RECORD_FIELDS:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        elif self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for field in RECORD_FIELDS:
+            if getattr(self, field) is not _MISSING:
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict copy, e.g. for a serializer"""
+        return {key: self[key] for key in self}
+
+    def __repr__(self):
+        return f"RuleRecord({self.to_dict()!r})"
+
+class RuleRecords(list):
+    """
+    List of RuleRecord; append() accepts summary entries as dicts
+
+    Only append() converts entries, so build the list by appending.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._strings: Dict[str, str] = {}
+
+    def append(self, entry: Mapping):
+        if not isinstance(entry, RuleRecord):
+            entry = RuleRecord(entry, self._strings)
+        super().append(entry)
+
+    def iter_dicts(self) -> Iterator[Dict[str, Any]]:
+        """Yield the entries as plain dicts, one at a time"""
+        for record in self:
+            yield record.to_dict()
@@ -0,0 +1,264 @@
+"""
+Rate-limit aware request scheduler for the CrowdStrike Correlation Rules Backup Tool
+
+Every API page request goes through a RequestScheduler, which
+
+- retries throttled (429) and transient (5xx, connection error) requests
+  with jittered exponential backoff, honouring X-Ratelimit-Retryafter;
+- slows down when X-Ratelimit-Remaining says the quota is nearly spent,
+  so the next requests wait for the window to reset instead of being
+  rejected;
+- adapts the number of requests in flight: halved on every throttled
+  response and grown back by one after a run of successes (AIMD), never
+  above the concurrency the caller asked for.
+
+The duration of every request attempt is kept in `latencies` for the
+run's timing report.
+
+The same scheduler serves thread pool workers (call) and asyncio tasks
+(acall). Only the request that failed is retried, so pages that were
+already fetched are never downloaded twice.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import aiohttp
+except ImportError:  # async client is optional
+    aiohttp = None
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+RETRYABLE_EXCEPTIONS = (ConnectionError, TimeoutError, asyncio.TimeoutError) + \
+    ((aiohttp.ClientError,) if aiohttp is not None else ())
+
+def get_header(response: Dict[str, Any], name: str) -> Optional[str]:
+    """Case-insensitive lookup of a response header"""
+    headers = response.get("headers") or {}
+    lowered = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds to wait according to a retry-after header
+
+    The Falcon API sends an epoch timestamp in X-Ratelimit-Retryafter; plain
+    Retry-After sends a number of seconds. Both are accepted.
+    """
+    try:
+        retry_after = float(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_after > 1e9:
+        retry_after -= now if now is not None else time.time()
+    return max(0.0, retry_after)
+
+class RequestScheduler:
+    """
+    Pace, throttle and retry API requests
+
+    Args:
+        max_concurrency: Upper bound for requests in flight
+        max_retries: Retries per request before the last response is returned
+            (default: from Config.MAX_RETRIES)
+        backoff_base: First backoff delay in seconds (default: from Config.RETRY_BACKOFF_BASE)
+        backoff_max: Longest backoff delay in seconds (default: from Config.RETRY_BACKOFF_MAX)
+        increase_after: Successful responses needed before allowing one more
+            request in flight
+        quota_pause: Seconds to hold new requests when X-Ratelimit-Remaining
+            runs low and no reset time is known (default: from Config.RATE_LIMIT_PAUSE)
+        gate: Semaphore shared with other schedulers to cap requests in flight
+            across all of them, e.g. one per tenant in a multi-tenant run
+        logger: Logger for throttling messages
+        sleep: Blocking sleep function (overridable for tests)
+    """
+
+    def __init__(self, max_concurrency: int = 1, max_retries: Optional[int] = None,
+                 backoff_base: Optional[float] = None, backoff_max: Optional[float] = None,
+                 increase_after: int = 10, quota_pause: Optional[float] = None, logger=None,
+                 sleep: Callable[[float], None] = time.sleep, gate: Optional[threading.Semaphore] = None):
+        from config import Config
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = Config.MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = Config.RETRY_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = Config.RETRY_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.increase_after = increase_after
+        self.quota_pause = Config.RATE_LIMIT_PAUSE if quota_pause is None else quota_pause
+        self.logger = logger
+        self.sleep = sleep
+        self.gate = gate
+        self.limit = self.max_concurrency
+        self.in_flight = 0
+        self.not_before = 0.0
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "errors": 0, "min_concurrency": self.limit}
+        self.latencies = []
+        self._successes = 0
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+        self._async_slot_free = None
+
+    def _log(self, message: str):
+        if self.logger:
+            self.logger.warning(message)
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for a retry attempt"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _record(self, response: Optional[Dict[str, Any]], attempt: int, elapsed: float = 0.0,
+                idempotent: bool = True) -> Optional[float]:
+        """
+        Update pacing and concurrency from a response (None for an exception)
+        that took elapsed seconds
+
+        Returns the delay before retrying, or None if the response is final.
+        Requests that are not idempotent are only retried after a 429.
+        Must be called with the lock held.
+        """
+        now = time.time()
+        self.stats["requests"] += 1
+        self.latencies.append(elapsed)
+        status = response.get("status_code") if response is not None else None
+        retry_after = parse_retry_after(get_header(response, "X-Ratelimit-Retryafter"), now) \
+            if response is not None else None
+        if retry_after is None and response is not None:
+            retry_after = parse_retry_after(get_header(response, "Retry-After"), now)
+
+        if status == 429:
+            # Multiplicative decrease: back off harder the more we are throttled
+            self.stats["throttled"] += 1
+            self.limit = max(1, self.limit // 2)
+            self.stats["min_concurrency"] = min(self.stats["min_concurrency"], self.limit)
+            self._successes = 0
+            if retry_after is not None:
+                self.not_before = max(self.not_before, now + retry_after)
+        elif status is not None and status not in RETRYABLE_STATUS_CODES:
+            self._successes += 1
+            if self._successes >= self.increase_after and self.limit < self.max_concurrency:
+                self.limit += 1
+                self._successes = 0
+            remaining = get_header(response, "X-Ratelimit-Remaining")
+            try:
+                remaining = int(remaining) if remaining is not None else None
+            except ValueError:
+                remaining = None
+            if remaining is not None and remaining <= self.limit:
+                # Nearly out of quota: hold new requests until the window resets
+                wait = retry_after if retry_after is not None else self.quota_pause
+                self.not_before = max(self.not_before, now + wait)
+            return None
+        else:
+            self.stats["errors"] += 1
+            if not idempotent:
+                # The server may have applied the request before failing or timing out
+                return None
+
+        if attempt >= self.max_retries:
+            return None
+        self.stats["retries"] += 1
+        delay = self.backoff(attempt)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _pacing_delay(self) -> float:
+        return max(0.0, self.not_before - time.time())
+
+    def call(self, request: Callable[[], Dict[str, Any]], description: str = "request",
+             idempotent: bool = True) -> Dict[str, Any]:
+        """
+        Run a blocking request under the scheduler
+
+        Args:
+            request: Zero-argument callable returning a falconpy style response
+            description: Used in log messages, e.g. "offset 500"
+            idempotent: Whether the request can safely be sent twice; if not,
+                only throttled (429) responses are retried, since the server
+                rejected those without applying them
+
+        Returns:
+            The first final response (success, non-retryable error, or the
+            last attempt once retries are exhausted)
+        """
+        attempt = 0
+        while True:
+            with self._slot_free:
+                while self.in_flight >= self.limit:
+                    self._slot_free.wait()
+                self.in_flight += 1
+            delay = self._pacing_delay()
+            if delay:
+                self.sleep(delay)
+            response, error = None, None
+            if self.gate:
+                self.gate.acquire()
+            started = time.perf_counter()
+            try:
+                response = request()
+            except RETRYABLE_EXCEPTIONS as e:
+                error = e
+            finally:
+                elapsed = time.perf_counter() - started
+                if self.gate:
+                    self.gate.release()
+                with self._slot_free:
+                    self.in_flight -= 1
+                    self._slot_free.notify_all()
+            with self._slot_free:
+                retry_delay = self._record(response, attempt, elapsed, idempotent)
+                # The limit may have grown
+                self._slot_free.notify_all()
+            if retry_delay is None:
+                if error is not None:
+                    raise error
+                return response
+            reason = f"status {response['status_code']}" if response is not None else f"{type(error).__name__}: {error}"
+            self._log(f"Retrying {description} in {retry_delay:.2f}s ({reason}, attempt {attempt + 1}/{self.max_retries})")
+            self.sleep(retry_delay)
+            attempt += 1
+
+    async def acall(self, request: Callable[[], Any], description: str = "request",
+                    idempotent: bool = True) -> Dict[str, Any]:
+        """Async version of call; request returns an awaitable"""
+        if self._async_slot_free is None:
+            self._async_slot_free = asyncio.Condition()
+        slot_free = self._async_slot_free
+        attempt = 0
+        while True:
+            async with slot_free:
+                await slot_free.wait_for(lambda: self.in_flight < self.limit)
+                self.in_flight += 1
+            delay = self._pacing_delay()
+            if delay:
+                await asyncio.sleep(delay)
+            response, error = None, None
+            if self.gate:
+                # Wait for the shared gate without blocking the event loop
+                await asyncio.get_running_loop().run_in_executor(None, self.gate.acquire)
+            started = time.perf_counter()
+            try:
+                response = await request()
+            except RETRYABLE_EXCEPTIONS as e:
+                error = e
+            finally:
+                elapsed = time.perf_counter() - started
+                if self.gate:
+                    self.gate.release()
+                async with slot_free:
+                    self.in_flight -= 1
+                    slot_free.notify_all()
+            with self._lock:
+                retry_delay = self._record(response, attempt, elapsed, idempotent)
+            if retry_delay is None:
+                if error is not None:
+                    raise error
+                return response
+            reason = f"status {response['status_code']}" if response is not None else f"{type(error).__name__}: {error}"
+            self._log(f"Retrying {description} in {retry_delay:.2f}s ({reason}, attempt {attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(retry_delay)
+            attempt += 1
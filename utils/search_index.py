@@ -0,0 +1,275 @@
+"""
+SQLite search index over all backups of the CrowdStrike Correlation Rules Backup Tool
+
+Each backup summary is loaded once into <base_dir>/.search_index.db:
+
+    snapshots       one row per backup summary (date, summary file, format)
+    rule_versions   one row per distinct rule content (keyed by its SHA-256),
+                    holding the fields the summary already carries
+    snapshot_rules  which version of which rule each snapshot contained
+    rule_versions_fts
+                    FTS5 index (trigram tokenizer, so any substring of three
+                    or more characters matches) over filter, name and description
+
+Because rule content is stored once per version rather than once per day,
+a year of daily snapshots of a mostly unchanged tenant stays small and
+queries stay in the millisecond range. Indexing is incremental: summaries
+already recorded are skipped, and snapshots whose summary has been deleted
+(e.g. by cleanup) are pruned along with rule versions no snapshot holds.
+"""
+import glob
+import os
+import re
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+from .snapshot_diff import Snapshot
+from .state_index import content_hash
+
+SEARCH_INDEX_FILENAME = ".search_index.db"
+SEARCH_FIELDS = {"filter": "search_filter", "name": "rule_name", "description": "description"}
+
+_DATE_DIR = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    snapshot_date TEXT NOT NULL,
+    summary_file TEXT NOT NULL UNIQUE,
+    output_format TEXT,
+    rule_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS rule_versions (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    rule_id TEXT NOT NULL,
+    rule_name TEXT,
+    description TEXT,
+    status TEXT,
+    search_filter TEXT,
+    search_outcome TEXT,
+    created_on TEXT,
+    last_updated_on TEXT
+);
+CREATE INDEX IF NOT EXISTS rule_versions_rule_id ON rule_versions (rule_id);
+CREATE TABLE IF NOT EXISTS snapshot_rules (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+    version_id INTEGER NOT NULL REFERENCES rule_versions (id),
+    location TEXT,
+    PRIMARY KEY (snapshot_id, version_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS snapshot_rules_version ON snapshot_rules (version_id);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS rule_versions_fts USING fts5 (
+    search_filter, rule_name, description, content='rule_versions', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS rule_versions_fts_insert AFTER INSERT ON rule_versions BEGIN
+    INSERT INTO rule_versions_fts (rowid, search_filter, rule_name, description)
+    VALUES (new.id, new.search_filter, new.rule_name, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS rule_versions_fts_delete AFTER DELETE ON rule_versions BEGIN
+    INSERT INTO rule_versions_fts (rule_versions_fts, rowid, search_filter, rule_name, description)
+    VALUES ('delete', old.id, old.search_filter, old.rule_name, old.description);
+END;
+"""
+
+def connect(base_dir: str) -> sqlite3.Connection:
+    """
+    Open (and create if needed) the search index of a backup directory
+
+    Full-text search needs SQLite's FTS5 with the trigram tokenizer
+    (SQLite 3.34+); without it the index still works and searches fall
+    back to LIKE.
+    """
+    db = sqlite3.connect(os.path.join(base_dir, SEARCH_INDEX_FILENAME))
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(_SCHEMA)
+    try:
+        db.executescript(_FTS_SCHEMA)
+    except sqlite3.OperationalError:
+        pass
+    return db
+
+def has_fts(db: sqlite3.Connection) -> bool:
+    """Whether the full-text table is available"""
+    return db.execute("SELECT 1 FROM sqlite_master WHERE name = 'rule_versions_fts'").fetchone() is not None
+
+def _snapshot_date(summary_path: str, backup_date: str) -> str:
+    folder = os.path.basename(os.path.dirname(summary_path))
+    return folder if _DATE_DIR.match(folder) else str(backup_date or "")[:10]
+
+def _location(entry: Dict[str, Any]) -> Optional[str]:
+    if entry.get("filename"):
+        return entry["filename"]
+    if entry.get("object"):
+        return f"object:{entry['object']}"
+    return f"archive:{entry['archive']}" if entry.get("archive") else None
+
+def index_summary(db: sqlite3.Connection, base_dir: str, summary_path: str,
+                  summary: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Add one backup summary to the index
+
+    Args:
+        db: Connection from connect()
+        base_dir: Base backup directory
+        summary_path: Path of the _backup_summary_*.json file
+        summary: The already loaded summary (default: read the entries
+            from the run's rule manifest, or from summary_path without one)
+
+    Returns:
+        True if the summary was added, False if it was already indexed
+    """
+    key = os.path.relpath(summary_path, base_dir)
+    if db.execute("SELECT 1 FROM snapshots WHERE summary_file = ?", (key,)).fetchone():
+        return False
+    if summary is None:
+        with Snapshot(os.path.dirname(summary_path), summary_path) as snapshot:
+            entries = list(snapshot.entries())
+            snapshot_date, output_format = snapshot.snapshot_date, snapshot.output_format
+    else:
+        entries = summary.get("saved_rules", [])
+        snapshot_date, output_format = summary.get("backup_date", ""), summary.get("output_format", "files")
+
+    with db:
+        snapshot_id = db.execute(
+            "INSERT INTO snapshots (snapshot_date, summary_file, output_format, rule_count) VALUES (?, ?, ?, ?)",
+            (_snapshot_date(summary_path, snapshot_date), key, output_format, len(entries))
+        ).lastrowid
+        versions = []
+        for entry in entries:
+            fields = (entry.get("rule_id"), entry.get("rule_name"), entry.get("description"), entry.get("status"),
+                      entry.get("search_filter"), entry.get("search_outcome"), entry.get("created_on"),
+                      entry.get("last_updated_on"))
+            # Summaries written before content hashes fall back to a hash of their fields
+            versions.append((entry.get("sha256") or content_hash(list(fields)),) + fields)
+        db.executemany(
+            "INSERT OR IGNORE INTO rule_versions (sha256, rule_id, rule_name, description, status, search_filter,"
+            " search_outcome, created_on, last_updated_on) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            versions
+        )
+        db.executemany(
+            "INSERT OR IGNORE INTO snapshot_rules (snapshot_id, version_id, location)"
+            " SELECT ?, id, ? FROM rule_versions WHERE sha256 = ?",
+            [(snapshot_id, _location(entry), version[0]) for entry, version in zip(entries, versions)]
+        )
+    return True
+
+def index_snapshot(base_dir: str, summary_path: str, summary: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Add a just written backup summary to the search index
+
+    Returns:
+        True if the index was updated, False if it could not be written
+    """
+    try:
+        db = connect(base_dir)
+        try:
+            index_summary(db, base_dir, summary_path, summary)
+        finally:
+            db.close()
+    except (sqlite3.Error, OSError):
+        return False
+    return True
+
+def prune_index(db: sqlite3.Connection, base_dir: str) -> int:
+    """
+    Remove snapshots whose backup summary no longer exists
+
+    Rule versions left without any snapshot are removed as well.
+
+    Returns:
+        Number of snapshots removed
+    """
+    gone = [(snapshot_id,) for snapshot_id, summary_file in db.execute("SELECT id, summary_file FROM snapshots")
+            if not os.path.exists(os.path.join(base_dir, summary_file))]
+    if not gone:
+        return 0
+    with db:
+        db.executemany("DELETE FROM snapshot_rules WHERE snapshot_id = ?", gone)
+        db.executemany("DELETE FROM snapshots WHERE id = ?", gone)
+        db.execute("DELETE FROM rule_versions WHERE id NOT IN (SELECT version_id FROM snapshot_rules)")
+    return len(gone)
+
+def update_index(base_dir: str, db: Optional[sqlite3.Connection] = None) -> int:
+    """
+    Bring the index in line with the backup summaries under base_dir:
+    prune deleted snapshots and index every summary not indexed yet
+
+    Returns:
+        Number of summaries added
+    """
+    own = db is None
+    db = db or connect(base_dir)
+    try:
+        prune_index(db, base_dir)
+        indexed = {row[0] for row in db.execute("SELECT summary_file FROM snapshots")}
+        added = 0
+        for summary_path in sorted(glob.glob(os.path.join(glob.escape(base_dir), "*", "_backup_summary_*.json"))):
+            if os.path.relpath(summary_path, base_dir) in indexed:
+                continue
+            try:
+                added += index_summary(db, base_dir, summary_path)
+            except (OSError, ValueError, KeyError):
+                continue
+        return added
+    finally:
+        if own:
+            db.close()
+
+def search(db: sqlite3.Connection, text: Optional[str] = None, field: str = "filter",
+           rule_id: Optional[str] = None, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    Find rule versions across all indexed backups
+
+    Args:
+        db: Connection from connect()
+        text: Substring to look for (case-insensitive)
+        field: "filter", "name", "description" or "any"
+        rule_id: Only this rule
+        status: Only versions with this status
+        limit: Maximum number of results
+
+    Returns:
+        One dictionary per matching rule version with the date range
+        (first_seen, last_seen) and number of snapshots that contained it,
+        oldest first
+    """
+    if field != "any" and field not in SEARCH_FIELDS:
+        raise ValueError(f"Unknown search field: {field}")
+    where, params = [], []
+    source = "rule_versions v"
+    if text:
+        if has_fts(db) and len(text) >= 3:
+            phrase = '"' + text.replace('"', '""') + '"'
+            source = "rule_versions_fts f JOIN rule_versions v ON v.id = f.rowid"
+            where.append("rule_versions_fts MATCH ?")
+            params.append(phrase if field == "any" else f"{SEARCH_FIELDS[field]} : {phrase}")
+        else:
+            columns = list(SEARCH_FIELDS.values()) if field == "any" else [SEARCH_FIELDS[field]]
+            pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where.append("(" + " OR ".join(f"v.{column} LIKE ? ESCAPE '\\'" for column in columns) + ")")
+            params.extend([pattern] * len(columns))
+    if rule_id:
+        where.append("v.rule_id = ?")
+        params.append(rule_id)
+    if status:
+        where.append("v.status = ?")
+        params.append(status)
+
+    query = f"""
+        SELECT v.rule_id, v.rule_name, v.status, v.search_filter, v.search_outcome, v.last_updated_on, v.sha256,
+               MIN(s.snapshot_date) AS first_seen, MAX(s.snapshot_date) AS last_seen,
+               COUNT(DISTINCT s.snapshot_date) AS snapshots
+        FROM {source}
+        JOIN snapshot_rules sr ON sr.version_id = v.id
+        JOIN snapshots s ON s.id = sr.snapshot_id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        GROUP BY v.id
+        ORDER BY first_seen, v.rule_id
+        LIMIT ?
+    """
+    return [dict(row) for row in db.execute(query, params + [limit])]
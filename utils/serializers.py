@@ -0,0 +1,121 @@
+"""
+Pluggable JSON serializers for backup output
+
+orjson or msgspec are used when installed and the standard library json
+module otherwise. Every serializer returns UTF-8 encoded bytes.
+"""
+import json
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:  # optional fast backend
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # optional fast backend
+    msgspec = None
+
+BACKENDS = ("orjson", "msgspec", "json")
+
+class Serializer:
+    """
+    A JSON encoder bound to one backend and one output mode
+    
+    Args:
+        name: Backend name
+        indent: Indentation level, or None for compact output
+        encode: Function turning data into bytes
+    """
+
+    def __init__(self, name: str, indent: Optional[int], encode: Callable[[Any], bytes]):
+        self.name = name
+        self.indent = indent
+        self._encode = encode
+        self._fallback = _stdlib_encoder(indent) if name != "json" else None
+
+    def dumps(self, data: Any) -> bytes:
+        """Serialize data to UTF-8 JSON bytes"""
+        try:
+            return self._encode(data)
+        except TypeError:
+            # Fast backends reject a few inputs stdlib accepts (e.g. integers
+            # wider than 64 bits); retry with stdlib before giving up
+            if self._fallback is None:
+                raise
+            return self._fallback(data)
+
+    def __repr__(self):
+        mode = f"indent={self.indent}" if self.indent else "compact"
+        return f"Serializer({self.name}, {mode})"
+
+def available_backends() -> list:
+    """Return the installed backends in order of preference"""
+    installed = {"orjson": orjson is not None, "msgspec": msgspec is not None, "json": True}
+    return [name for name in BACKENDS if installed[name]]
+
+def _stdlib_encoder(indent: Optional[int]) -> Callable[[Any], bytes]:
+    if indent:
+        return lambda data: json.dumps(data, indent=indent).encode("utf-8")
+    return lambda data: json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+def _orjson_encoder(indent: Optional[int]) -> Optional[Callable[[Any], bytes]]:
+    if not indent:
+        return orjson.dumps
+    if indent == 2:
+        return lambda data: orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    # orjson only supports two-space indentation
+    return None
+
+def _msgspec_encoder(indent: Optional[int]) -> Callable[[Any], bytes]:
+    encoder = msgspec.json.Encoder()
+    if not indent:
+        return encoder.encode
+    return lambda data: msgspec.json.format(encoder.encode(data), indent=indent)
+
+def get_serializer(backend: Optional[str] = None, indent: Optional[int] = None) -> Serializer:
+    """
+    Build a serializer
+    
+    Args:
+        backend: "orjson", "msgspec", "json" or "auto" (default: from Config.JSON_BACKEND)
+        indent: Indentation for pretty output; 0 or None for compact output
+        
+    Returns:
+        Serializer for the first usable backend
+        
+    Raises:
+        ValueError: If the backend is unknown
+        ImportError: If a specific backend was requested but is not installed
+    """
+    if backend is None:
+        from config import Config
+        backend = Config.JSON_BACKEND
+    if backend not in BACKENDS and backend != "auto":
+        raise ValueError(f"Unknown JSON backend: {backend} (choose from auto, {', '.join(BACKENDS)})")
+    if backend != "auto" and backend not in available_backends():
+        raise ImportError(f"JSON backend '{backend}' is not installed (pip install {backend})")
+
+    indent = indent or None
+    candidates = available_backends() if backend == "auto" else [backend]
+    for name in candidates:
+        if name == "orjson":
+            encode = _orjson_encoder(indent)
+        elif name == "msgspec":
+            encode = _msgspec_encoder(indent)
+        else:
+            encode = _stdlib_encoder(indent)
+        if encode is not None:
+            return Serializer(name, indent, encode)
+    return Serializer("json", indent, _stdlib_encoder(indent))
+
+def get_default_serializer(compact: bool = False) -> Serializer:
+    """
+    Serializer configured from Config.JSON_BACKEND and Config.JSON_INDENT
+    
+    Args:
+        compact: Ignore JSON_INDENT and always produce compact output
+    """
+    from config import Config
+    return get_serializer(Config.JSON_BACKEND, None if compact else Config.JSON_INDENT)
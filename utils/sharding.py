@@ -0,0 +1,48 @@
+"""
+FQL filter sharding for the CrowdStrike Correlation Rules Backup Tool
+
+A large listing is split into disjoint partitions of the user's filter by
+ranges of an immutable field (created_on), so each shard can be paginated
+on its own and in parallel. The ranges are half-open and the first and
+last are unbounded, so together the shards cover exactly what the
+unsharded filter matches:
+
+    <filter>+created_on:<'b1'
+    <filter>+created_on:>='b1'+created_on:<'b2'
+    ...
+    <filter>+created_on:>='bN-1'
+
+Because created_on never changes, a rule cannot move between shards while
+the listing runs, and each shard's pages are only a fraction as deep as
+the unsharded walk.
+"""
+from typing import List, Sequence
+
+SHARD_FIELD = "created_on"
+
+def combine_filters(filter: str, *clauses: str) -> str:
+    """AND extra FQL clauses onto a filter ("*" or empty matches everything)"""
+    parts = [] if not filter or filter.strip() == "*" else [filter]
+    parts.extend(clause for clause in clauses if clause)
+    return "+".join(parts) if parts else "*"
+
+def shard_filters(filter: str, boundaries: Sequence[str], field: str = SHARD_FIELD) -> List[str]:
+    """
+    Partition a filter at the given field values
+
+    Args:
+        filter: The user's FQL filter
+        boundaries: Values of field to split at; duplicates and empty values are ignored
+        field: Field to split on
+
+    Returns:
+        len(unique boundaries) + 1 disjoint filters covering the same rules as filter
+    """
+    points = sorted({value for value in boundaries if value})
+    if not points:
+        return [filter]
+    filters = [combine_filters(filter, f"{field}:<'{points[0]}'")]
+    for lower, upper in zip(points, points[1:]):
+        filters.append(combine_filters(filter, f"{field}:>='{lower}'", f"{field}:<'{upper}'"))
+    filters.append(combine_filters(filter, f"{field}:>='{points[-1]}'"))
+    return filters
@@ -0,0 +1,273 @@
+"""
+Snapshot diff for the CrowdStrike Correlation Rules Backup Tool
+
+Compares two backup date folders by rule ID using their backup summaries.
+Every summary entry carries the SHA-256 of the rule's content, so unchanged
+rules are recognised from the summaries alone; rule files are only opened
+for rules whose hashes differ, to produce a field-level diff.
+
+Snapshot is also how restore, cleanup and the search index read a
+snapshot's entries. When the summary has a rule manifest next to it, the
+entries are looked up in the manifest instead of parsing the summary.
+"""
+import glob
+import json
+import os
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional
+
+from .archive import extract_rule, load_archive_index
+from .manifest import ManifestReader, manifest_filename
+from .object_store import get_object_store
+from .state_index import content_hash
+
+SUMMARY_PREFIX = "_backup_summary_"
+SUMMARY_PATTERN = f"{SUMMARY_PREFIX}*.json"
+
+def find_summary(snapshot_dir: str) -> Optional[str]:
+    """Return the newest backup summary in a snapshot directory, if any"""
+    summaries = sorted(glob.glob(os.path.join(glob.escape(snapshot_dir), SUMMARY_PATTERN)))
+    return summaries[-1] if summaries else None
+
+def find_rule_manifest(summary_path: str) -> Optional[str]:
+    """Return the rule manifest written by the same run as a backup summary, if there is one"""
+    name = os.path.basename(summary_path)
+    if not name.startswith(SUMMARY_PREFIX) or not name.endswith(".json"):
+        return None
+    current_time = name[len(SUMMARY_PREFIX):-len(".json")]
+    path = os.path.join(os.path.dirname(summary_path), manifest_filename(current_time))
+    return path if os.path.isfile(path) else None
+
+class ManifestRules(Mapping):
+    """Read-only rule ID -> entry mapping over a rule manifest; entries are parsed on lookup"""
+
+    def __init__(self, manifest: ManifestReader):
+        self._manifest = manifest
+
+    def __getitem__(self, rule_id: str) -> Dict[str, Any]:
+        entry = self._manifest.get(rule_id)
+        if entry is None:
+            raise KeyError(rule_id)
+        return entry
+
+    def __contains__(self, rule_id) -> bool:
+        return isinstance(rule_id, str) and rule_id in self._manifest
+
+    def __iter__(self) -> Iterator[str]:
+        return self._manifest.rule_ids()
+
+    def __len__(self) -> int:
+        return len(self._manifest)
+
+class Snapshot:
+    """
+    One backup date folder, indexed by rule ID from its rule manifest or,
+    for backups without one, its backup summary
+
+    Close the snapshot (or use it as a context manager) to release the
+    manifest.
+
+    Args:
+        snapshot_dir: Date based snapshot directory
+        summary_path: Backup summary to read (default: the newest in snapshot_dir)
+
+    Raises:
+        ValueError: If the directory has no readable backup summary
+    """
+
+    def __init__(self, snapshot_dir: str, summary_path: Optional[str] = None):
+        self.path = snapshot_dir
+        self._archive_indexes: Dict[str, Dict[str, Any]] = {}
+        summary_path = summary_path or find_summary(snapshot_dir)
+        if summary_path is None:
+            raise ValueError(f"No backup summary found in {snapshot_dir}")
+        self.summary_path = summary_path
+        self.manifest_path = find_rule_manifest(summary_path)
+        self._manifest = None
+        if self.manifest_path:
+            try:
+                self._manifest = ManifestReader(self.manifest_path)
+            except (OSError, ValueError):
+                self.manifest_path = None
+        if self._manifest is not None:
+            self.output_format = self._manifest.header.get("output_format", "files")
+            self.snapshot_date = self._manifest.header.get("snapshot_date", "")
+            self.rules: Mapping = ManifestRules(self._manifest)
+            return
+        try:
+            with open(summary_path, "r", encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Cannot read {summary_path}: {str(e)}")
+        self.output_format = summary.get("output_format", "files")
+        self.snapshot_date = str(summary.get("backup_date", ""))[:10]
+        self.rules = {entry["rule_id"]: entry for entry in summary.get("saved_rules", [])}
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        """Every rule's entry in the order the backup saved them"""
+        if self._manifest is not None:
+            return self._manifest.entries()
+        return iter(self.rules.values())
+
+    def rule_hash(self, rule_id: str) -> str:
+        """Content hash of a rule, read from the rule itself for summaries that predate hashes"""
+        entry = self.rules[rule_id]
+        if not entry.get("sha256"):
+            entry["sha256"] = content_hash(self.load_rule(rule_id))
+        return entry["sha256"]
+
+    def load_rule(self, rule_id: str) -> Dict[str, Any]:
+        """Read a rule's full content from wherever its output format stored it"""
+        return self.load_entry(self.rules[rule_id])
+
+    def load_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Read the rule an entry points to; archive indexes are loaded once per snapshot"""
+        return load_entry_rule(self.path, entry, self._archive_indexes)
+
+    def close(self):
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def load_entry_rule(snapshot_dir: str, entry: Dict[str, Any],
+                    archive_indexes: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Read the rule a backup summary or manifest entry points to, in any output format
+
+    Args:
+        snapshot_dir: Date based snapshot directory
+        entry: Backup summary or manifest entry
+        archive_indexes: Cache of archive indexes by archive name, filled in
+            as archives are read, for callers that read many rules
+    """
+    if entry.get("object"):
+        return get_object_store(os.path.dirname(os.path.abspath(snapshot_dir))).get(entry["object"])
+    if entry.get("archive"):
+        archive_path = os.path.join(snapshot_dir, entry["archive"])
+        index = None
+        if archive_indexes is not None:
+            index = archive_indexes.get(entry["archive"])
+            if index is None:
+                index = archive_indexes[entry["archive"]] = load_archive_index(archive_path)
+        rule = extract_rule(archive_path, entry["rule_id"], index)
+        if rule is None:
+            raise ValueError(f"Rule {entry['rule_id']} missing from {entry['archive']}")
+        return rule
+    with open(os.path.join(snapshot_dir, entry["filename"]), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def json_diff(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """
+    Field-level differences between two JSON values
+
+    Objects are compared key by key and lists element by element; any other
+    difference is reported at the deepest path where it occurs.
+
+    Returns:
+        List of {"path", "change", "old", "new"} where change is "added",
+        "removed" or "changed" and path looks like search.filter or mitre_attack[0].tactic_id
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in sorted(set(old) | set(new), key=str):
+            child = f"{path}.{key}" if path else str(key)
+            if key not in new:
+                changes.append({"path": child, "change": "removed", "old": old[key], "new": None})
+            elif key not in old:
+                changes.append({"path": child, "change": "added", "old": None, "new": new[key]})
+            elif old[key] != new[key]:
+                changes.extend(json_diff(old[key], new[key], child))
+        return changes
+    if isinstance(old, list) and isinstance(new, list):
+        changes = []
+        for index in range(max(len(old), len(new))):
+            child = f"{path}[{index}]"
+            if index >= len(new):
+                changes.append({"path": child, "change": "removed", "old": old[index], "new": None})
+            elif index >= len(old):
+                changes.append({"path": child, "change": "added", "old": None, "new": new[index]})
+            elif old[index] != new[index]:
+                changes.extend(json_diff(old[index], new[index], child))
+        return changes
+    return [{"path": path, "change": "changed", "old": old, "new": new}]
+
+def diff_snapshots(old_dir: str, new_dir: str) -> Dict[str, Any]:
+    """
+    Compare two snapshots by rule ID
+
+    Args:
+        old_dir: Earlier snapshot directory
+        new_dir: Later snapshot directory
+
+    Returns:
+        Dictionary with "added" and "removed" rules, "modified" and "renamed"
+        rules (each with their field-level "changes"), and the number of
+        "unchanged" rules
+
+    Raises:
+        ValueError: If either directory has no readable backup summary
+    """
+    with Snapshot(old_dir) as old, Snapshot(new_dir) as new:
+        result = {
+            "old": {"path": old_dir, "summary": os.path.basename(old.summary_path), "rules": len(old.rules)},
+            "new": {"path": new_dir, "summary": os.path.basename(new.summary_path), "rules": len(new.rules)},
+            "added": [],
+            "removed": [],
+            "modified": [],
+            "renamed": [],
+            "unchanged": 0,
+        }
+
+        for rule_id in sorted(set(new.rules) - set(old.rules)):
+            result["added"].append({"rule_id": rule_id, "rule_name": new.rules[rule_id].get("rule_name")})
+        for rule_id in sorted(set(old.rules) - set(new.rules)):
+            result["removed"].append({"rule_id": rule_id, "rule_name": old.rules[rule_id].get("rule_name")})
+
+        for rule_id in sorted(set(old.rules) & set(new.rules)):
+            if old.rule_hash(rule_id) == new.rule_hash(rule_id):
+                result["unchanged"] += 1
+                continue
+            old_name, new_name = old.rules[rule_id].get("rule_name"), new.rules[rule_id].get("rule_name")
+            entry = {"rule_id": rule_id, "rule_name": new_name,
+                     "changes": json_diff(old.load_rule(rule_id), new.load_rule(rule_id))}
+            if old_name != new_name:
+                entry["old_name"] = old_name
+                result["renamed"].append(entry)
+            else:
+                result["modified"].append(entry)
+        return result
+
+def _short(value: Any, width: int = 80) -> str:
+    text = json.dumps(value, ensure_ascii=False) if not isinstance(value, str) else value
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+def format_diff_text(result: Dict[str, Any]) -> str:
+    """Render a diff_snapshots result as a plain text report"""
+    lines = [
+        f"--- {result['old']['path']} ({result['old']['rules']} rules)",
+        f"+++ {result['new']['path']} ({result['new']['rules']} rules)",
+        f"{len(result['added'])} added, {len(result['removed'])} removed, {len(result['modified'])} modified, "
+        f"{len(result['renamed'])} renamed, {result['unchanged']} unchanged",
+    ]
+    for rule in result["added"]:
+        lines.append(f"A {rule['rule_id']}  {rule['rule_name']}")
+    for rule in result["removed"]:
+        lines.append(f"D {rule['rule_id']}  {rule['rule_name']}")
+    for kind, rules in (("R", result["renamed"]), ("M", result["modified"])):
+        for rule in rules:
+            title = f"{rule['old_name']} -> {rule['rule_name']}" if kind == "R" else rule["rule_name"]
+            lines.append(f"{kind} {rule['rule_id']}  {title}")
+            for change in rule["changes"]:
+                if change["change"] == "added":
+                    lines.append(f"    + {change['path']}: {_short(change['new'])}")
+                elif change["change"] == "removed":
+                    lines.append(f"    - {change['path']}: {_short(change['old'])}")
+                else:
+                    lines.append(f"    ~ {change['path']}: {_short(change['old'])} -> {_short(change['new'])}")
+    return "\n".join(lines)
@@ -0,0 +1,137 @@
+"""
+Persistent rule state index for incremental backups
+"""
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, Optional
+
+INDEX_FILENAME = ".backup_index.json"
+INDEX_VERSION = 1
+
+def canonical_json(data: Any) -> bytes:
+    """Encode data as canonical (sorted keys, compact) UTF-8 JSON"""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def content_hash(rule: Dict[str, Any]) -> str:
+    """
+    Compute a stable SHA-256 hash of a rule's content
+    
+    Args:
+        rule: Rule data dictionary
+        
+    Returns:
+        Hex digest of the canonical JSON encoding
+    """
+    return hashlib.sha256(canonical_json(rule)).hexdigest()
+
+def load_state_index(base_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the state index written by the previous backup
+    
+    Args:
+        base_dir: Base backup directory
+        
+    Returns:
+        The index dictionary, or None if it is missing or unreadable
+    """
+    path = os.path.join(base_dir, INDEX_FILENAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+        return None
+    return index
+
+def save_state_index(base_dir: str, index: Dict[str, Any]) -> bool:
+    """
+    Atomically write the state index
+    
+    Args:
+        base_dir: Base backup directory
+        index: Index dictionary to persist
+        
+    Returns:
+        True if the index was written
+    """
+    path = os.path.join(base_dir, INDEX_FILENAME)
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+        return True
+    except OSError:
+        return False
+
+def build_state_index(snapshot_date: str, filter: str, saved_rules: list) -> Dict[str, Any]:
+    """
+    Build a state index from the rules saved in a snapshot
+    
+    Args:
+        snapshot_date: Date folder name of the snapshot (YYYY-MM-DD)
+        filter: FQL filter the snapshot was taken with
+        saved_rules: Backup summary entries (must include sha256)
+        
+    Returns:
+        Index dictionary mapping rule_id to its summary entry and path
+    """
+    rules = {}
+    watermark = None
+    for entry in saved_rules:
+        record = {key: value for key, value in entry.items() if key != "linked_from"}
+        record["path"] = os.path.join(snapshot_date, entry["filename"])
+        rules[entry["rule_id"]] = record
+        last_updated_on = entry.get("last_updated_on")
+        if last_updated_on and last_updated_on != "Not found":
+            if watermark is None or last_updated_on > watermark:
+                watermark = last_updated_on
+    return {
+        "version": INDEX_VERSION,
+        "snapshot_date": snapshot_date,
+        "filter": filter,
+        "high_watermark": watermark,
+        "rules": rules
+    }
+
+def build_incremental_filter(filter: str, watermark: str) -> str:
+    """
+    Combine the user's FQL filter with a last_updated_on lower bound
+    
+    The bound is inclusive so rules updated in the same second as the
+    previous snapshot's newest rule are not missed; their unchanged hash
+    turns them into hard links anyway.
+    """
+    clause = f"last_updated_on:>='{watermark}'"
+    if not filter or filter.strip() == "*":
+        return clause
+    return f"{filter}+{clause}"
+
+def link_or_copy(source: str, destination: str) -> bool:
+    """
+    Hard-link a file from a previous snapshot, copying if linking fails
+    
+    Args:
+        source: Existing file path
+        destination: New file path
+        
+    Returns:
+        True if the destination now holds the source content
+    """
+    try:
+        if os.path.exists(destination):
+            if os.path.samefile(source, destination):
+                return True
+            os.remove(destination)
+        os.link(source, destination)
+        return True
+    except OSError:
+        pass
+    try:
+        shutil.copy2(source, destination)
+        return True
+    except OSError:
+        return False
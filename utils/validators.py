@@ -3,42 +3,53 @@ Validation utilities for the CrowdStrike Correlation Rules Backup Tool
 """
 import os
 from typing import Dict, Any, Optional
-from falconpy import CorrelationRules
 
 class ValidationError(Exception):
     """Custom exception for validation errors"""
     pass
 
-def validate_api_credentials(client_id: str, client_secret: str) -> bool:
+def validate_api_credentials(client_id: str, client_secret: str, cloud_region: Optional[str] = None,
+                             backup_filter: Optional[str] = None, use_async: bool = False,
+                             max_connections: Optional[int] = None):
     """
-    Validate API credentials by attempting to create a client
+    Validate API credentials by fetching the first page of rules
+    
+    The client comes from the shared session factory, so the backup reuses
+    its token and starts from the page fetched here instead of requesting
+    offset 0 again.
     
     Args:
         client_id: CrowdStrike API client ID
         client_secret: CrowdStrike API client secret
+        cloud_region: CrowdStrike cloud region (default: from Config.FALCON_CLOUD_REGION)
+        backup_filter: Filter the backup will use (default: from Config.BACKUP_FILTER)
+        use_async: Validate with the asyncio client the backup will use
+        max_connections: Connection pool size for the asyncio client
         
     Returns:
-        True if credentials are valid
+        The validated ClientSession
         
     Raises:
         ValidationError: If credentials are invalid
     """
+    from config import Config
+    from .client_factory import get_session
+
     try:
-        # Try to create a client to validate credentials
-        client = CorrelationRules(
-            client_id=client_id,
-            client_secret=client_secret,
-            cloud_region="us-2"  # Default region for validation
-        )
+        session = get_session(client_id, client_secret, cloud_region,
+                              use_async=use_async, max_connections=max_connections)
         
-        # Test the connection with a minimal API call
-        response = client.get_rules_combined(limit=1)
+        # Test the connection with the backup's own first request
+        filter = backup_filter if backup_filter is not None else Config.BACKUP_FILTER
+        response = session.probe(Config.BACKUP_LIMIT, filter)
         
         if response.get("status_code") == 200:
-            return True
+            return session
         else:
             raise ValidationError(f"API authentication failed: {response.get('status_code')}")
             
+    except ValidationError:
+        raise
     except Exception as e:
         raise ValidationError(f"Invalid credentials: {str(e)}")
 
@@ -0,0 +1,346 @@
+"""
+Backup output writers for the CrowdStrike Correlation Rules Backup Tool
+
+A writer receives every API page and every rule of a snapshot and decides
+how they are laid out on disk. The backup engine only talks to this
+interface, so new output formats can be added without touching pagination.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from .archive import JsonlArchiveWriter, TarArchiveWriter
+from .rule_records import RuleRecords
+from .object_store import MANIFEST_PREFIX, MANIFEST_VERSION, get_object_store
+from .serializers import Serializer, get_default_serializer
+from .state_index import canonical_json
+from config import Config
+
+FSYNC_POLICIES = ("none", "batch", "always")
+
+def write_json_atomic(path: str, data: Any, serializer: Optional[Serializer] = None, fsync: bool = False) -> int:
+    """
+    Write JSON to a temporary file and rename it into place
+    
+    The directory must already exist. Readers never see a partially written
+    file, and because the rename replaces the directory entry rather than
+    the inode, files hard-linked into older snapshots are left untouched.
+    
+    Args:
+        path: Destination path
+        data: JSON serializable data
+        serializer: Serializer to encode with (default: from Config.JSON_BACKEND / JSON_INDENT)
+        fsync: Flush the file to stable storage before the rename
+        
+    Returns:
+        Number of bytes written
+    """
+    payload = (serializer or get_default_serializer()).dumps(data)
+    write_bytes_atomic(path, payload, fsync)
+    return len(payload)
+
+def write_bytes_atomic(path: str, payload: bytes, fsync: bool = False):
+    """Write already encoded content to a temporary file and rename it into place"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(payload)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def _stream_json_object(f, data: Dict[str, Any], serializer: Serializer):
+    """Write a dict as JSON, encoding RuleRecords values one entry at a time"""
+    indent = serializer.indent
+    if not data:
+        f.write(b"{}")
+        return
+    if indent:
+        pad, inner = b"\n" + b" " * indent, b"\n" + b" " * (indent * 2)
+        key_sep, item_sep = b": ", b","
+    else:
+        pad = inner = b""
+        key_sep, item_sep = b":", b","
+    f.write(b"{")
+    for position, (key, value) in enumerate(data.items()):
+        if position:
+            f.write(item_sep)
+        f.write(pad + serializer.dumps(key) + key_sep)
+        if isinstance(value, RuleRecords) and value:
+            f.write(b"[")
+            for index, entry in enumerate(value.iter_dicts()):
+                if index:
+                    f.write(item_sep)
+                f.write(inner + serializer.dumps(entry).replace(b"\n", inner))
+            f.write(pad + b"]")
+        else:
+            payload = serializer.dumps([] if isinstance(value, RuleRecords) else value)
+            f.write(payload.replace(b"\n", pad) if indent else payload)
+    f.write(b"\n}" if indent else b"}")
+
+def write_json_stream(path: str, data: Any, serializer: Optional[Serializer] = None, fsync: bool = False) -> int:
+    """
+    Write JSON like write_json_atomic without encoding it in one piece
+
+    Top-level values of a dict are encoded separately and RuleRecords
+    values one entry at a time, so a backup summary with 100k saved rules
+    never exists as a single string. The output is the same as encoding
+    the whole document at once.
+
+    Args:
+        path: Destination path
+        data: JSON serializable data; non-dict data is written by write_json_atomic
+        serializer: Serializer to encode with (default: from Config.JSON_BACKEND / JSON_INDENT)
+        fsync: Flush the file to stable storage before the rename
+
+    Returns:
+        Number of bytes written
+    """
+    serializer = serializer or get_default_serializer()
+    if not isinstance(data, dict):
+        return write_json_atomic(path, data, serializer, fsync)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        _stream_json_object(f, data, serializer)
+        size = f.tell()
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return size
+
+def save_json(path, data):
+    """Save data to JSON file with proper error handling"""
+    try:
+        # Ensure the directory exists
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        # Save the JSON file
+        write_json_stream(path, data)
+        
+        print(f"Successfully saved: {path}")
+        return True
+    except Exception as e:
+        print(f"Error saving {path}: {str(e)}")
+        return False
+
+class FileWriter:
+    """
+    Per-file layout: one JSON file per rule and per API page, pretty-printed
+    according to Config.JSON_INDENT
+    
+    The snapshot directory must already exist (the engine creates it once)
+    and every file is written atomically; sizes come from the write itself rather than from
+    stat calls afterwards.
+    
+    Args:
+        base_dir: Base backup directory
+        export_dir: Date based snapshot directory
+        logger: Logger for progress messages
+        fsync_policy: "none" (leave flushing to the OS), "batch" (flush to
+            stable storage every fsync_batch_size files and on close) or
+            "always" (fsync every file before it is renamed into place)
+            (default: from Config.FSYNC_POLICY)
+        fsync_batch_size: Files per batch for the "batch" policy
+    """
+    format_name = "files"
+
+    def __init__(self, base_dir: str, export_dir: str, logger, fsync_policy: Optional[str] = None,
+                 fsync_batch_size: Optional[int] = None):
+        self.base_dir = base_dir
+        self.export_dir = export_dir
+        self.logger = logger
+        self.fsync_policy = fsync_policy or Config.FSYNC_POLICY
+        if self.fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {self.fsync_policy} (choose from {', '.join(FSYNC_POLICIES)})")
+        self.fsync_batch_size = fsync_batch_size or Config.FSYNC_BATCH_SIZE
+        self.serializer = get_default_serializer()
+        self.files_written = 0
+        self.bytes_written = 0
+        self.page_files = []
+        self._unsynced = 0
+
+    def _write(self, path: str, data: Any) -> Tuple[int, str]:
+        """Write one file and return its size and the SHA-256 of its bytes"""
+        payload = self.serializer.dumps(data)
+        write_bytes_atomic(path, payload, fsync=self.fsync_policy == "always")
+        self.files_written += 1
+        self.bytes_written += len(payload)
+        if self.fsync_policy == "batch":
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_batch_size:
+                self._sync()
+        return len(payload), hashlib.sha256(payload).hexdigest()
+
+    def _sync(self):
+        """Flush every pending file with a single sync of the file system"""
+        if self._unsynced:
+            if hasattr(os, "sync"):
+                os.sync()
+            self._unsynced = 0
+
+    def write_page(self, offset: int, response: Dict[str, Any], current_time: str) -> bool:
+        """Save the complete API response (no date in filename since it's in folder)"""
+        response_filename = os.path.join(self.export_dir, f"api_response_offset_{offset}_{current_time}.json")
+        try:
+            file_size, file_hash = self._write(response_filename, response)
+        except (OSError, TypeError, ValueError) as e:
+            self.logger.error(f"Failed to save API response: {response_filename} ({str(e)})")
+            return False
+        self.page_files.append({"filename": os.path.basename(response_filename), "file_size": file_size,
+                                "sha256": file_hash})
+        self.logger.info(f"API response saved: {response_filename}")
+        self.logger.info(f"  File size: {file_size} bytes")
+        return True
+
+    def write_rule(self, rule: Dict[str, Any], filename: str, rule_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Save one rule as its own JSON file
+        
+        Returns:
+            Location fields for the summary entry, or None if the save failed
+        """
+        rule_filename = os.path.join(self.export_dir, filename)
+        try:
+            file_size, file_hash = self._write(rule_filename, rule)
+        except (OSError, TypeError, ValueError) as e:
+            self.logger.error(f"Error saving {rule_filename}: {str(e)}")
+            return None
+        self.logger.info(f"  File size: {file_size} bytes")
+        return {"filename": filename, "file_size": file_size, "file_sha256": file_hash}
+
+    def close(self, current_time: str) -> Dict[str, Any]:
+        """Finish the snapshot and return extra backup summary fields"""
+        if self.fsync_policy == "batch":
+            self._sync()
+        if self.fsync_policy != "none" and os.name == "posix":
+            # Make the renames themselves durable
+            directory_fd = os.open(self.export_dir, os.O_RDONLY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+        return {"bytes_written": self.bytes_written, "page_files": self.page_files}
+
+class ObjectStoreWriter:
+    """
+    Content-addressed layout: rules are stored once as blobs under
+    <base_dir>/.objects and the snapshot directory only receives a small
+    manifest mapping rule IDs to blobs
+    
+    API pages are recorded in the manifest as metadata plus rule IDs rather
+    than as full response dumps, so rule bytes are never stored twice.
+    
+    Args:
+        base_dir: Base backup directory
+        export_dir: Date based snapshot directory
+        logger: Logger for progress messages
+    """
+    format_name = "objects"
+
+    def __init__(self, base_dir: str, export_dir: str, logger):
+        self.base_dir = base_dir
+        self.export_dir = export_dir
+        self.logger = logger
+        self.store = get_object_store(base_dir)
+        self.rules: Dict[str, str] = {}
+        self.pages = []
+        self.files_written = 0
+        self.objects_reused = 0
+
+    def write_page(self, offset: int, response: Dict[str, Any], current_time: str) -> bool:
+        """Record page metadata and the IDs of the rules it contained"""
+        body = response.get("body", {})
+        self.pages.append({
+            "offset": offset,
+            "status_code": response.get("status_code"),
+            "meta": body.get("meta", {}),
+            "errors": body.get("errors", []),
+            "rule_ids": [rule.get("id") for rule in body.get("resources", []) or []],
+            "timestamp": current_time
+        })
+        return True
+
+    def write_rule(self, rule: Dict[str, Any], filename: str, rule_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Store a rule blob unless an identical one already exists
+        
+        Returns:
+            Location fields for the summary entry, or None if the write failed
+        """
+        try:
+            file_size = self.store.size(rule_hash)
+            if file_size is not None:
+                # Keep garbage collection away from a blob this snapshot now uses
+                self.store.touch(rule_hash)
+                self.objects_reused += 1
+            else:
+                data = canonical_json(rule)
+                self.store.put(data, rule_hash)
+                self.files_written += 1
+                file_size = len(data)
+        except OSError as e:
+            self.logger.error(f"Error storing object {rule_hash}: {str(e)}")
+            return None
+        self.rules[rule["id"]] = rule_hash
+        return {"filename": None, "object": rule_hash, "file_size": file_size}
+
+    def close(self, current_time: str) -> Dict[str, Any]:
+        """Write the snapshot manifest and return extra backup summary fields"""
+        manifest_filename = os.path.join(self.export_dir, f"{MANIFEST_PREFIX}{current_time}.json")
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "object_store": os.path.relpath(self.store.root, self.export_dir),
+            "rules": self.rules,
+            "pages": self.pages
+        }
+        payload = json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+        write_bytes_atomic(manifest_filename, payload)
+        self.files_written += 1
+        self.logger.info(f"Manifest saved: {manifest_filename}")
+        self.logger.info(f"Objects written: {self.files_written - 1}, reused: {self.objects_reused}")
+        return {
+            "manifest": os.path.basename(manifest_filename),
+            "manifest_sha256": hashlib.sha256(payload).hexdigest(),
+            "objects_written": self.files_written - 1,
+            "objects_reused": self.objects_reused
+        }
+
+WRITERS = {
+    FileWriter.format_name: FileWriter,
+    ObjectStoreWriter.format_name: ObjectStoreWriter,
+    JsonlArchiveWriter.format_name: JsonlArchiveWriter,
+    TarArchiveWriter.format_name: TarArchiveWriter
+}
+
+def get_writer(output_format: str, base_dir: str, export_dir: str, logger, compression: Optional[str] = None,
+               fsync_policy: Optional[str] = None):
+    """
+    Create the writer for an output format
+    
+    Args:
+        output_format: Key of WRITERS
+        base_dir: Base backup directory
+        export_dir: Date based snapshot directory
+        logger: Logger for progress messages
+        compression: Block compression of the jsonl format (default: from Config.ARCHIVE_COMPRESSION)
+        fsync_policy: fsync policy of the files format (default: from Config.FSYNC_POLICY)
+    
+    Formats without a compression or fsync setting ignore it.
+    
+    Raises:
+        ValueError: If the format, compression or fsync policy is unknown
+    """
+    try:
+        writer_class = WRITERS[output_format]
+    except KeyError:
+        raise ValueError(f"Unknown output format: {output_format} (choose from {', '.join(WRITERS)})")
+    options = {}
+    if writer_class is JsonlArchiveWriter and compression:
+        options["compression"] = compression
+    if writer_class is FileWriter and fsync_policy:
+        options["fsync_policy"] = fsync_policy
+    return writer_class(base_dir, export_dir, logger, **options)